@@ -3,18 +3,23 @@
 # pylint: disable=too-many-arguments
 from __future__ import annotations
 
+import hashlib
+import json
 import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
 from glob import glob
 from itertools import count
 
 import cdsapi
+import xarray as xr
 
 from atmospheric_explorer.api.loggers import get_logger
 from atmospheric_explorer.api.os_manager import (
     create_folder,
     get_local_folder,
     remove_folder,
+    temporary_path,
 )
 
 logger = get_logger("atmexp")
@@ -30,6 +35,8 @@ class CAMSDataInterface(ABC):
     _ids: count = count(0)
     file_format = None
     file_ext = None
+    request_filename: str = "request.json"
+    max_workers: int = 4
 
     def __init__(self: CAMSDataInterface, data_variables: str | set[str] | list[str]):
         """Initializes CAMSDataInterface instance.
@@ -47,7 +54,7 @@ class CAMSDataInterface(ABC):
     def data_variables(self: CAMSDataInterface) -> str | list[str]:
         """Time values are internally represented as a set, use this property to set/get its value."""
         return (
-            list(self._data_variables)
+            sorted(self._data_variables)
             if isinstance(self._data_variables, set)
             else self._data_variables
         )
@@ -64,17 +71,129 @@ class CAMSDataInterface(ABC):
         """Builds the CDS API call body."""
         return {"format": self.file_format, "variable": self.data_variables}
 
-    def _download(self: CAMSDataInterface, file_fullpath: str) -> None:
-        """Downloads the dataset and saves it to file specified in filename.
+    def _cache_body(self: CAMSDataInterface) -> dict:
+        """Returns the part of the CDS API call body that identifies the data, by default the whole body."""
+        return self._build_call_body()
+
+    @property
+    def cache_key(self: CAMSDataInterface) -> str:
+        """Hash of the dataset name and of the CDS API call body.
+
+        Two instances requesting the same data share the same key, hence the same files on disk.
+        The key is computed from the current attributes, so it changes when the request is changed.
+        """
+        request = json.dumps(
+            {"dataset_name": self.dataset_name, "body": self._cache_body()},
+            sort_keys=True,
+        )
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def _split_call_body(self: CAMSDataInterface, body: dict) -> list[dict]:
+        """Splits the CDS API call body into smaller requests that can be downloaded concurrently.
+
+        By default the request is not split, datasets override this method.
+        """
+        return [body]
+
+    def _merge_chunks(
+        self: CAMSDataInterface, chunks_fullpaths: list[str], file_fullpath: str
+    ) -> None:
+        """Merges the files downloaded for each chunk into a single file."""
+        raise NotImplementedError("Method not implemented")
+
+    def _retrieve(self: CAMSDataInterface, body: dict, file_fullpath: str) -> None:
+        """Calls cdsapi and saves the result to a file.
 
-        Uses cdsapi to interact with CAMS ADS.
+        Data is first downloaded to a temporary file, so that an interrupted or failed download never leaves
+        a partial file behind. If the file already exists, the download is skipped.
         """
+        if os.path.exists(file_fullpath):
+            logger.info("Found cached file %s, skipping download", file_fullpath)
+            return
         client = cdsapi.Client()
-        body = self._build_call_body()
         logger.debug("Calling cdsapi with body %s", body)
-        client.retrieve(self.dataset_name, body, file_fullpath)
+        # Each call downloads to its own temporary file, also when concurrent threads
+        # or processes download the same request
+        with temporary_path(file_fullpath) as temp_fullpath:
+            client.retrieve(self.dataset_name, body, temp_fullpath)
         logger.info("Finished downloading file %s", file_fullpath)
 
+    def _download(self: CAMSDataInterface, file_fullpath: str) -> None:
+        """Downloads the dataset and saves it to file specified in filename.
+
+        Uses cdsapi to interact with CAMS ADS. If the file already exists, the download is skipped.
+        Large requests are split into chunks, see _split_call_body, which are downloaded concurrently
+        on at most max_workers threads and then merged. Chunks that were downloaded successfully
+        are kept on disk until the merge, so that a failed download only needs to retry the failed chunks.
+        """
+        if os.path.exists(file_fullpath):
+            logger.info("Found cached file %s, skipping download", file_fullpath)
+            return
+        body = self._build_call_body()
+        chunks = self._split_call_body(body)
+        if len(chunks) == 1:
+            self._retrieve(body, file_fullpath)
+        else:
+            logger.info("Downloading %i chunks for file %s", len(chunks), file_fullpath)
+            chunks_fullpaths = [
+                f"{file_fullpath}.chunk{i}.{self.file_ext}" for i in range(len(chunks))
+            ]
+            with ThreadPoolExecutor(
+                max_workers=min(self.max_workers, len(chunks))
+            ) as executor:
+                futures = [
+                    executor.submit(self._retrieve, chunk, chunk_fullpath)
+                    for chunk, chunk_fullpath in zip(chunks, chunks_fullpaths)
+                ]
+                wait(futures)
+            for future in futures:
+                # Raises the first exception occurred, if any
+                future.result()
+            with temporary_path(file_fullpath) as temp_fullpath:
+                self._merge_chunks(chunks_fullpaths, temp_fullpath)
+            for chunk_fullpath in chunks_fullpaths:
+                os.remove(chunk_fullpath)
+            logger.info("Merged %i chunks into file %s", len(chunks), file_fullpath)
+        self._save_request(file_fullpath, body)
+
+    def _save_request(self: CAMSDataInterface, file_fullpath: str, body: dict) -> None:
+        """Saves the call body next to the downloaded file, so that other requests can reuse the file."""
+        request_path = os.path.join(
+            os.path.dirname(file_fullpath), self.request_filename
+        )
+        with open(request_path, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "dataset_name": self.dataset_name,
+                    "filename": os.path.basename(file_fullpath),
+                    "body": body,
+                },
+                file,
+                sort_keys=True,
+            )
+        logger.debug("Saved request %s to %s", body, request_path)
+
+    @classmethod
+    def _cached_requests(cls) -> list[tuple[str, dict]]:
+        """Lists the files downloaded for this dataset together with the call body used to download them."""
+        cached = []
+        request_paths = glob(
+            os.path.join(
+                cls.data_folder, str(cls.dataset_name), "*", cls.request_filename
+            )
+        )
+        for request_path in request_paths:
+            with open(request_path, "r", encoding="utf-8") as file:
+                request = json.load(file)
+            file_fullpath = os.path.join(
+                os.path.dirname(request_path), request["filename"]
+            )
+            if request["dataset_name"] == cls.dataset_name and os.path.exists(
+                file_fullpath
+            ):
+                cached.append((file_fullpath, request["body"]))
+        return cached
+
     @classmethod
     def list_data_files(cls) -> list:
         """Lists all files inside data folder."""
@@ -86,7 +205,35 @@ class CAMSDataInterface(ABC):
         logger.info("Removed data folder.")
         remove_folder(CAMSDataInterface.data_folder)
 
+    @staticmethod
+    def _project_dataset(
+        dataset: xr.Dataset,
+        variables: str | list[str] | None = None,
+        levels: str | list[str] | None = None,
+        time_slice: slice | None = None,
+    ) -> xr.Dataset:
+        """Selects only some variables, levels and times from a dataset.
+
+        Files are opened lazily, hence only the selected data is loaded into memory later on.
+        Each selection is skipped if None or if the dataset doesn't have the corresponding dimension.
+        """
+        if variables is not None:
+            if isinstance(variables, str):
+                variables = [variables]
+            dataset = dataset[list(variables)]
+        if levels is not None and "level" in dataset.dims:
+            if isinstance(levels, str):
+                levels = [levels]
+            dataset = dataset.isel(
+                level=dataset["level"].isin([float(level) for level in levels]).values
+            )
+        if time_slice is not None and "time" in dataset.dims:
+            dataset = dataset.sel(time=time_slice)
+        return dataset
+
     @abstractmethod
-    def read_dataset(self: CAMSDataInterface):
-        """Returns the files as an xarray.Dataset."""
+    def read_dataset(
+        self: CAMSDataInterface, chunks: dict[str, int] | str | None = None
+    ):
+        """Returns the files as an xarray.Dataset, lazily split into chunks if chunks is not None."""
         raise NotImplementedError("Method not implemented")
@@ -0,0 +1,90 @@
+"""Persistent cache of the reference means used to compute anomalies.
+
+A reference mean (climatology) only depends on the variable, the reference dates range, the time values,
+the selection and the resampling, hence it is saved on disk as a netcdf file and reused instead of
+downloading and aggregating the whole reference period again.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from datetime import time
+
+import xarray as xr
+
+from atmospheric_explorer.api.loggers import get_logger
+from atmospheric_explorer.api.os_manager import (
+    get_local_folder,
+    remove_folder,
+    temporary_path,
+)
+from atmospheric_explorer.api.shape_selection.shape_selection import Selection
+
+logger = get_logger("atmexp")
+
+climatologies_folder: str = os.path.join(get_local_folder(), "climatologies")
+
+
+def selection_key(shapes: Selection) -> str:
+    """Hash of the level, labels and geometries of a selection."""
+    selection_hash = hashlib.sha256(str(shapes.level).encode())
+    if not shapes.empty():
+        for label, geometry in zip(
+            shapes.dataframe["label"], shapes.dataframe.geometry
+        ):
+            selection_hash.update(str(label).encode())
+            selection_hash.update(geometry.wkb)
+    return selection_hash.hexdigest()
+
+
+def climatology_key(shapes: Selection, **params) -> str:
+    """Hash of a selection and the other parameters (e.g. variable and reference dates range) of a climatology.
+
+    Lists of values, e.g. time values, are sorted, so that their order does not change the key.
+    """
+    params = {
+        name: sorted(set(value)) if isinstance(value, (list, tuple, set)) else value
+        for name, value in params.items()
+    }
+    params["selection"] = selection_key(shapes)
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def climatology_path(key: str) -> str:
+    """Path of a climatology."""
+    return os.path.join(climatologies_folder, f"{key}.nc")
+
+
+def load_climatology(key: str) -> xr.DataArray | None:
+    """Returns a cached climatology, or None if not cached."""
+    path = climatology_path(key)
+    if not os.path.exists(path):
+        return None
+    logger.debug("Loading climatology from %s", path)
+    with xr.open_dataarray(path) as data:
+        data = data.load()
+    if "times" in data.coords:
+        # Netcdf cannot store datetime.time values, they are saved as strings
+        data = data.assign_coords(
+            times=[time.fromisoformat(t) for t in data["times"].values]
+        )
+    return data
+
+
+def save_climatology(key: str, data: xr.DataArray) -> None:
+    """Saves a climatology."""
+    path = climatology_path(key)
+    if "times" in data.coords:
+        data = data.assign_coords(times=[t.isoformat() for t in data["times"].values])
+    # Write to a temporary file first, so that concurrent readers never see a partial file
+    with temporary_path(path) as temp_path:
+        data.to_netcdf(temp_path)
+    logger.debug("Saved climatology to %s", path)
+
+
+def clear_climatologies() -> None:
+    """Removes all cached climatologies."""
+    remove_folder(climatologies_folder)
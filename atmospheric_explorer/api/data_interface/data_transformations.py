@@ -1,49 +1,643 @@
 """Data transformations needed for the plotting APIs."""
-from functools import singledispatch
+from functools import lru_cache, singledispatch
+from math import ceil, floor
 
 import numpy as np
 import pandas as pd
-import statsmodels.stats.api as sms
+import shapely
 import xarray as xr
+from rasterio.features import geometry_mask, rasterize
+from rasterio.transform import Affine
+from scipy import sparse, stats
 from shapely.geometry import mapping
+from shapely.geometry.base import BaseGeometry
+from shapely.ops import unary_union
 
-from atmospheric_explorer.api.shape_selection.shape_selection import Selection
+from atmospheric_explorer.api.data_interface.masks_cache import (
+    grid_key,
+    load_label_raster,
+    load_mask,
+    save_label_raster,
+    save_mask,
+)
+from atmospheric_explorer.api.loggers import get_logger
+from atmospheric_explorer.api.shape_selection.config import SelectionLevel
+from atmospheric_explorer.api.shape_selection.shape_selection import (
+    EntitySelection,
+    Selection,
+)
+from atmospheric_explorer.api.shape_selection.shapefile import dissolve_shapefile_level
 
+logger = get_logger("atmexp")
 
-def split_time_dim(dataset: xr.Dataset, time_dim: str):
-    """Split datetime dimension into times and dates."""
-    times = dataset[f"{time_dim}.time"].values
-    dates = np.array(dataset[time_dim].values, dtype="datetime64[D]").astype(
-        "datetime64[ns]"
+
+def _regular_time_dim(dates: np.ndarray, offsets: np.ndarray) -> int | None:
+    """Number of time values per date if a sorted time axis has the same time values for all dates, else None."""
+    if dates.size == 0:
+        return None
+    n_times = int(np.count_nonzero(dates == dates[0]))
+    if len(dates) % n_times:
+        return None
+    dates = dates.reshape(-1, n_times)
+    offsets = offsets.reshape(-1, n_times)
+    if (
+        (dates == dates[:, :1]).all()
+        and (offsets == offsets[:1]).all()
+        and (np.diff(dates[:, 0]) > np.timedelta64(0)).all()
+        and (np.diff(offsets[0]) > np.timedelta64(0)).all()
+    ):
+        return n_times
+    return None
+
+
+def split_time_dim(
+    dataset: xr.Dataset | xr.DataArray, time_dim: str
+) -> xr.Dataset | xr.DataArray:
+    """Split datetime dimension into times and dates.
+
+    When all dates have the same sorted time values, each variable is reshaped into (dates, times),
+    which is a view of the original data. Otherwise the datetime dimension is unstacked,
+    filling missing times with NaN.
+    """
+    datetimes = dataset[time_dim].values
+    dates = datetimes.astype("datetime64[D]").astype("datetime64[ns]")
+    n_times = _regular_time_dim(dates, datetimes - dates)
+    if n_times is None:
+        logger.debug("Time dimension %s is not regular, unstacking it", time_dim)
+        times = dataset[f"{time_dim}.time"].values
+        ind = pd.MultiIndex.from_arrays((times, dates), names=("times", "dates"))
+        return dataset.assign(**{f"{time_dim}": ind}).unstack(time_dim)
+    coords = {
+        "times": dataset[f"{time_dim}.time"].values[:n_times],
+        "dates": dates[::n_times],
+    }
+
+    def _split(array: xr.DataArray) -> xr.DataArray:
+        if time_dim not in array.dims:
+            return array
+        axis = array.get_axis_num(time_dim)
+        shape = array.shape
+        return xr.DataArray(
+            array.data.reshape(*shape[:axis], -1, n_times, *shape[axis + 1 :]),
+            dims=[*array.dims[:axis], "dates", "times", *array.dims[axis + 1 :]],
+            coords={
+                name: coord
+                for name, coord in array.coords.items()
+                if time_dim not in coord.dims
+            }
+            | coords,
+            attrs=array.attrs,
+            name=array.name,
+        ).transpose(..., "times", "dates")
+
+    if isinstance(dataset, xr.DataArray):
+        return _split(dataset)
+    return dataset.map(_split, keep_attrs=True)
+
+
+def selection_area(shapes: Selection, padding: float = 1) -> list[int] | None:
+    """Area box [NORTH, WEST, SOUTH, EAST] enclosing all shapes, to be used in CDS API calls.
+
+    The box is padded and rounded outwards to whole degrees, so that all pixels touched by the shapes
+    are included and close selections share the same box. Longitudes are in the range [-180, +180],
+    the same used by shifting_long. Returns None for an empty selection, i.e. the full area.
+    """
+    if shapes.empty():
+        return None
+    west, south, east, north = shapes.dataframe.total_bounds
+    return [
+        min(ceil(north + padding), 90),
+        max(floor(west - padding), -180),
+        max(floor(south - padding), -90),
+        min(ceil(east + padding), 180),
+    ]
+
+
+def _rasterize(
+    geometries: list, out_shape: tuple[int, int], transform: Affine
+) -> np.ndarray:
+    """Rasterizes geometries, returning True on all pixels touched by at least one of them."""
+    return geometry_mask(
+        [mapping(geometry) for geometry in geometries],
+        out_shape=out_shape,
+        transform=transform,
+        all_touched=True,
+        invert=True,
+    )
+
+
+def shapes_mask(
+    data_frame: xr.Dataset | xr.DataArray, shapes: Selection
+) -> xr.DataArray:
+    """Rasterizes shapes on the latitude/longitude grid of data_frame.
+
+    Returns a boolean mask with dimensions label, latitude and longitude, which is True on all pixels
+    touched by the shapes with that label. These are the same pixels kept by rio.clip with all_touched=True.
+    Masks of entity selections are cached on disk, keyed by grid, selection level and label.
+    """
+    x_dim, y_dim = data_frame.rio.x_dim, data_frame.rio.y_dim
+    out_shape = (data_frame.sizes[y_dim], data_frame.sizes[x_dim])
+    transform = data_frame.rio.transform(recalc=True)
+    labels = shapes.labels
+    grid = grid_key(data_frame) if isinstance(shapes, EntitySelection) else None
+    masks = np.zeros((len(labels), *out_shape), dtype=bool)
+    for i, label in enumerate(labels):
+        geometries = shapes.dataframe.geometry[shapes.dataframe["label"] == label]
+        if grid is None:
+            masks[i] = _rasterize(geometries, out_shape, transform)
+            continue
+        mask = load_mask(grid, shapes.level.value, label)
+        if mask is None:
+            mask = _rasterize(geometries, out_shape, transform)
+            save_mask(grid, shapes.level.value, label, mask)
+        masks[i] = mask
+    return xr.DataArray(
+        masks,
+        dims=["label", y_dim, x_dim],
+        coords={
+            "label": labels,
+            y_dim: data_frame[y_dim].values,
+            x_dim: data_frame[x_dim].values,
+        },
     )
-    ind = pd.MultiIndex.from_arrays((times, dates), names=("times", "dates"))
-    return dataset.assign(**{f"{time_dim}": ind}).unstack(time_dim)
 
 
 def clip_and_concat_shapes(data_frame: xr.Dataset, shapes: Selection) -> xr.Dataset:
-    """Clips data_frame keeping only shapes specified. Shapes_df must be a GeoDataFrame."""
-    df_clipped_concat = xr.Dataset(coords={"label": []})
-    for _, row in shapes.dataframe.iterrows():
-        labels, shapes = row
-        df_clipped = data_frame.rio.clip([mapping(shapes)], drop=True, all_touched=True)
-        # all_touched=True to include all pixels touched by polygon
-        df_clipped = df_clipped.expand_dims({"label": [labels]})
-        df_clipped_concat = xr.concat(
-            [df_clipped_concat, df_clipped], dim="label", combine_attrs="override"
+    """Clips data_frame keeping only shapes specified, each one along a label dimension.
+
+    All shapes are rasterized once with shapes_mask, then data is masked at once for all labels.
+    As with rio.clip, only latitudes and longitudes touched by at least one shape are kept.
+    """
+    x_dim, y_dim = data_frame.rio.x_dim, data_frame.rio.y_dim
+    masks = shapes_mask(data_frame, shapes)
+    touched = masks.any(dim="label")
+    keep = {y_dim: touched.any(dim=x_dim).values, x_dim: touched.any(dim=y_dim).values}
+    masks = masks.isel(keep)
+
+    def _clip(array: xr.DataArray) -> xr.DataArray:
+        if x_dim in array.dims and y_dim in array.dims:
+            return array.where(masks).transpose("label", ...)
+        return array.expand_dims({"label": masks["label"].values})
+
+    data_frame = data_frame.isel(keep)
+    if isinstance(data_frame, xr.DataArray):
+        return _clip(data_frame)
+    return data_frame.map(_clip, keep_attrs=True)
+
+
+def _cells_fraction(
+    geometry: BaseGeometry, mask: np.ndarray, transform: Affine
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the flat index of the cells in mask and the fraction of their area covered by geometry."""
+    rows, cols = np.nonzero(mask)
+    x_0, y_0 = transform * (cols, rows)
+    x_1, y_1 = transform * (cols + 1, rows + 1)
+    boxes = shapely.box(
+        np.minimum(x_0, x_1),
+        np.minimum(y_0, y_1),
+        np.maximum(x_0, x_1),
+        np.maximum(y_0, y_1),
+    )
+    shapely.prepare(geometry)
+    fractions = shapely.area(shapely.intersection(boxes, geometry)) / shapely.area(
+        boxes
+    )
+    return rows * mask.shape[1] + cols, fractions
+
+
+def regions_coverage(
+    data_frame: xr.Dataset | xr.DataArray, shapes: Selection, fractional: bool = False
+) -> tuple[list[str], sparse.csr_matrix]:
+    """Computes which cells of the latitude/longitude grid of data_frame are covered by each label of shapes.
+
+    Returns the labels and a sparse matrix with one row per label and one column per grid cell,
+    with cells flattened in (latitude, longitude) order. If fractional is False, a cell is covered (1)
+    if touched by the label shapes, as in clip_and_concat_shapes. Otherwise, each cell holds the fraction
+    of its area covered by the label shapes. An empty selection covers the whole grid, with label ''.
+    """
+    # pylint: disable=too-many-locals
+    x_dim, y_dim = data_frame.rio.x_dim, data_frame.rio.y_dim
+    n_cells = data_frame.sizes[y_dim] * data_frame.sizes[x_dim]
+    if shapes.empty():
+        return [""], sparse.csr_matrix(np.ones((1, n_cells)))
+    masks = shapes_mask(data_frame, shapes)
+    labels = masks["label"].values.tolist()
+    if not fractional:
+        return labels, sparse.csr_matrix(
+            masks.values.reshape(len(labels), n_cells), dtype=float
+        )
+    transform = data_frame.rio.transform(recalc=True)
+    rows = []
+    for label, mask in zip(labels, masks.values):
+        geometry = unary_union(
+            shapes.dataframe.geometry[shapes.dataframe["label"] == label]
+        )
+        cells, fractions = _cells_fraction(geometry, mask, transform)
+        rows.append(
+            sparse.csr_matrix(
+                (fractions, (np.zeros(len(cells), dtype=int), cells)),
+                shape=(1, n_cells),
+            )
+        )
+    coverage = sparse.vstack(rows, format="csr")
+    # Cells only touched on their border are not covered
+    coverage.eliminate_zeros()
+    return labels, coverage
+
+
+def level_coverage(
+    data_frame: xr.Dataset | xr.DataArray,
+    level: SelectionLevel,
+    fractional: bool = True,
+) -> tuple[list[str], sparse.csr_matrix]:
+    """Computes regions_coverage for all entities of a selection level, e.g. all countries."""
+    return regions_coverage(
+        data_frame,
+        EntitySelection(dataframe=dissolve_shapefile_level(level), level=level),
+        fractional,
+    )
+
+
+def _global_axis(
+    coords: np.ndarray, bounds: tuple[float, float], descending: bool = False
+) -> tuple[np.ndarray, np.ndarray] | None:
+    """Extends regularly spaced coordinates to span bounds with the same step, sorted as specified by descending.
+
+    Returns the extended coordinates and the position of each coordinate inside them,
+    or None if coords are not regularly spaced.
+    """
+    if len(coords) < 2:
+        return None
+    step = abs(coords[-1] - coords[0]) / (len(coords) - 1)
+    if step == 0 or not np.allclose(np.abs(np.diff(coords)), step):
+        return None
+    low, high = bounds
+    first = coords.min() - floor((coords.min() - low) / step + 1e-6) * step
+    # Rounded, so that all grids cropped from the same one get the same coordinates
+    axis = np.round(
+        first + step * np.arange(floor((high - first) / step + 1e-6) + 1), 6
+    )
+    if descending:
+        axis = axis[::-1]
+    positions = np.rint((coords - axis[0]) / (axis[1] - axis[0])).astype(int)
+    if positions.min() < 0 or positions.max() >= len(axis):
+        return None
+    return axis, positions
+
+
+def _grid_label_raster(
+    level: str, grid: xr.Dataset | xr.DataArray
+) -> tuple[list[str], np.ndarray]:
+    """Label raster of a selection level on the latitude/longitude grid of grid, cached on disk."""
+    key = grid_key(grid)
+    cached = load_label_raster(key, level)
+    if cached is not None:
+        return cached
+    x_dim, y_dim = grid.rio.x_dim, grid.rio.y_dim
+    sh_df = dissolve_shapefile_level(level)
+    shapes = [
+        (mapping(geometry), i)
+        for i, geometry in enumerate(sh_df.geometry)
+        if not geometry.is_empty
+    ]
+    out_shape = (grid.sizes[y_dim], grid.sizes[x_dim])
+    transform = grid.rio.transform(recalc=True)
+    centers = rasterize(
+        shapes, out_shape=out_shape, transform=transform, fill=-1, dtype="int32"
+    )
+    touched = rasterize(
+        shapes,
+        out_shape=out_shape,
+        transform=transform,
+        fill=-1,
+        all_touched=True,
+        dtype="int32",
+    )
+    # Cells whose center is outside all entities, e.g. along coasts, go to an entity touching them
+    raster = np.where(centers >= 0, centers, touched)
+    labels = sh_df["label"].tolist()
+    save_label_raster(key, level, labels, raster)
+    return labels, raster
+
+
+def level_label_raster(
+    level: str, data_frame: xr.Dataset | xr.DataArray
+) -> tuple[list[str], np.ndarray]:
+    """Assigns each cell of the latitude/longitude grid of data_frame to an entity of a selection level.
+
+    Returns the entities labels and an integer raster with the index in labels of the entity
+    of each cell, -1 for cells outside all entities. The same rule applies to all entities:
+    a cell belongs to the entity containing its center, cells whose center is outside all entities
+    belong to an entity their polygon touches. Entities of a level do not overlap, so one raster
+    describes them all. The raster is computed once on the global grid data_frame was cropped from,
+    e.g. the whole EAC4 0.75 degrees grid, cached on disk and sliced to data_frame, so that the shapefile
+    is dissolved and rasterized only once per level and dataset resolution.
+    Irregular grids are rasterized as they are.
+    """
+    x_dim, y_dim = data_frame.rio.x_dim, data_frame.rio.y_dim
+    crs = data_frame.rio.crs
+    x_values = data_frame[x_dim].values
+    x_axis = _global_axis(x_values, (-180, 180) if x_values.max() <= 180 else (0, 360))
+    y_axis = _global_axis(data_frame[y_dim].values, (-90, 90), descending=True)
+    if x_axis is None or y_axis is None or crs is None or not crs.is_geographic:
+        return _grid_label_raster(level, data_frame)
+    (x_values, x_positions), (y_values, y_positions) = x_axis, y_axis
+    grid = xr.Dataset(coords={y_dim: y_values, x_dim: x_values}).rio.write_crs(crs)
+    labels, raster = _grid_label_raster(level, grid)
+    return labels, raster[np.ix_(y_positions, x_positions)]
+
+
+def _cells_weights(
+    data: xr.Dataset | xr.DataArray, weights: str | xr.DataArray | None
+) -> np.ndarray | None:
+    """Flattened cells weights, in (latitude, longitude) order."""
+    x_dim, y_dim = data.rio.x_dim, data.rio.y_dim
+    if isinstance(weights, str):
+        if weights != "cos_lat":
+            raise ValueError("Parameter weights must be 'cos_lat' or an array")
+        weights = np.cos(np.deg2rad(data[y_dim])) * xr.ones_like(data[x_dim])
+    if weights is None:
+        return None
+    return weights.transpose(y_dim, x_dim).values.ravel()
+
+
+def _apply_regions(
+    data: xr.Dataset | xr.DataArray, labels: list[str], aggregate
+) -> xr.Dataset | xr.DataArray:
+    """Applies aggregate, a function from (..., latitude, longitude) to (..., label) arrays, to data."""
+    x_dim, y_dim = data.rio.x_dim, data.rio.y_dim
+
+    def _apply(array: xr.DataArray) -> xr.DataArray:
+        return (
+            xr.apply_ufunc(
+                aggregate,
+                array,
+                input_core_dims=[[y_dim, x_dim]],
+                output_core_dims=[["label"]],
+                dask="parallelized",
+                output_dtypes=[float],
+                dask_gufunc_kwargs={
+                    "output_sizes": {"label": len(labels)},
+                    "allow_rechunk": True,
+                },
+                keep_attrs=True,
+            )
+            .assign_coords(label=labels)
+            .transpose("label", ...)
         )
-    return df_clipped_concat
+
+    if isinstance(data, xr.DataArray):
+        return _apply(data)
+    return xr.Dataset(
+        {
+            name: _apply(array)
+            for name, array in data.data_vars.items()
+            if x_dim in array.dims and y_dim in array.dims
+        },
+        attrs=data.attrs,
+    )
+
+
+def aggregate_regions(
+    data: xr.Dataset | xr.DataArray,
+    coverage: tuple[list[str], sparse.csr_matrix],
+    how: str = "mean",
+    weights: str | xr.DataArray | None = None,
+) -> xr.Dataset | xr.DataArray:
+    """Computes the mean or sum over latitude and longitude of data, for all regions at once.
+
+    Each region value is the product of the region coverage, computed by regions_coverage or level_coverage,
+    with the flattened data: one sparse matrix product for all regions and all other coordinates (e.g. times).
+    Missing values are not counted. The result has a label dimension instead of latitude and longitude.
+
+    Attributes:
+        data (xr.Dataset | xr.DataArray): data to aggregate, variables without latitude and longitude
+            are dropped
+        coverage (tuple[list[str], sparse.csr_matrix]): labels and coverage matrix of the regions
+        how (str): either 'mean' or 'sum'
+        weights (str | xr.DataArray | None): cells weights, either 'cos_lat' to weight each cell
+            by the cosine of its latitude or an array with latitude and longitude dimensions,
+            e.g. GHG cells area
+    """
+    labels, matrix = coverage
+    weights = _cells_weights(data, weights)
+    if weights is not None:
+        matrix = sparse.csr_matrix(matrix.multiply(weights[np.newaxis, :]))
+
+    def _aggregate(values: np.ndarray) -> np.ndarray:
+        flat = values.reshape(-1, values.shape[-2] * values.shape[-1]).T
+        valid = ~np.isnan(flat)
+        res = matrix @ np.where(valid, flat, 0)
+        if how == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                res = res / (matrix @ valid.astype(float))
+        return res.T.reshape(*values.shape[:-2], len(labels))
+
+    return _apply_regions(data, labels, _aggregate)
+
+
+def _aggregate_label_raster(
+    data: xr.Dataset | xr.DataArray,
+    labels: list[str],
+    cells_label: np.ndarray,
+    how: str = "mean",
+    weights: np.ndarray | None = None,
+) -> xr.Dataset | xr.DataArray:
+    """Computes the mean or sum over latitude and longitude of data for each label, with np.bincount.
+
+    cells_label holds the index in labels of each flattened cell, -1 for cells not aggregated.
+    """
+    n_labels = len(labels)
+
+    def _aggregate(values: np.ndarray) -> np.ndarray:
+        flat = values.reshape(-1, cells_label.size)
+        valid = ~np.isnan(flat) & (cells_label >= 0)
+        index = (np.arange(len(flat))[:, np.newaxis] * n_labels + cells_label)[valid]
+        cells_weights = (
+            np.ones(flat.shape)
+            if weights is None
+            else np.broadcast_to(weights, flat.shape)
+        )[valid]
+        size = len(flat) * n_labels
+        res = np.bincount(index, weights=flat[valid] * cells_weights, minlength=size)
+        if how == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                res = res / np.bincount(index, weights=cells_weights, minlength=size)
+        return res.reshape(*values.shape[:-2], n_labels)
+
+    return _apply_regions(data, labels, _aggregate)
+
+
+def aggregate_selection(
+    data: xr.Dataset | xr.DataArray,
+    shapes: Selection,
+    how: str = "mean",
+    weights: str | xr.DataArray | None = None,
+) -> xr.Dataset | xr.DataArray:
+    """Computes the mean or sum over latitude and longitude of data for each label of shapes.
+
+    Entity selections use the label raster of their level, computed by level_label_raster,
+    and no geometry is processed at request time: each cell counts for one entity only,
+    the one containing its center or, for cells whose center is outside all entities, one touching it.
+    Entities without any cell of their own, i.e. smaller than a cell and surrounded by other entities,
+    get missing values (zero when summing). Generic shapes and empty selections are aggregated
+    over all the cells touched by their polygons with regions_coverage and aggregate_regions.
+    Accepts the same parameters as aggregate_regions.
+    """
+    if not isinstance(shapes, EntitySelection) or shapes.empty():
+        return aggregate_regions(data, regions_coverage(data, shapes), how, weights)
+    level_labels, raster = level_label_raster(shapes.level.value, data)
+    labels = shapes.labels
+    # Index -1 of positions is -1, so that cells outside all entities stay outside
+    index = {label: i for i, label in enumerate(labels)}
+    positions = np.array([index.get(label, -1) for label in level_labels] + [-1])
+    cells_label = positions[raster.ravel()]
+    cells_count = np.bincount(cells_label[cells_label >= 0], minlength=len(labels))
+    if not cells_count.all():
+        logger.warning(
+            "No cell of the data grid is assigned to %s",
+            [label for label, count in zip(labels, cells_count) if not count],
+        )
+    return _aggregate_label_raster(
+        data, labels, cells_label, how, _cells_weights(data, weights)
+    )
+
+
+def time_groups(
+    times: np.ndarray | pd.DatetimeIndex, resampling: str
+) -> tuple[pd.DatetimeIndex, np.ndarray, np.ndarray]:
+    """Computes once the groups obtained resampling a datetime axis.
+
+    Returns the groups labels, the same used by xarray resample, the group of each time value
+    and its position inside the group.
+    """
+    times = pd.DatetimeIndex(times)
+    bins = (
+        pd.Series(np.zeros(len(times)), index=times.sort_values())
+        .resample(resampling)
+        .sum()
+        .index
+    )
+    groups = bins.searchsorted(times, side="right") - 1
+    order = np.argsort(groups, kind="stable")
+    positions = np.empty(len(times), dtype=int)
+    positions[order] = np.arange(len(times)) - np.searchsorted(
+        groups[order], groups[order]
+    )
+    return bins, groups, positions
+
+
+def _grouped(
+    values: np.ndarray, groups: np.ndarray, positions: np.ndarray, n_groups: int
+) -> np.ndarray:
+    """Splits the last axis of values into group and position axes, filling the missing positions with NaN."""
+    grouped = np.full(
+        (*values.shape[:-1], n_groups, positions.max(initial=-1) + 1), np.nan
+    )
+    grouped[..., groups, positions] = values
+    return grouped
+
+
+def resample_reduce(
+    data: xr.Dataset | xr.DataArray,
+    dim: str,
+    resampling: str,
+    how: str = "mean",
+    weights: xr.DataArray | None = None,
+) -> xr.Dataset | xr.DataArray:
+    """Resamples data over a datetime dimension, reducing all groups at once.
+
+    Groups are computed once with time_groups, then the values of each group are laid along a new axis,
+    so that all groups, labels and levels are reduced in a single vectorized pass instead of one group
+    at a time. Missing values are not counted, empty groups are missing.
+
+    Attributes:
+        data (xr.Dataset | xr.DataArray): data to resample, variables without dim are left unchanged
+        dim (str): datetime dimension
+        resampling (str): resampling frequency, e.g. '1MS' or 'YS'
+        how (str): either 'mean', 'sum' or 'ci', the confidence interval computed by confidence_interval
+            along a new ci dimension
+        weights (xr.DataArray | None): weights of the means along dim, e.g. the number of days of each month
+    """
+    if how not in ("mean", "sum", "ci"):
+        raise ValueError("Parameter how must be 'mean', 'sum' or 'ci'")
+    bins, groups, positions = time_groups(data[dim].values, resampling)
+    if weights is not None:
+        weights = _grouped(weights.values.astype(float), groups, positions, len(bins))
+
+    def _reduce(values: np.ndarray) -> np.ndarray:
+        grouped = _grouped(values.astype(float), groups, positions, len(bins))
+        if how == "ci":
+            return _t_confidence_interval(grouped)
+        valid = ~np.isnan(grouped)
+        values_sum = np.where(valid, grouped, 0)
+        if how == "sum":
+            return np.where(valid.any(axis=-1), values_sum.sum(axis=-1), np.nan)
+        group_weights = valid if weights is None else np.where(valid, weights, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (values_sum * group_weights).sum(axis=-1) / group_weights.sum(
+                axis=-1
+            )
+
+    output_sizes = {dim: len(bins)}
+    if how == "ci":
+        output_sizes["ci"] = 3
+
+    def _apply(array: xr.DataArray) -> xr.DataArray:
+        if dim not in array.dims:
+            return array
+        res = xr.apply_ufunc(
+            _reduce,
+            array,
+            input_core_dims=[[dim]],
+            output_core_dims=[list(output_sizes)],
+            exclude_dims={dim},
+            dask="parallelized",
+            output_dtypes=[float],
+            dask_gufunc_kwargs={"output_sizes": output_sizes, "allow_rechunk": True},
+            keep_attrs=True,
+        ).assign_coords({dim: bins})
+        if how == "ci":
+            res = res.assign_coords(ci=["lower", "mean", "upper"])
+        return res.transpose(*array.dims, ...)
+
+    if isinstance(data, xr.DataArray):
+        return _apply(data)
+    return data.map(_apply, keep_attrs=True)
+
+
+def resample_monthly_means(
+    data: xr.Dataset | xr.DataArray, dim: str, resampling: str
+) -> xr.Dataset | xr.DataArray:
+    """Resamples monthly means over a datetime dimension, weighting each month by its number of days.
+
+    In this way, the result is the same as resampling the original data
+    instead of its monthly means. Missing values are not counted.
+    """
+    return resample_reduce(data, dim, resampling, weights=data[dim].dt.days_in_month)
+
+
+def _t_confidence_interval(values: np.ndarray, axis: int = -1) -> np.ndarray:
+    """Lower bound, mean and upper bound of the 95% t confidence interval of the mean along axis.
+
+    Missing values are not counted. Bounds are the same returned by statsmodels DescrStatsW.tconfint_mean,
+    computed with array reductions for all other axes at once. The result has a last axis of length 3.
+    """
+    values = np.moveaxis(np.asarray(values, dtype=float), axis, -1)
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, values, 0).sum(axis=-1) / count
+        squares = np.where(valid, (values - mean[..., np.newaxis]) ** 2, 0)
+        std_mean = np.sqrt(squares.sum(axis=-1) / (count - 1) / count)
+        half_width = stats.t.ppf(0.975, count - 1) * std_mean
+    return np.stack([mean - half_width, mean, mean + half_width], axis=-1)
 
 
 @singledispatch
 def confidence_interval(array: list | np.ndarray) -> np.ndarray:
     """Compute the confidence interval for an array of samples."""
-    if isinstance(array, list):
-        array = np.array(array)
-    array_nonan = array[~np.isnan(array)]
-    if array_nonan.size > 0:
-        array = array_nonan
-    lower, upper = sms.DescrStatsW(array).tconfint_mean()
-    return np.array([lower, np.mean(array), upper])
+    return _t_confidence_interval(np.ravel(array))
 
 
 @confidence_interval.register
@@ -52,19 +646,41 @@ def _(array: xr.DataArray, dim: str) -> xr.DataArray:
 
     This function preserves all other dimensions and can be used in resamples and groupby with map.
     """
-    all_dims = list(array.dims)
-    index = all_dims.index(dim)
-    keep_dims = all_dims.copy()
-    keep_dims.remove(dim)
+    keep_dims = [d for d in array.dims if d != dim]
     return xr.DataArray(
-        np.apply_along_axis(confidence_interval, index, array.values),
+        _t_confidence_interval(array.values, array.get_axis_num(dim)),
         dims=[*keep_dims, "ci"],
         coords=[*[array.coords[d] for d in keep_dims], ["lower", "mean", "upper"]],
     )
 
 
-def shifting_long(data_set=xr.Dataset) -> xr.Dataset:
-    """Shifts longitude to range [-180, +180]."""
-    return data_set.assign_coords(
-        longitude=((data_set.longitude + 180) % 360) - 180
-    ).sortby("longitude")
+@lru_cache(maxsize=32)
+def _shifted_longitude_order(longitude: bytes) -> tuple[np.ndarray, np.ndarray | None]:
+    """Longitudes shifted to range [-180, +180] and the permutation sorting them, None if already sorted."""
+    shifted = ((np.frombuffer(longitude) + 180) % 360) - 180
+    shifted.flags.writeable = False
+    order = np.argsort(shifted, kind="stable")
+    if (order == np.arange(len(order))).all():
+        return shifted, None
+    order.flags.writeable = False
+    return shifted, order
+
+
+def shifting_long(
+    data_set: xr.Dataset | xr.DataArray,
+) -> xr.Dataset | xr.DataArray:
+    """Shifts longitude to range [-180, +180].
+
+    Data is only reordered if the shifted longitudes are not sorted, with one isel on a permutation
+    cached by longitude values. This stays lazy on chunked data and on files not loaded yet,
+    so that it can be used as preprocess in read_dataset.
+    """
+    shifted, order = _shifted_longitude_order(
+        np.ascontiguousarray(data_set["longitude"].values, dtype="f8").tobytes()
+    )
+    data_set = data_set.assign_coords(
+        longitude=data_set["longitude"].copy(data=shifted)
+    )
+    if order is None:
+        return data_set
+    return data_set.isel(longitude=order)
@@ -4,3 +4,6 @@
 # ruff: noqa: F401
 from atmospheric_explorer.api.data_interface.eac4.eac4 import EAC4Instance
 from atmospheric_explorer.api.data_interface.eac4.eac4_config import EAC4Config
+from atmospheric_explorer.api.data_interface.eac4.eac4_monthly import (
+    EAC4MonthlyInstance,
+)
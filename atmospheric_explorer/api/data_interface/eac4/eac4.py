@@ -4,13 +4,24 @@
 from __future__ import annotations
 
 import os
+from collections.abc import Callable
+from functools import reduce
 
+import numpy as np
 import xarray as xr
+from numcodecs import Blosc
 
 from atmospheric_explorer.api.config import CRS
 from atmospheric_explorer.api.data_interface.cams_interface import CAMSDataInterface
+from atmospheric_explorer.api.data_interface.eac4.eac4_cache import (
+    dates_to_ranges,
+    level_key,
+    plan_requests,
+    request_coverage,
+)
+from atmospheric_explorer.api.data_interface.eac4.eac4_config import EAC4Config
 from atmospheric_explorer.api.loggers import get_logger
-from atmospheric_explorer.api.os_manager import create_folder, remove_folder
+from atmospheric_explorer.api.os_manager import create_folder, temporary_path
 
 logger = get_logger("atmexp")
 
@@ -18,7 +29,9 @@ logger = get_logger("atmexp")
 class EAC4Instance(CAMSDataInterface):
     # pylint: disable=line-too-long
     # pylint: disable=too-many-instance-attributes
-    """Interface for CAMS global reanalysis (EAC4) and CAMS global reanalysis (EAC4) monthly averaged fields datasets.
+    """Interface for CAMS global reanalysis (EAC4) dataset.
+
+    For the CAMS global reanalysis (EAC4) monthly averaged fields dataset see EAC4MonthlyInstance.
 
     See https://confluence.ecmwf.int/display/CKB/CAMS%3A+Reanalysis+data+documentation#heading-CAMSglobalreanalysisEAC4Parameterlistings
     for a full list of parameters and more details about the dataset.
@@ -27,6 +40,14 @@ class EAC4Instance(CAMSDataInterface):
     dataset_dir: str = os.path.join(CAMSDataInterface.data_folder, dataset_name)
     file_format = "netcdf"
     file_ext = "nc"
+    chunks_by: str | None = "month"
+    use_zarr: bool = False
+    zarr_chunks: dict[str, int] = {
+        "time": 248,
+        "level": 1,
+        "latitude": 64,
+        "longitude": 128,
+    }
 
     def __init__(
         self,
@@ -47,8 +68,9 @@ class EAC4Instance(CAMSDataInterface):
             dates_range (str): range of dates to consider, provided as a 'start/end' string with dates in ISO format
             time_values (str | list[str]): time in 'HH:MM' format. One value or a list of values can be provided.
                 Accepted values are [00:00, 03:00, 06:00, 09:00, 12:00, 15:00, 18:00, 21:00]
-            filename (str | None): file where to save the data. If not provided will be built using file_format and
-                with a dinamically generated name
+            files_dir (str | None): folder where to save the data. If not provided, the folder is named after
+                the request cache key, so that identical requests reuse the same downloaded file.
+                The key follows changes to the request attributes, so that a changed request is downloaded again
             area (list[int]): latitude-longitude area box to be considered, provided as a list of four values
                 [NORTH, WEST, SOUTH, EAST]. If not provided, full area will be considered
             pressure_level (str | list[str] | None): pressure levels to be considered for multilevel variables.
@@ -63,13 +85,33 @@ class EAC4Instance(CAMSDataInterface):
         self.area = area
         self.pressure_level = pressure_level
         self.model_level = model_level
-        self.files_dirname = files_dir if files_dir is not None else f"data_{self._id}"
-        self.files_dir_path = os.path.join(self.dataset_dir, self.files_dirname)
-        if os.path.exists(self.dataset_dir):
-            remove_folder(self.dataset_dir)
+        self.files_dir = files_dir
+        self._source_files = None
         create_folder(self.files_dir_path)
         logger.info("Created folder %s", self.files_dir_path)
 
+    @classmethod
+    def from_call_body(cls, body: dict) -> EAC4Instance:
+        """Creates an EAC4Instance from a CDS API call body."""
+        return cls(
+            data_variables=body["variable"],
+            dates_range=body["date"],
+            time_values=body["time"],
+            area=body.get("area"),
+            pressure_level=body.get("pressure_level"),
+            model_level=body.get("model_level"),
+        )
+
+    @property
+    def files_dirname(self: EAC4Instance) -> str:
+        """Name of the data folder, i.e. files_dir if provided, otherwise the cache key of the current request."""
+        return self.files_dir if self.files_dir is not None else self.cache_key
+
+    @property
+    def files_dir_path(self: EAC4Instance) -> str:
+        """Path of the data folder."""
+        return os.path.join(self.dataset_dir, self.files_dirname)
+
     @property
     def file_full_path(self: EAC4Instance) -> str:
         """Name of the saved file."""
@@ -77,11 +119,23 @@ class EAC4Instance(CAMSDataInterface):
             self.files_dir_path, f"{self.files_dirname}.{self.file_ext}"
         )
 
+    @property
+    def zarr_full_path(self: EAC4Instance) -> str:
+        """Name of the zarr store the saved file is converted to, if use_zarr is True."""
+        return os.path.join(self.files_dir_path, f"{self.files_dirname}.zarr")
+
+    @property
+    def stored_file_path(self: EAC4Instance) -> str:
+        """Path of the data on disk, either the downloaded file or the zarr store it was converted to."""
+        if os.path.exists(self.zarr_full_path):
+            return self.zarr_full_path
+        return self.file_full_path
+
     @property
     def time_values(self: EAC4Instance) -> str | list[str]:
         """Time values are internally represented as a set, use this property to set/get its value."""
         return (
-            list(self._time_values)
+            sorted(self._time_values)
             if isinstance(self._time_values, set)
             else self._time_values
         )
@@ -98,7 +152,7 @@ class EAC4Instance(CAMSDataInterface):
     def pressure_level(self: EAC4Instance) -> str | list[str] | None:
         """Pressure level is internally represented as a set, use this property to set/get its value."""
         return (
-            list(self._pressure_level)
+            sorted(self._pressure_level)
             if isinstance(self._pressure_level, set)
             else self._pressure_level
         )
@@ -115,7 +169,7 @@ class EAC4Instance(CAMSDataInterface):
     def model_level(self: EAC4Instance) -> str | list[str] | None:
         """Model level is internally represented as a set, use this property to set/get its value."""
         return (
-            list(self._model_level)
+            sorted(self._model_level)
             if isinstance(self._model_level, set)
             else self._model_level
         )
@@ -141,16 +195,212 @@ class EAC4Instance(CAMSDataInterface):
             call_body["model_level"] = self.model_level
         return call_body
 
+    def _split_call_body(self: EAC4Instance, body: dict) -> list[dict]:
+        """Splits the CDS API call body into smaller requests that can be downloaded concurrently.
+
+        Depending on chunks_by, the request is split by month ('month'), time value ('time')
+        or level ('level'). Use None to download the data with a single request.
+        """
+        dates, times, levels = request_coverage(body)
+        if self.chunks_by == "month":
+            dates_by_month = {}
+            for day in dates:
+                dates_by_month.setdefault((day.year, day.month), set()).add(day)
+            return [
+                {**body, "date": dates_to_ranges(month_dates)[0]}
+                for _, month_dates in sorted(dates_by_month.items())
+            ]
+        if self.chunks_by == "time":
+            return [{**body, "time": time} for time in sorted(times)]
+        if self.chunks_by == "level" and level_key(body) is not None:
+            return [{**body, level_key(body): level} for level in sorted(levels)]
+        return [body]
+
+    def _merge_chunks(
+        self: EAC4Instance, chunks_fullpaths: list[str], file_fullpath: str
+    ) -> None:
+        """Merges the netcdf files downloaded for each chunk into a single file."""
+        concat_dim = "level" if self.chunks_by == "level" else "time"
+        with xr.open_mfdataset(
+            chunks_fullpaths,
+            combine="nested",
+            concat_dim=concat_dim,
+            combine_attrs="override",
+        ) as dataset:
+            dataset.sortby(concat_dim).to_netcdf(file_fullpath)
+
+    def _convert_to_zarr(self: EAC4Instance) -> None:
+        """Converts the downloaded netcdf file into a zarr store, then removes the netcdf file.
+
+        The store is chunked as specified in zarr_chunks, i.e. along time and in tiles of latitude and longitude,
+        and compressed with Blosc. Reading it back is lazy, so that later operations only read the chunks they need.
+        """
+        compressor = Blosc(cname="zstd", clevel=5, shuffle=Blosc.BITSHUFFLE)
+        with xr.open_dataset(self.file_full_path) as dataset:
+            chunks = {
+                dim: min(size, dataset.sizes[dim])
+                for dim, size in self.zarr_chunks.items()
+                if dim in dataset.dims
+            }
+            encoding = {
+                var: {
+                    "compressor": compressor,
+                    "chunks": tuple(
+                        chunks.get(dim, dataset.sizes[dim]) for dim in dataset[var].dims
+                    ),
+                }
+                for var in dataset.data_vars
+            }
+            with temporary_path(self.zarr_full_path, directory=True) as temp_fullpath:
+                dataset.chunk(chunks).to_zarr(
+                    temp_fullpath, mode="w", encoding=encoding
+                )
+        self._save_request(self.zarr_full_path, self._build_call_body())
+        os.remove(self.file_full_path)
+        logger.info(
+            "Converted file %s to zarr store %s",
+            self.file_full_path,
+            self.zarr_full_path,
+        )
+
     def download(self: EAC4Instance) -> None:
         """Downloads the dataset and saves it to file specified in filename.
 
-        Uses cdsapi to interact with CAMS ADS.
+        Uses cdsapi to interact with CAMS ADS. Nothing is downloaded if the same data is already on disk.
+        If other requests already downloaded part of the data, e.g. a wider dates range,
+        their files are reused and only the missing dates, time values and levels are downloaded.
+        If use_zarr is True, the downloaded file is converted to a zarr store.
         """
-        return super()._download(self.file_full_path)
+        self._source_files = None
+        create_folder(self.files_dir_path)
+        if os.path.exists(self.stored_file_path):
+            logger.info(
+                "Found cached file %s, skipping download", self.stored_file_path
+            )
+        else:
+            cached = [
+                (file_fullpath, body)
+                for file_fullpath, body in self._cached_requests()
+                if file_fullpath not in (self.file_full_path, self.zarr_full_path)
+            ]
+            sources, missing_bodies = plan_requests(self._build_call_body(), cached)
+            if not sources:
+                super()._download(self.file_full_path)
+            else:
+                logger.info("Reusing cached files %s", sources)
+                for body in missing_bodies:
+                    missing_data = type(self).from_call_body(body)
+                    missing_data.chunks_by = self.chunks_by
+                    missing_data.use_zarr = self.use_zarr
+                    missing_data.download()
+                    sources.append(missing_data.stored_file_path)
+                self._source_files = sources
+        if (
+            self.use_zarr
+            and self._source_files is None
+            and not os.path.exists(self.zarr_full_path)
+        ):
+            self._convert_to_zarr()
 
     def _simplify_dataset(self: EAC4Instance, dataset: xr.Dataset):
         return dataset.rio.write_crs(CRS)
 
-    def read_dataset(self: EAC4Instance) -> xr.Dataset:
-        """Returns data as an xarray.Dataset."""
-        return self._simplify_dataset(xr.open_dataset(self.file_full_path))
+    @staticmethod
+    def _open_file(
+        file_fullpath: str, chunks: dict[str, int] | str | None = None
+    ) -> xr.Dataset:
+        """Opens a netcdf file or, lazily, a zarr store.
+
+        If chunks is not None, data is read lazily as dask arrays split into these chunks.
+        """
+        if file_fullpath.endswith(".zarr"):
+            return xr.open_zarr(file_fullpath, chunks=chunks or "auto")
+        return xr.open_dataset(file_fullpath, chunks=chunks)
+
+    def _select_request(self: EAC4Instance, dataset: xr.Dataset) -> xr.Dataset:
+        """Selects from a dataset only the variables, dates, time values and levels of this request."""
+        variables_conf = EAC4Config.get_config()["variables"]
+        data_variables = self.data_variables
+        if isinstance(data_variables, str):
+            data_variables = [data_variables]
+        if all(v in variables_conf for v in data_variables):
+            dataset = dataset[[variables_conf[v]["var_name"] for v in data_variables]]
+        dates, times, levels = request_coverage(self._build_call_body())
+        time_dates = dataset["time"].values.astype("datetime64[D]")
+        time_mask = (
+            np.isin(time_dates, np.array(sorted(dates), dtype="datetime64[D]"))
+            & dataset["time"].dt.strftime("%H:%M").isin(list(times)).values
+        )
+        dataset = dataset.isel(time=time_mask)
+        if "level" in dataset.dims and None not in levels:
+            dataset = dataset.sel(
+                level=dataset["level"].isin([float(level) for level in levels])
+            )
+        if self.area is not None:
+            # Files may have been downloaded with different areas, hence longitudes
+            # are moved to the same range [-180, +180] before merging them
+            north, west, south, east = self.area
+            dataset = dataset.assign_coords(
+                longitude=((dataset["longitude"] + 180) % 360) - 180
+            ).sortby("longitude")
+            longitude = dataset["longitude"]
+            # Areas crossing the antimeridian have west > east
+            if west > east:
+                longitude_mask = (longitude >= west) | (longitude <= east)
+            else:
+                longitude_mask = (longitude >= west) & (longitude <= east)
+            dataset = dataset.isel(
+                latitude=(
+                    (dataset["latitude"] >= south) & (dataset["latitude"] <= north)
+                ).values,
+                longitude=longitude_mask.values,
+            )
+        return dataset
+
+    def read_dataset(
+        self: EAC4Instance,
+        chunks: dict[str, int] | str | None = None,
+        variables: str | list[str] | None = None,
+        levels: str | list[str] | None = None,
+        time_slice: slice | None = None,
+        preprocess: Callable[[xr.Dataset], xr.Dataset] | None = None,
+    ) -> xr.Dataset:
+        """Returns data as an xarray.Dataset.
+
+        If the data was taken from files downloaded by other requests,
+        these files are sliced to this request and merged together.
+
+        Attributes:
+            chunks (dict[str, int] | str | None): if not None, data is read lazily as dask arrays
+                split into these chunks (e.g. {"time": 248}), so that data larger than memory
+                can be processed chunk by chunk. See xarray.open_dataset for accepted values
+            variables (str | list[str] | None): if not None, only read these variables, e.g. 'go3'
+            levels (str | list[str] | None): if not None, only read these pressure or model levels
+            time_slice (slice | None): if not None, only read times inside this slice,
+                e.g. slice('2021-01-01', '2021-06-30')
+            preprocess (Callable[[xr.Dataset], xr.Dataset] | None): if not None, applied to each file
+                right after opening it, before data is loaded (e.g. shifting_long)
+        """
+        preprocess = preprocess or (lambda dataset: dataset)
+        if self._source_files is None:
+            dataset = self._project_dataset(
+                self._open_file(self.stored_file_path, chunks),
+                variables,
+                levels,
+                time_slice,
+            )
+            return self._simplify_dataset(preprocess(dataset))
+        logger.debug("Reading data from files %s", self._source_files)
+        datasets = [
+            preprocess(
+                self._project_dataset(
+                    self._select_request(self._open_file(file_fullpath, chunks)),
+                    variables,
+                    levels,
+                    time_slice,
+                )
+            )
+            for file_fullpath in self._source_files
+        ]
+        dataset = reduce(lambda ds1, ds2: ds1.combine_first(ds2), datasets)
+        return self._simplify_dataset(dataset.sortby("time"))
@@ -0,0 +1,178 @@
+"""Utilities to reuse EAC4 data that has already been downloaded for other requests.
+
+A request is seen as a cube of dates, time values and levels. Given the requests already on disk,
+these functions find which cached files overlap a new request and which parts of it are still missing.
+"""
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from atmospheric_explorer.api.loggers import get_logger
+
+logger = get_logger("atmexp")
+
+_LEVEL_KEYS = ("pressure_level", "model_level")
+
+
+def _as_set(value: str | list[str] | None) -> set:
+    """Converts a call body value into a set."""
+    if value is None:
+        return {None}
+    if isinstance(value, str):
+        return {value}
+    return set(value)
+
+
+def dates_from_range(dates_range: str) -> set[date]:
+    """Returns all dates inside a 'start/end' range, both ends included."""
+    start, _, end = dates_range.partition("/")
+    start_date = date.fromisoformat(start)
+    end_date = date.fromisoformat(end) if end else start_date
+    return {
+        start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)
+    }
+
+
+def dates_to_ranges(dates: set[date]) -> list[str]:
+    """Groups a set of dates into the minimum number of 'start/end' ranges."""
+    ranges = []
+    for day in sorted(dates):
+        if ranges and day - ranges[-1][1] == timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [f"{start.isoformat()}/{end.isoformat()}" for start, end in ranges]
+
+
+def level_key(body: dict) -> str | None:
+    """Returns the level parameter used in a call body, i.e. 'pressure_level', 'model_level' or None."""
+    for key in _LEVEL_KEYS:
+        if body.get(key) is not None:
+            return key
+    return None
+
+
+def request_coverage(body: dict) -> tuple[set[date], set[str], set[str | None]]:
+    """Dates, time values and levels covered by a call body."""
+    return (
+        dates_from_range(body["date"]),
+        _as_set(body["time"]),
+        _as_set(body.get(level_key(body))),
+    )
+
+
+def area_contains(area: list[int] | None, other_area: list[int] | None) -> bool:
+    """Returns True if the [NORTH, WEST, SOUTH, EAST] area box includes other_area. None is the full area.
+
+    Boxes with WEST > EAST cross the antimeridian.
+    """
+    if area is None:
+        return True
+    if other_area is None:
+        return False
+    north, west, south, east = area
+    other_north, other_west, other_south, other_east = other_area
+    if north < other_north or south > other_south:
+        return False
+    # Longitudes are compared as intervals on the circle, unwrapped so that west <= east
+    east += 360 if west > east else 0
+    other_east += 360 if other_west > other_east else 0
+    return east - west >= 360 or any(
+        west <= other_west + shift and other_east + shift <= east
+        for shift in (-360, 0, 360)
+    )
+
+
+def is_compatible(body: dict, cached_body: dict) -> bool:
+    """Returns True if data downloaded with cached_body can be sliced to serve (part of) body.
+
+    The two requests must have the same format and level type, the cached request area
+    must include the new one and the cached request must include all variables of the new one.
+    """
+    return (
+        body.get("format") == cached_body.get("format")
+        and area_contains(cached_body.get("area"), body.get("area"))
+        and level_key(body) == level_key(cached_body)
+        and _as_set(body["variable"]).issubset(_as_set(cached_body["variable"]))
+    )
+
+
+def _use_cached(
+    body: dict, cached: list[tuple[str, dict]], missing: dict[tuple, set[date]]
+) -> list[str]:
+    """Removes from missing the dates covered by cached files and returns the files used."""
+    # pylint: disable=too-many-locals
+    dates, times, levels = request_coverage(body)
+    candidates = []
+    for file_fullpath, cached_body in cached:
+        if is_compatible(body, cached_body):
+            cached_dates, cached_times, cached_levels = request_coverage(cached_body)
+            overlap = (
+                len(dates & cached_dates)
+                * len(times & cached_times)
+                * len(levels & cached_levels)
+            )
+            if overlap:
+                candidates.append((overlap, file_fullpath, cached_body))
+    # Files with the largest overlap first, so that fewer files are needed
+    sources = []
+    for _, file_fullpath, cached_body in sorted(candidates, key=lambda c: -c[0]):
+        cached_dates, cached_times, cached_levels = request_coverage(cached_body)
+        contributes = False
+        for (time, level), missing_dates in missing.items():
+            if time in cached_times and level in cached_levels:
+                contributes = contributes or bool(missing_dates & cached_dates)
+                missing_dates.difference_update(cached_dates)
+        if contributes:
+            sources.append(file_fullpath)
+    return sources
+
+
+def _missing_bodies(body: dict, missing: dict[tuple, set[date]]) -> list[dict]:
+    """Groups missing (time value, level) pairs sharing the same missing dates into call bodies."""
+    times_by_dates_level = {}
+    for (time, level), missing_dates in missing.items():
+        if missing_dates:
+            times_by_dates_level.setdefault(
+                (frozenset(missing_dates), level), set()
+            ).add(time)
+    levels_by_dates_times = {}
+    for (missing_dates, level), box_times in times_by_dates_level.items():
+        levels_by_dates_times.setdefault(
+            (missing_dates, frozenset(box_times)), set()
+        ).add(level)
+    missing_bodies = []
+    key = level_key(body)
+    for (missing_dates, box_times), box_levels in levels_by_dates_times.items():
+        for dates_range in dates_to_ranges(set(missing_dates)):
+            missing_body = {**body, "date": dates_range, "time": sorted(box_times)}
+            if key is not None:
+                missing_body[key] = sorted(box_levels)
+            missing_bodies.append(missing_body)
+    return missing_bodies
+
+
+def plan_requests(
+    body: dict, cached: list[tuple[str, dict]]
+) -> tuple[list[str], list[dict]]:
+    """Plans how to serve a request from cached files.
+
+    Arguments:
+        body (dict): call body of the new request
+        cached (list[tuple[str, dict]]): cached files, each with the call body used to download it
+
+    Returns:
+        The cached files to read, and the call bodies of the requests needed to download the missing data.
+        Missing data is grouped in boxes of contiguous dates, time values and levels.
+    """
+    dates, times, levels = request_coverage(body)
+    missing = {(time, level): set(dates) for time in times for level in levels}
+    sources = _use_cached(body, cached, missing)
+    missing_bodies = _missing_bodies(body, missing)
+    logger.debug(
+        "Request %s served by cached files %s and missing requests %s",
+        body,
+        sources,
+        missing_bodies,
+    )
+    return sources, missing_bodies
@@ -0,0 +1,113 @@
+"""This module collects classes to easily interact with EAC4 monthly averaged data downloaded from CAMS ADS."""
+# pylint: disable=too-few-public-methods
+# pylint: disable=too-many-arguments
+from __future__ import annotations
+
+import os
+from collections.abc import Callable
+from datetime import date, timedelta
+
+import numpy as np
+import xarray as xr
+
+from atmospheric_explorer.api.data_interface.cams_interface import CAMSDataInterface
+from atmospheric_explorer.api.data_interface.eac4.eac4 import EAC4Instance
+from atmospheric_explorer.api.data_interface.eac4.eac4_cache import dates_from_range
+from atmospheric_explorer.api.loggers import get_logger
+from atmospheric_explorer.api.os_manager import create_folder
+
+logger = get_logger("atmexp")
+
+
+class EAC4MonthlyInstance(EAC4Instance):
+    # pylint: disable=line-too-long
+    """Interface for CAMS global reanalysis (EAC4) monthly averaged fields dataset.
+
+    Data is requested with product type 'monthly_mean_by_hour_of_day', so that each time value keeps its own
+    monthly mean. Accepts the same parameters as EAC4Instance, dates_range is converted to years and months.
+    See https://ads.atmosphere.copernicus.eu/cdsapp#!/dataset/cams-global-reanalysis-eac4-monthly?tab=overview
+    for a full list of parameters and more details about the dataset.
+    """
+
+    dataset_name: str = "cams-global-reanalysis-eac4-monthly"
+    dataset_dir: str = os.path.join(CAMSDataInterface.data_folder, dataset_name)
+    product_type: str = "monthly_mean_by_hour_of_day"
+    chunks_by: str | None = "year"
+
+    @staticmethod
+    def supports_resampling(dates_range: str, resampling: str) -> bool:
+        """Returns True if data resampled to resampling over dates_range can be computed from monthly means.
+
+        This is the case for monthly or yearly resampling when dates_range only includes whole months.
+        """
+        if resampling not in ("1MS", "YS"):
+            return False
+        start, _, end = dates_range.partition("/")
+        start_date = date.fromisoformat(start)
+        end_date = date.fromisoformat(end) if end else start_date
+        return start_date.day == 1 and (end_date + timedelta(days=1)).day == 1
+
+    @property
+    def months_by_year(self: EAC4MonthlyInstance) -> dict[str, list[str]]:
+        """Months included in dates_range, grouped by year."""
+        months_by_year = {}
+        for day in dates_from_range(self.dates_range):
+            months_by_year.setdefault(f"{day.year}", set()).add(f"{day.month:02}")
+        return {year: sorted(months) for year, months in months_by_year.items()}
+
+    def _build_call_body(self: EAC4MonthlyInstance) -> dict:
+        """Builds the CDS API call body."""
+        call_body = super()._build_call_body()
+        call_body.pop("date")
+        months_by_year = self.months_by_year
+        call_body["product_type"] = self.product_type
+        call_body["year"] = sorted(months_by_year)
+        call_body["month"] = sorted(set().union(*months_by_year.values()))
+        return call_body
+
+    def _split_call_body(self: EAC4MonthlyInstance, body: dict) -> list[dict]:
+        """Splits the CDS API call body into one request per year, each one with only the months needed."""
+        if self.chunks_by == "year":
+            return [
+                {**body, "year": year, "month": months}
+                for year, months in sorted(self.months_by_year.items())
+            ]
+        return [body]
+
+    def download(self: EAC4MonthlyInstance) -> None:
+        """Downloads the dataset and saves it to file specified in filename.
+
+        Uses cdsapi to interact with CAMS ADS. Nothing is downloaded if the same data is already on disk.
+        If use_zarr is True, the downloaded file is converted to a zarr store.
+        """
+        # Cached 3-hourly requests cannot be reused for monthly means, skip EAC4Instance.download
+        self._source_files = None
+        create_folder(self.files_dir_path)
+        if not os.path.exists(self.stored_file_path):
+            super(EAC4Instance, self)._download(self.file_full_path)
+        if self.use_zarr and not os.path.exists(self.zarr_full_path):
+            self._convert_to_zarr()
+
+    def read_dataset(
+        self: EAC4MonthlyInstance,
+        chunks: dict[str, int] | str | None = None,
+        variables: str | list[str] | None = None,
+        levels: str | list[str] | None = None,
+        time_slice: slice | None = None,
+        preprocess: Callable[[xr.Dataset], xr.Dataset] | None = None,
+    ) -> xr.Dataset:
+        """Returns data as an xarray.Dataset, only including the months inside dates_range.
+
+        Accepts the same arguments as EAC4Instance.read_dataset.
+        """
+        dataset = self._open_file(self.stored_file_path, chunks)
+        start, _, end = self.dates_range.partition("/")
+        months = dataset["time"].values.astype("datetime64[M]")
+        dataset = dataset.isel(
+            time=(months >= np.datetime64(start, "M"))
+            & (months <= np.datetime64(end or start, "M"))
+        )
+        dataset = self._project_dataset(dataset, variables, levels, time_slice)
+        if preprocess is not None:
+            dataset = preprocess(dataset)
+        return self._simplify_dataset(dataset)
@@ -4,17 +4,21 @@
 from __future__ import annotations
 
 import os
+import shutil
+import tarfile
 import zipfile
 from datetime import datetime
 from glob import glob
+from io import BytesIO
 
 import numpy as np
+import pandas as pd
 import xarray as xr
 
 from atmospheric_explorer.api.config import CRS
 from atmospheric_explorer.api.data_interface.cams_interface import CAMSDataInterface
 from atmospheric_explorer.api.loggers import get_logger
-from atmospheric_explorer.api.os_manager import create_folder, remove_folder
+from atmospheric_explorer.api.os_manager import create_folder
 
 logger = get_logger("atmexp")
 
@@ -32,6 +36,7 @@ class InversionOptimisedGreenhouseGas(CAMSDataInterface):
     dataset_dir: str = os.path.join(CAMSDataInterface.data_folder, dataset_name)
     file_format = "zip"
     file_ext = "zip"
+    extract_files: bool = True
 
     def __init__(
         self: InversionOptimisedGreenhouseGas,
@@ -55,8 +60,9 @@ class InversionOptimisedGreenhouseGas(CAMSDataInterface):
             time_aggregation (str): time aggregation, can be one of ['instantaneous', 'daily_mean', 'monthly_mean']
             year (str | list[str]): single year or list of years, in 'YYYY' format
             month (str | list[str]): single month or list of months, in 'MM' format
-            filename (str | None): file where to save the data. If not provided will be built using file_format and
-                with a dinamically generated name
+            files_dir (str | None): folder where to save the data. If not provided, the folder is named after
+                the request cache key, so that identical requests reuse the same downloaded files.
+                The key follows changes to the request attributes, so that a changed request is downloaded again
             version (str): version of the dataset, default is 'latest'
         """
         super().__init__(data_variables)
@@ -66,30 +72,36 @@ class InversionOptimisedGreenhouseGas(CAMSDataInterface):
         self.year = year
         self.month = month
         self.version = version
-        self.files_dirname = files_dir if files_dir is not None else f"data_{self._id}"
-        self.files_dir_path = os.path.join(self.dataset_dir, self.files_dirname)
-        if os.path.exists(self.dataset_dir):
-            remove_folder(self.dataset_dir)
-        self.file_full_path = self.files_dirname
+        self.files_dir = files_dir
+        self._filename = None
         create_folder(self.files_dir_path)
         logger.info("Created folder %s", self.files_dir_path)
 
+    @property
+    def files_dirname(self: InversionOptimisedGreenhouseGas) -> str:
+        """Name of the data folder, i.e. files_dir if provided, otherwise the cache key of the current request."""
+        return self.files_dir if self.files_dir is not None else self.cache_key
+
+    @property
+    def files_dir_path(self: InversionOptimisedGreenhouseGas) -> str:
+        """Path of the data folder."""
+        return os.path.join(self.dataset_dir, self.files_dirname)
+
     @property
     def file_full_path(self: InversionOptimisedGreenhouseGas) -> str:
         """Name of the saved file."""
-        return self._file_full_path
+        filename = self.files_dirname if self._filename is None else self._filename
+        return os.path.join(self.files_dir_path, f"{filename}.{self.file_ext}")
 
     @file_full_path.setter
     def file_full_path(self: InversionOptimisedGreenhouseGas, filename: str) -> None:
-        """Name of the saved file."""
-        self._file_full_path = os.path.join(
-            self.files_dir_path, f"{filename}.{self.file_ext}"
-        )
+        """Name of the saved file, without folder and extension."""
+        self._filename = filename
 
     @property
     def year(self: InversionOptimisedGreenhouseGas) -> str | list[str]:
         """Year is internally represented as a set, use this property to set/get its value."""
-        return list(self._year) if isinstance(self._year, set) else self._year
+        return sorted(self._year) if isinstance(self._year, set) else self._year
 
     @year.setter
     def year(
@@ -102,7 +114,7 @@ class InversionOptimisedGreenhouseGas(CAMSDataInterface):
     @property
     def month(self: InversionOptimisedGreenhouseGas) -> str | list[str]:
         """Month is internally represented as a set, use this property to set/get its value."""
-        return list(self._month) if isinstance(self._month, set) else self._month
+        return sorted(self._month) if isinstance(self._month, set) else self._month
 
     @month.setter
     def month(
@@ -127,30 +139,119 @@ class InversionOptimisedGreenhouseGas(CAMSDataInterface):
         )
         return call_body
 
+    def _cache_body(self: InversionOptimisedGreenhouseGas) -> dict:
+        """Returns the CDS API call body without the format.
+
+        The format only sets how files are packed for download. It also changes to netcdf once the files
+        are extracted, while their folder must stay the same.
+        """
+        call_body = self._build_call_body()
+        call_body.pop("format")
+        return call_body
+
+    def _split_call_body(
+        self: InversionOptimisedGreenhouseGas, body: dict
+    ) -> list[dict]:
+        """Splits the CDS API call body into one request per year, downloaded concurrently."""
+        if isinstance(body["year"], str):
+            return [body]
+        return [{**body, "year": year} for year in body["year"]]
+
+    def _merge_chunks(
+        self: InversionOptimisedGreenhouseGas,
+        chunks_fullpaths: list[str],
+        file_fullpath: str,
+    ) -> None:
+        """Merges the zip or tar.gz files downloaded for each chunk into a single file."""
+        if self.file_format == "tar.gz":
+            with tarfile.open(file_fullpath, "w:gz") as merged_tar:
+                for chunk_fullpath in chunks_fullpaths:
+                    with tarfile.open(chunk_fullpath, "r:*") as chunk_tar:
+                        for member in chunk_tar.getmembers():
+                            merged_tar.addfile(member, chunk_tar.extractfile(member))
+            return
+        with zipfile.ZipFile(file_fullpath, "w") as merged_zip:
+            for chunk_fullpath in chunks_fullpaths:
+                with zipfile.ZipFile(chunk_fullpath, "r") as chunk_zip:
+                    for member in chunk_zip.namelist():
+                        with chunk_zip.open(member) as src, merged_zip.open(
+                            member, "w"
+                        ) as dst:
+                            shutil.copyfileobj(src, dst)
+
+    @staticmethod
+    def _extract_archive(archive_fullpath: str, folder: str) -> None:
+        """Extracts a zip or tar.gz file into folder."""
+        if zipfile.is_zipfile(archive_fullpath):
+            with zipfile.ZipFile(archive_fullpath, "r") as zip_ref:
+                zip_ref.extractall(folder)
+        else:
+            with tarfile.open(archive_fullpath, "r:*") as tar_ref:
+                tar_ref.extractall(folder)
+
+    @staticmethod
+    def _archive_members(archive_fullpath: str) -> dict[str, str]:
+        """Lists the netcdf files inside a zip or tar.gz file, without reading them.
+
+        Returns the members names inside the archive by file name.
+        """
+        if zipfile.is_zipfile(archive_fullpath):
+            with zipfile.ZipFile(archive_fullpath, "r") as zip_ref:
+                return {
+                    os.path.basename(member): member
+                    for member in zip_ref.namelist()
+                    if member.endswith(".nc")
+                }
+        with tarfile.open(archive_fullpath, "r:*") as tar_ref:
+            return {
+                os.path.basename(member.name): member.name
+                for member in tar_ref.getmembers()
+                if member.isfile() and member.name.endswith(".nc")
+            }
+
+    @staticmethod
+    def _read_archive(archive_fullpath: str, members: list[str]) -> list[BytesIO]:
+        """Reads some netcdf files inside a zip or tar.gz file into memory, without extracting them to disk."""
+        if zipfile.is_zipfile(archive_fullpath):
+            with zipfile.ZipFile(archive_fullpath, "r") as zip_ref:
+                return [BytesIO(zip_ref.read(member)) for member in members]
+        with tarfile.open(archive_fullpath, "r:*") as tar_ref:
+            return [BytesIO(tar_ref.extractfile(member).read()) for member in members]
+
     def download(self: InversionOptimisedGreenhouseGas) -> None:
         """Downloads the dataset and saves it to file specified in filename.
 
         Uses cdsapi to interact with CAMS ADS.
-        This function also extracts the netcdf file inside the zip file, which is then deleted.
+        If extract_files is True, this function also extracts the netcdf files inside the zip or tar.gz file,
+        which is then deleted. Otherwise the downloaded file is kept and read_dataset reads the netcdf files
+        directly from it. Nothing is downloaded if the same data has already been downloaded.
         """
-        super()._download(self.file_full_path)
-        # This dataset downloads zipfiles with possibly multiple netcdf files inside
-        # We must extract it
-        zip_filename = self.file_full_path
-        with zipfile.ZipFile(zip_filename, "r") as zip_ref:
-            self.file_format = "netcdf"
-            self.file_ext = "nc"
-            zip_ref.extractall(self.files_dir_path)
+        create_folder(self.files_dir_path)
+        archive_filename = self.file_full_path
+        extracted = glob(os.path.join(self.files_dir_path, "*.nc"))
+        if extracted and not os.path.exists(archive_filename):
+            logger.info(
+                "Found cached files in %s, skipping download", self.files_dir_path
+            )
+        else:
+            super()._download(archive_filename)
+            if not self.extract_files:
+                return
+            # This dataset downloads zipfiles with possibly multiple netcdf files inside
+            # We must extract it
+            self._extract_archive(archive_filename, self.files_dir_path)
             logger.info(
                 "Extracted file %s to folder %s",
-                self.file_full_path,
+                archive_filename,
                 self.files_dir_path,
             )
+            # Remove zip file only after extraction, so that an interrupted extraction is retried
+            os.remove(archive_filename)
+            logger.info("Removed %s", archive_filename)
+        self.file_format = "netcdf"
+        self.file_ext = "nc"
         self.file_full_path = "*"
         logger.info("Updated file_full_path to wildcard path %s", self.file_full_path)
-        # Remove zip file
-        os.remove(zip_filename)
-        logger.info("Removed %s", zip_filename)
 
     @staticmethod
     def _align_dims(dataset: xr.Dataset, dim: str, values: list) -> xr.Dataset:
@@ -160,10 +261,10 @@ class InversionOptimisedGreenhouseGas(CAMSDataInterface):
 
     def _simplify_dataset(self: InversionOptimisedGreenhouseGas, dataset: xr.Dataset):
         if self.data_variables == "methane":
-            dataset = dataset.drop(
-                ["longitude_bounds", "latitude_bounds", "time_bounds"]
+            dataset = dataset.drop_vars(
+                ["longitude_bounds", "latitude_bounds", "time_bounds"],
+                errors="ignore",
             )
-            dataset = dataset.rename({"cell_area": "area"})
         dataset = InversionOptimisedGreenhouseGas._align_dims(
             dataset,
             "time_aggregation",
@@ -176,29 +277,112 @@ class InversionOptimisedGreenhouseGas(CAMSDataInterface):
         )
         return dataset.rio.write_crs(CRS)
 
+    @staticmethod
+    def _file_date(file_fullpath: str) -> datetime:
+        """Returns the date of a file, parsed from its name ending in '_YYYYMM.nc'."""
+        return datetime.strptime(file_fullpath.split("_")[-1].split(".")[0], "%Y%m")
+
+    @staticmethod
+    def _preprocess(dataset: xr.Dataset, date_index: datetime) -> xr.Dataset:
+        """Adds the time dimension to a single file dataset, if missing.
+
+        Methane files name the cells area 'cell_area', it is renamed to 'area' as in other files.
+        """
+        if "cell_area" in dataset.variables:
+            dataset = dataset.rename({"cell_area": "area"})
+        return InversionOptimisedGreenhouseGas._align_dims(
+            dataset, "time", [date_index]
+        )
+
+    def _open_file(
+        self: InversionOptimisedGreenhouseGas,
+        file: str | BytesIO,
+        date_index: datetime,
+        chunks: dict[str, int] | str | None = None,
+        projection: dict | None = None,
+    ) -> xr.Dataset:
+        """Opens a single file, either from disk or from memory, adding the time dimension if missing.
+
+        Projection holds the variables, levels and time_slice arguments of read_dataset.
+        """
+        dataset = self._preprocess(xr.open_dataset(file, chunks=chunks), date_index)
+        return self._project_dataset(dataset, **(projection or {}))
+
     def read_dataset(
         self: InversionOptimisedGreenhouseGas,
+        chunks: dict[str, int] | str | None = None,
+        parallel: bool = False,
+        variables: str | list[str] | None = None,
+        levels: str | list[str] | None = None,
+        time_slice: slice | None = None,
     ) -> xr.Dataset:
         """Returns data as an xarray.Dataset.
 
         This function reads multi-file datasets where each file corresponds to a time variable,
-        but the file themselves may miss the time dimension. It adds a time dimension for each file
-        that's missing it and concats all files into a dataset.
+        but the file themselves may miss the time dimension. The date of each file is parsed from its name,
+        a time dimension is added to each file that's missing it and all files are concatenated at once.
+        If the files were not extracted after download, they are read in memory from the downloaded file.
+
+        Attributes:
+            chunks (dict[str, int] | str | None): if not None, data is read lazily as dask arrays
+                split into these chunks
+            parallel (bool): open files concurrently with dask, only used for extracted files
+            variables (str | list[str] | None): if not None, only read these variables, e.g. ['flux_apos', 'area']
+            levels (str | list[str] | None): if not None, only read these levels
+            time_slice (slice | None): if not None, only read files with dates inside this slice,
+                e.g. slice('2021-01', '2021-06')
         """
-        logger.debug("Reading files iteratively from path %s", self.file_full_path)
-        # Create dataset from first file
-        files = sorted(glob(self.file_full_path))
-        dataset = xr.open_dataset(files[0])
-        date_index = datetime.strptime(files[0].split("_")[-1].split(".")[0], "%Y%m")
-        dataset = self._align_dims(dataset, "time", [date_index])
-        for file in files[1:]:
-            # Merge remaining files
-            # ! This loop replaces xr.open_mfdataset(surface_data.file_full_path) that does not work
-            # (because time coordinate is not included in dataframe)
-            temp = xr.open_dataset(file)
-            date_index = datetime.strptime(file.split("_")[-1].split(".")[0], "%Y%m")
-            temp = self._align_dims(temp, "time", [date_index])
-            dataset = xr.combine_by_coords([dataset, temp], combine_attrs="override")
-        if isinstance(dataset, xr.DataArray):
-            dataset = dataset.to_dataset()
-        return self._simplify_dataset(dataset)
+        if self.file_format == "netcdf":
+            files = glob(self.file_full_path)
+        else:
+            # Files were not extracted, they are read from the downloaded file
+            members = self._archive_members(self.file_full_path)
+            files = list(members)
+        # Sorted by date, file names may not sort as their dates, e.g. with different versions
+        files = sorted(files, key=lambda file: (self._file_date(file), file))
+        dates = [self._file_date(file) for file in files]
+        if time_slice is not None:
+            # Files outside time_slice are not opened at all
+            selected = pd.DatetimeIndex(dates).slice_indexer(
+                time_slice.start, time_slice.stop
+            )
+            files, dates = files[selected], dates[selected]
+        if self.file_format != "netcdf":
+            # Only the selected files are read in memory
+            files = self._read_archive(
+                self.file_full_path, [members[file] for file in files]
+            )
+        projection = {
+            "variables": variables,
+            "levels": levels,
+            "time_slice": time_slice,
+        }
+        logger.debug("Reading %i files from path %s", len(files), self.file_full_path)
+        if parallel and self.file_format == "netcdf":
+            # Files are opened concurrently with dask, each file is matched to its date by path
+            dates_by_file = {
+                os.path.abspath(file): date for file, date in zip(files, dates)
+            }
+            dataset = xr.open_mfdataset(
+                files,
+                chunks=chunks or {},
+                preprocess=lambda ds: self._project_dataset(
+                    self._preprocess(
+                        ds, dates_by_file[os.path.abspath(ds.encoding["source"])]
+                    ),
+                    **projection,
+                ),
+                combine="nested",
+                concat_dim="time",
+                parallel=True,
+                combine_attrs="override",
+            )
+            if chunks is None:
+                dataset = dataset.load()
+        else:
+            datasets = [
+                self._open_file(file, date_index, chunks, projection)
+                for file, date_index in zip(files, dates)
+            ]
+            dataset = xr.concat(datasets, dim="time", combine_attrs="override")
+        return self._simplify_dataset(dataset.sortby("time"))
@@ -0,0 +1,90 @@
+"""Persistent cache of the masks obtained rasterizing selections on a data grid.
+
+Masks of entity selections (e.g. countries or continents) only depend on the data grid,
+the selection level and the entity label, hence they are saved on disk as .npy files
+and reused instead of rasterizing the same geometries again. The same holds for the label
+rasters of whole selection levels, saved as .npz files together with their labels.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+
+import numpy as np
+import xarray as xr
+
+from atmospheric_explorer.api.loggers import get_logger
+from atmospheric_explorer.api.os_manager import (
+    get_local_folder,
+    remove_folder,
+    temporary_path,
+)
+
+logger = get_logger("atmexp")
+
+masks_folder: str = os.path.join(get_local_folder(), "masks")
+
+
+def grid_key(data_frame: xr.Dataset | xr.DataArray) -> str:
+    """Hash of the latitude/longitude grid and CRS of data_frame."""
+    x_dim, y_dim = data_frame.rio.x_dim, data_frame.rio.y_dim
+    grid_hash = hashlib.sha256()
+    for dim in (y_dim, x_dim):
+        grid_hash.update(dim.encode())
+        grid_hash.update(np.ascontiguousarray(data_frame[dim].values, dtype="f8"))
+    grid_hash.update(str(data_frame.rio.crs).encode())
+    return grid_hash.hexdigest()
+
+
+def mask_path(grid: str, level: str, label: str) -> str:
+    """Path of the mask of an entity on a grid."""
+    label_key = hashlib.sha256(label.encode()).hexdigest()
+    return os.path.join(masks_folder, grid, level, f"{label_key}.npy")
+
+
+def load_mask(grid: str, level: str, label: str) -> np.ndarray | None:
+    """Returns the cached mask of an entity on a grid, memory-mapped, or None if not cached."""
+    path = mask_path(grid, level, label)
+    if not os.path.exists(path):
+        return None
+    logger.debug("Loading mask of %s %s from %s", level, label, path)
+    return np.load(path, mmap_mode="r")
+
+
+def save_mask(grid: str, level: str, label: str, mask: np.ndarray) -> None:
+    """Saves the mask of an entity on a grid."""
+    path = mask_path(grid, level, label)
+    # Write to a temporary file first, so that concurrent readers never see a partial mask
+    with temporary_path(path) as temp_path, open(temp_path, "wb") as file:
+        np.save(file, mask)
+    logger.debug("Saved mask of %s %s to %s", level, label, path)
+
+
+def label_raster_path(grid: str, level: str) -> str:
+    """Path of the label raster of a selection level on a grid."""
+    return os.path.join(masks_folder, grid, level, "label_raster.npz")
+
+
+def load_label_raster(grid: str, level: str) -> tuple[list[str], np.ndarray] | None:
+    """Returns the cached labels and label raster of a selection level on a grid, or None if not cached."""
+    path = label_raster_path(grid, level)
+    if not os.path.exists(path):
+        return None
+    logger.debug("Loading label raster of %s from %s", level, path)
+    with np.load(path) as data:
+        return data["labels"].tolist(), data["raster"]
+
+
+def save_label_raster(
+    grid: str, level: str, labels: list[str], raster: np.ndarray
+) -> None:
+    """Saves the labels and label raster of a selection level on a grid."""
+    path = label_raster_path(grid, level)
+    with temporary_path(path) as temp_path, open(temp_path, "wb") as file:
+        np.savez(file, labels=np.array(labels, dtype=str), raster=raster)
+    logger.debug("Saved label raster of %s to %s", level, path)
+
+
+def clear_masks() -> None:
+    """Removes all cached masks."""
+    remove_folder(masks_folder)
@@ -3,6 +3,9 @@
 import os
 import platform
 import shutil
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
 
 
 def get_local_folder():
@@ -25,3 +28,32 @@ def remove_folder(folder: str) -> None:
     """Remove folder if it exists."""
     if os.path.exists(folder):
         shutil.rmtree(folder)
+
+
+@contextmanager
+def temporary_path(path: str, directory: bool = False) -> Iterator[str]:
+    """Yields a new temporary file, or folder if directory is True, that replaces path when the block succeeds.
+
+    The temporary path is unique and next to path, so that concurrent writers never share it and readers
+    never see a partial file. It is removed if the block fails.
+    """
+    parent, name = os.path.split(path)
+    create_folder(parent or ".")
+    if directory:
+        temp_path = tempfile.mkdtemp(
+            dir=parent or None, prefix=f"{name}.", suffix=".part"
+        )
+    else:
+        file_descriptor, temp_path = tempfile.mkstemp(
+            dir=parent or None, prefix=f"{name}.", suffix=".part"
+        )
+        os.close(file_descriptor)
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.isdir(temp_path):
+            shutil.rmtree(temp_path)
+        elif os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -1,17 +1,30 @@
 """APIs for generating EAC4 anomalies time series plots."""
 from __future__ import annotations
 
+from datetime import date, timedelta
 from textwrap import dedent
 
 import plotly.graph_objects as go
 import xarray as xr
 
+from atmospheric_explorer.api.data_interface.climatology_cache import (
+    climatology_key,
+    load_climatology,
+    save_climatology,
+)
 from atmospheric_explorer.api.data_interface.data_transformations import (
-    clip_and_concat_shapes,
+    aggregate_selection,
+    resample_monthly_means,
+    resample_reduce,
+    selection_area,
     shifting_long,
     split_time_dim,
 )
-from atmospheric_explorer.api.data_interface.eac4 import EAC4Config, EAC4Instance
+from atmospheric_explorer.api.data_interface.eac4 import (
+    EAC4Config,
+    EAC4Instance,
+    EAC4MonthlyInstance,
+)
 from atmospheric_explorer.api.loggers import get_logger
 from atmospheric_explorer.api.plotting.plot_utils import line_with_ci_subplots
 from atmospheric_explorer.api.shape_selection.shape_selection import Selection
@@ -26,31 +39,142 @@ def _eac4_anomalies_data(
     time_values: str | list[str],
     shapes: Selection = Selection(),
     resampling: str = "1MS",
+    chunks: dict[str, int] | None = None,
 ) -> xr.Dataset:
     # pylint: disable=too-many-arguments
-    data = EAC4Instance(
+    # Monthly means are enough when resampling whole months, and much smaller to download
+    interface = (
+        EAC4MonthlyInstance
+        if EAC4MonthlyInstance.supports_resampling(dates_range, resampling)
+        else EAC4Instance
+    )
+    data = interface(
         data_variables=data_variable,
         dates_range=dates_range,
         time_values=time_values,
+        area=selection_area(shapes),
     )
     data.download()
-    df_down = data.read_dataset()
-    df_down = shifting_long(df_down)
-    if not shapes.empty():
-        df_down = clip_and_concat_shapes(df_down, shapes)
-    else:
-        df_down = df_down.expand_dims({"label": [""]})
-    df_agg = df_down.mean(dim=["latitude", "longitude"])
-    df_agg = split_time_dim(df_agg, "time")
-    df_agg = df_agg.resample(dates=resampling, restore_coord_dims=True).mean(
-        dim="dates"
+    df_down = data.read_dataset(
+        chunks=chunks, variables=var_name, preprocess=shifting_long
     )
-    df_agg = EAC4Config.convert_units_array(df_agg[var_name], data_variable)
+    # Means over all selected regions are computed at once
+    df_agg = aggregate_selection(df_down, shapes)
+    df_agg = split_time_dim(df_agg, "time")
+    if isinstance(data, EAC4MonthlyInstance):
+        df_agg = resample_monthly_means(df_agg, "dates", resampling)
+    else:
+        df_agg = resample_reduce(df_agg, "dates", resampling)
+    # Aggregated data is small, compute it once instead of at each access
+    df_agg = EAC4Config.convert_units_array(df_agg[var_name], data_variable).compute()
     if resampling == "YS":
         return df_agg.rename({"dates": "Year"})
     return df_agg.rename({"dates": "Month"})
 
 
+def _whole_periods_bounds(
+    dates_range: str, resampling: str
+) -> tuple[date, date] | None:
+    """First and last date of dates_range if it only includes whole resampling periods, else None."""
+    start, _, end = dates_range.partition("/")
+    start_date = date.fromisoformat(start)
+    end_date = date.fromisoformat(end) if end else start_date
+    next_date = end_date + timedelta(days=1)
+    if resampling not in ("1MS", "YS") or start_date.day != 1 or next_date.day != 1:
+        return None
+    if resampling == "YS" and not start_date.month == next_date.month == 1:
+        return None
+    return start_date, end_date
+
+
+def _shared_dates_range(
+    dates_range: str, reference_dates_range: str, resampling: str
+) -> str | None:
+    """Dates range covering both dates_range and reference_dates_range, if they can be processed together.
+
+    This is the case when they overlap or are adjacent and both only include whole resampling periods,
+    so that each period of the shared data is the same computed for a single dates range.
+    Returns None otherwise.
+    """
+    bounds = _whole_periods_bounds(dates_range, resampling)
+    reference_bounds = _whole_periods_bounds(reference_dates_range, resampling)
+    if bounds is None or reference_bounds is None:
+        return None
+    one_day = timedelta(days=1)
+    if (
+        bounds[0] > reference_bounds[1] + one_day
+        or reference_bounds[0] > bounds[1] + one_day
+    ):
+        return None
+    return (
+        f"{min(bounds[0], reference_bounds[0])}/{max(bounds[1], reference_bounds[1])}"
+    )
+
+
+def _eac4_anomalies_datasets(
+    data_variable: str,
+    var_name: str,
+    dates_range: str,
+    reference_dates_range: str,
+    time_values: str | list[str],
+    shapes: Selection = Selection(),
+    resampling: str = "1MS",
+    by_month: bool = False,
+    chunks: dict[str, int] | None = None,
+) -> tuple[xr.DataArray, xr.DataArray]:
+    """Data returned by _eac4_anomalies_data over dates_range and its mean over reference_dates_range.
+
+    The reference mean is optionally computed per calendar month. Reference means are cached on disk,
+    so that the reference period is downloaded and aggregated only once. If not cached and the two dates
+    ranges can be processed together, data is downloaded, clipped and resampled once for both of them.
+    """
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-locals
+    key = climatology_key(
+        shapes,
+        data_variable=data_variable,
+        var_name=var_name,
+        dates_range=reference_dates_range,
+        time_values=time_values,
+        resampling=resampling,
+        by_month=by_month,
+    )
+    params = {
+        "data_variable": data_variable,
+        "var_name": var_name,
+        "time_values": time_values,
+        "resampling": resampling,
+        "shapes": shapes,
+        "chunks": chunks,
+    }
+    reference_data = load_climatology(key)
+    if reference_data is not None:
+        return _eac4_anomalies_data(dates_range=dates_range, **params), reference_data
+    shared_dates_range = _shared_dates_range(
+        dates_range, reference_dates_range, resampling
+    )
+    time_dim = "Year" if resampling == "YS" else "Month"
+    if shared_dates_range is not None:
+        logger.debug("Processing dates range %s only once", shared_dates_range)
+        shared_data = _eac4_anomalies_data(dates_range=shared_dates_range, **params)
+        dataset = shared_data.sel({time_dim: slice(*dates_range.split("/"))})
+        reference_data = shared_data.sel(
+            {time_dim: slice(*reference_dates_range.split("/"))}
+        )
+    else:
+        dataset = _eac4_anomalies_data(dates_range=dates_range, **params)
+        reference_data = _eac4_anomalies_data(
+            dates_range=reference_dates_range, **params
+        )
+    with xr.set_options(keep_attrs=True):
+        if by_month:
+            reference_data = reference_data.groupby("Month.month").mean(dim="Month")
+        else:
+            reference_data = reference_data.mean(dim=time_dim)
+    save_climatology(key, reference_data)
+    return dataset, reference_data
+
+
 def eac4_anomalies_plot(
     data_variable: str,
     var_name: str,
@@ -60,8 +184,17 @@ def eac4_anomalies_plot(
     shapes: Selection = Selection(),
     reference_dates_range: str | None = None,
     resampling: str = "1MS",
+    chunks: dict[str, int] | None = None,
+    reference_by_month: bool = False,
 ) -> go.Figure:
-    """Generate a monthly anomaly plot for a quantity from the Global Reanalysis EAC4 dataset."""
+    """Generate a monthly anomaly plot for a quantity from the Global Reanalysis EAC4 dataset.
+
+    If chunks is not None, data is processed lazily in chunks, e.g. {"time": 248}, to limit memory usage.
+    Reference means over reference_dates_range are cached on disk. If reference_by_month is True,
+    monthly anomalies are computed against the reference mean of the same calendar month.
+    Values of each entity of an EntitySelection are means over the cells assigned to it by
+    aggregate_selection, while GenericShapeSelection values are means over all cells touched by the shapes.
+    """
     # pylint: disable=too-many-arguments
     logger.debug(
         dedent(
@@ -75,6 +208,8 @@ def eac4_anomalies_plot(
             shapes: %s
             reference_dates_range: %s
             resampling: %s
+            chunks: %s
+            reference_by_month: %s
             """
         ),
         data_variable,
@@ -85,40 +220,49 @@ def eac4_anomalies_plot(
         shapes,
         reference_dates_range,
         resampling,
+        chunks,
+        reference_by_month,
     )
-    dataset = _eac4_anomalies_data(
-        data_variable=data_variable,
-        var_name=var_name,
-        dates_range=dates_range,
-        time_values=time_values,
-        resampling=resampling,
-        shapes=shapes,
-    )
+    if reference_by_month and resampling != "1MS":
+        raise ValueError(
+            "Parameter reference_by_month can only be used with monthly resampling"
+        )
     if reference_dates_range is not None:
-        reference_data = _eac4_anomalies_data(
+        dataset, reference_data = _eac4_anomalies_datasets(
             data_variable=data_variable,
             var_name=var_name,
-            dates_range=reference_dates_range,
+            dates_range=dates_range,
+            reference_dates_range=reference_dates_range,
             time_values=time_values,
             resampling=resampling,
             shapes=shapes,
+            by_month=reference_by_month,
+            chunks=chunks,
         )
-        if resampling == "YS":
-            reference_data = reference_data.mean(dim="Year")
-        reference_data = reference_data.mean(dim="Month")
+        if reference_by_month:
+            # Reference mean of the calendar month of each month,
+            # missing for calendar months not included in reference_dates_range
+            reference_data = (
+                reference_data.reindex(month=range(1, 13))
+                .sel(month=dataset["Month.month"])
+                .drop_vars("month")
+            )
         with xr.set_options(keep_attrs=True):
             dataset_final = dataset - reference_data
             dataset_final.attrs = dataset.attrs
     else:
+        dataset = _eac4_anomalies_data(
+            data_variable=data_variable,
+            var_name=var_name,
+            dates_range=dates_range,
+            time_values=time_values,
+            resampling=resampling,
+            shapes=shapes,
+            chunks=chunks,
+        )
         dataset_final = dataset
-    # Pandas is easier to use for plotting
-    df_pandas = (
-        dataset_final.to_dataframe()
-        .reset_index(["label", "times"])
-        .rename({var_name: "value"}, axis=1)
-    )
     return line_with_ci_subplots(
-        dataset=df_pandas,
+        dataset=dataset_final,
         unit=dataset.attrs["units"],
         title=title,
         color="times",
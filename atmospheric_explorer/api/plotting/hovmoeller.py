@@ -8,9 +8,16 @@ import xarray as xr
 
 from atmospheric_explorer.api.data_interface.data_transformations import (
     clip_and_concat_shapes,
+    resample_monthly_means,
+    resample_reduce,
+    selection_area,
     shifting_long,
 )
-from atmospheric_explorer.api.data_interface.eac4 import EAC4Config, EAC4Instance
+from atmospheric_explorer.api.data_interface.eac4 import (
+    EAC4Config,
+    EAC4Instance,
+    EAC4MonthlyInstance,
+)
 from atmospheric_explorer.api.loggers import get_logger
 from atmospheric_explorer.api.plotting.plot_utils import hovmoeller_plot
 from atmospheric_explorer.api.shape_selection.shape_selection import Selection
@@ -27,28 +34,37 @@ def _eac4_hovmoeller_data(
     shapes: Selection = Selection(),
     pressure_level: list[str] | None = None,
     model_level: list[str] | None = None,
+    chunks: dict[str, int] | None = None,
 ) -> xr.Dataset:
     # pylint: disable=too-many-arguments
-    data = EAC4Instance(
+    # Monthly means are enough when resampling whole months, and much smaller to download
+    interface = (
+        EAC4MonthlyInstance
+        if EAC4MonthlyInstance.supports_resampling(dates_range, resampling)
+        else EAC4Instance
+    )
+    data = interface(
         data_variables=data_variable,
         dates_range=dates_range,
         time_values=time_values,
+        area=selection_area(shapes),
         pressure_level=pressure_level,
         model_level=model_level,
     )
     data.download()
-    df_down = data.read_dataset()
-    df_down = shifting_long(df_down)
+    df_down = data.read_dataset(
+        chunks=chunks, variables=var_name, preprocess=shifting_long
+    )
     if not shapes.empty():
         df_down = clip_and_concat_shapes(df_down, shapes)
     else:
         df_down = df_down.expand_dims({"label": [""]})
-    df_agg = (
-        df_down[var_name]
-        .resample(time=resampling, restore_coord_dims=True)
-        .mean(dim="time")
-        .mean(dim="longitude")
-    )
+    if isinstance(data, EAC4MonthlyInstance):
+        df_agg = resample_monthly_means(df_down[var_name], "time", resampling)
+    else:
+        df_agg = resample_reduce(df_down[var_name], "time", resampling)
+    # Aggregated data is small, compute it once instead of at each access
+    df_agg = df_agg.mean(dim="longitude").compute()
     if (pressure_level or model_level) is not None:
         df_agg = df_agg.mean(dim="latitude").sortby("level")
         df_agg = df_agg.assign_coords(
@@ -69,8 +85,15 @@ def eac4_hovmoeller_plot(
     shapes: Selection = Selection(),
     resampling: str = "1MS",
     base_colorscale: list[str] | None = None,
+    chunks: dict[str, int] | None = None,
+    max_columns: int | str | None = "auto",
 ) -> go.Figure:
-    """Generate a vertical Hovmoeller plot (levels vs time) for a quantity from the Global Reanalysis EAC4 dataset."""
+    """Generate a vertical Hovmoeller plot (levels vs time) for a quantity from the Global Reanalysis EAC4 dataset.
+
+    If chunks is not None, data is processed lazily in chunks, e.g. {"time": 248}, to limit memory usage.
+    Long time series are averaged along time so that each facet has no more than max_columns columns,
+    by default as many as the facet width in pixels, see hovmoeller_plot.
+    """
     # pylint: disable=too-many-arguments
     # pylint: disable=too-many-locals
     # pylint: disable=dangerous-default-value
@@ -88,6 +111,8 @@ def eac4_hovmoeller_plot(
             shapes: %s
             resampling: %s
             base_colorscale: %s
+            chunks: %s
+            max_columns: %s
             """
         ),
         data_variable,
@@ -100,6 +125,8 @@ def eac4_hovmoeller_plot(
         shapes,
         resampling,
         base_colorscale,
+        chunks,
+        max_columns,
     )
     df_converted = _eac4_hovmoeller_data(
         data_variable=data_variable,
@@ -110,6 +137,7 @@ def eac4_hovmoeller_plot(
         shapes=shapes,
         pressure_level=pressure_level,
         model_level=model_level,
+        chunks=chunks,
     )
     return hovmoeller_plot(
         df_converted,
@@ -117,4 +145,5 @@ def eac4_hovmoeller_plot(
         pressure_level=pressure_level,
         model_level=model_level,
         base_colorscale=base_colorscale,
+        max_columns=max_columns,
     )
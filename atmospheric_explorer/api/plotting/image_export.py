@@ -0,0 +1,201 @@
+"""Batch export of plotly figures to static images.
+
+Each call to plotly's write_image in a new process starts a kaleido renderer (a headless Chromium) first,
+which takes much longer than rendering a figure. RenderPool keeps a few renderers running and exports
+queues of figures with them concurrently, so that only the first images pay the startup.
+RenderPool.shared() is the pool used by export_images, its renderers stay warm between exports until the
+interpreter exits.
+"""
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import threading
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import plotly.graph_objects as go
+import plotly.io as pio
+from kaleido.scopes.plotly import PlotlyScope
+
+from atmospheric_explorer.api.loggers import get_logger
+from atmospheric_explorer.api.os_manager import temporary_path
+
+logger = get_logger("atmexp")
+
+IMAGE_FORMATS: tuple[str, ...] = ("png", "jpeg", "jpg", "webp", "svg", "pdf")
+
+
+def image_format(path: str, img_format: str | None = None) -> str:
+    """Returns img_format, or the format inferred from the extension of path if img_format is None."""
+    if img_format is None:
+        img_format = os.path.splitext(path)[1].lstrip(".") or "png"
+    img_format = img_format.lower()
+    if img_format not in IMAGE_FORMATS:
+        raise ValueError(
+            f"Unsupported image format {img_format}, supported formats are {IMAGE_FORMATS}"
+        )
+    return img_format
+
+
+def _new_scope() -> PlotlyScope:
+    """Kaleido scope configured like the one used by plotly.io."""
+    scope = PlotlyScope()
+    scope.plotlyjs = pio.kaleido.scope.plotlyjs
+    scope.mathjax = pio.kaleido.scope.mathjax
+    return scope
+
+
+def _shutdown_scope(scope: PlotlyScope) -> None:
+    """Stops the kaleido process of a scope, kaleido has no public API for this."""
+    scope._shutdown_kaleido()  # pylint: disable=protected-access
+
+
+class RenderPool:
+    """Pool of kaleido renderers exporting plotly figures to PNG, JPEG, WEBP, SVG or PDF files.
+
+    Each renderer is a separate kaleido process that stays alive until the pool is closed, one figure
+    at a time is rendered by each of them. The renderers are started by the pool and are never shared
+    with plotly.io, so that plotly's own write_image calls can run while the pool is exporting.
+
+    Attributes:
+        workers (int): number of renderers, i.e. number of figures rendered concurrently
+
+    Example:
+        with RenderPool(workers=4) as pool:
+            pool.export([(fig1, "fig1.png"), (fig2, "fig2.svg")])
+    """
+
+    _shared: RenderPool | None = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self: RenderPool, workers: int = 2):
+        """Initializes the pool, each renderer process is started when it renders its first figure.
+
+        Args:
+            workers (int): number of renderers, must be at least 1
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.workers = workers
+        self._scopes = [_new_scope() for _ in range(workers)]
+        self._idle = queue.SimpleQueue()
+        for scope in self._scopes:
+            self._idle.put(scope)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="kaleido"
+        )
+        logger.debug("Started render pool with %d workers", workers)
+
+    @classmethod
+    def shared(cls) -> RenderPool:
+        """Returns the pool shared by all exports of this process, creating it on first use.
+
+        The shared pool has the default number of workers and is closed at interpreter exit.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @classmethod
+    def close_shared(cls) -> None:
+        """Closes the shared pool, if any, the next call to shared creates a new one."""
+        with cls._shared_lock:
+            if cls._shared is not None:
+                cls._shared.close()
+                cls._shared = None
+
+    def __enter__(self: RenderPool) -> RenderPool:
+        """Returns the pool itself."""
+        return self
+
+    def __exit__(self: RenderPool, *args) -> None:
+        """Closes the pool."""
+        self.close()
+
+    def _write(
+        self: RenderPool,
+        fig_dict: dict,
+        path: str,
+        img_format: str,
+        width: int | None,
+        height: int | None,
+        scale: float | None,
+    ) -> str:
+        # pylint: disable=too-many-arguments
+        """Renders a figure with an idle renderer and writes it to path."""
+        scope = self._idle.get()
+        try:
+            image = scope.transform(
+                fig_dict, format=img_format, width=width, height=height, scale=scale
+            )
+        finally:
+            self._idle.put(scope)
+        # Write to a temporary file first, so that readers never see a partial image.
+        # Each export gets its own temporary file, also when two exports target the same path.
+        with temporary_path(path) as temp_path, open(temp_path, "wb") as file:
+            file.write(image)
+        logger.debug("Saved image to %s", path)
+        return path
+
+    def submit(
+        self: RenderPool,
+        fig: go.Figure,
+        path: str,
+        img_format: str | None = None,
+        width: int | None = None,
+        height: int | None = None,
+        scale: float | None = None,
+    ) -> Future:
+        # pylint: disable=too-many-arguments
+        """Queues the export of a figure to path and returns a future resolving to path.
+
+        The format is inferred from the extension of path if img_format is None. width, height and scale
+        default to the figure layout, as in plotly's write_image.
+        """
+        img_format = image_format(path, img_format)
+        # The figure is serialized now, so that it can be modified while the export is queued
+        fig_dict = fig.to_dict()
+        return self._executor.submit(
+            self._write, fig_dict, path, img_format, width, height, scale
+        )
+
+    def export(
+        self: RenderPool,
+        figures: Iterable[tuple[go.Figure, str]],
+        img_format: str | None = None,
+        width: int | None = None,
+        height: int | None = None,
+        scale: float | None = None,
+    ) -> list[str]:
+        # pylint: disable=too-many-arguments
+        """Exports (figure, path) pairs and returns the paths once all images are written.
+
+        Accepts the same arguments as submit, applied to all figures.
+        """
+        futures = [
+            self.submit(fig, path, img_format, width, height, scale)
+            for fig, path in figures
+        ]
+        return [future.result() for future in futures]
+
+    def close(self: RenderPool) -> None:
+        """Waits for queued exports and stops the renderers started by the pool."""
+        self._executor.shutdown(wait=True)
+        for scope in self._scopes:
+            _shutdown_scope(scope)
+        logger.debug("Closed render pool")
+
+
+atexit.register(RenderPool.close_shared)
+
+
+def export_images(figures: Iterable[tuple[go.Figure, str]], **kwargs) -> list[str]:
+    """Exports (figure, path) pairs to static images with the shared RenderPool.
+
+    All figures are queued at once on the warm renderers of the shared pool.
+    Keyword arguments are passed to RenderPool.export.
+    """
+    return RenderPool.shared().export(figures, **kwargs)
@@ -1,19 +1,23 @@
 """Plotting utilities."""
 from __future__ import annotations
 
-import re
+from collections.abc import Callable
 from math import ceil, log10
 
 import numpy as np
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import xarray as xr
+from plotly.subplots import make_subplots
 
 from atmospheric_explorer.api.loggers import get_logger
+from atmospheric_explorer.api.plotting.image_export import export_images
 
 logger = get_logger("atmexp")
 
+# Figures with more points than this are drawn with WebGL
+WEBGL_THRESHOLD: int = 5000
+
 
 def _base_height(n_plots):
     return 250 if n_plots >= 3 else 500
@@ -41,120 +45,203 @@ def hex_to_rgb(hex_color: str) -> tuple:
 
 
 def save_plotly_to_image(fig: go.Figure, path: str, img_format: str = "png") -> None:
-    """Saves plotly plot to static image."""
-    fig.to_image(path, format=img_format)
-
-
-def _add_ci(
-    fig: go.Figure,
-    trace: go.Figure,
-    dataset: pd.DataFrame,
-    labels: list[str],
-) -> None:
-    """Adds confidence intervals to a plotly trace."""
-    line_color = ",".join([str(n) for n in hex_to_rgb(trace.line.color)])
-    if len(labels) > 1:
-        regex = re.compile("label=(.+?)(?=<br>)")
-        label = regex.search(trace.hovertemplate)[1]
-    else:
-        label = labels[0]
-    label_index = labels.index(label)
-    total_rows = ceil(len(labels) / 2)
-    label_row = total_rows - label_index // 2
-    label_col = label_index % 2 + 1
-    df_label = dataset[dataset["label"] == label]
-    times = df_label.index.tolist()
-    fig.add_trace(
-        go.Scatter(
-            x=times,
-            y=df_label["lower"].to_list(),
-            line_color=f"rgba({line_color}, 0)",
+    """Saves plotly plot to static image, rendered by the shared RenderPool."""
+    export_images([(fig, path)], img_format=img_format)
+
+
+def lttb_indices(x_values: np.ndarray, y_values: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling to n_out points.
+
+    Points are split into n_out - 2 buckets between the first and the last one, which are always kept.
+    From each bucket, the point forming the largest triangle with the point kept from the previous bucket
+    and the mean of the next bucket is kept. Missing values are never kept.
+    """
+    valid = np.flatnonzero(~np.isnan(y_values))
+    if len(valid) <= max(n_out, 2):
+        return valid
+    if n_out < 3:
+        return valid[[0, -1]]
+    x_values = np.asarray(x_values)
+    if np.issubdtype(x_values.dtype, np.datetime64):
+        x_values = x_values.astype("datetime64[ns]").astype("int64")
+    x_values, y_values = x_values[valid].astype(float), y_values[valid]
+    edges = np.append(np.linspace(1, len(valid) - 1, n_out - 1).astype(int), len(valid))
+    selected = [0]
+    for start, end, next_end in zip(edges[:-2], edges[1:-1], edges[2:]):
+        previous = selected[-1]
+        next_x, next_y = x_values[end:next_end].mean(), y_values[end:next_end].mean()
+        areas = np.abs(
+            (x_values[previous] - next_x) * (y_values[start:end] - y_values[previous])
+            - (x_values[previous] - x_values[start:end]) * (next_y - y_values[previous])
+        )
+        selected.append(start + int(np.argmax(areas)))
+    selected.append(len(valid) - 1)
+    return valid[selected]
+
+
+def _keep_gaps(indices: np.ndarray, y_values: np.ndarray) -> np.ndarray:
+    """Adds to increasing downsampled indices the first missing value between consecutive kept points.
+
+    Lines are not drawn across missing values, so that data gaps stay visible after downsampling.
+    """
+    missing = np.flatnonzero(np.isnan(y_values))
+    if len(indices) < 2 or missing.size == 0:
+        return indices
+    first_missing = np.searchsorted(missing, indices[:-1])
+    in_range = first_missing < len(missing)
+    gaps = missing[first_missing[in_range]]
+    gaps = gaps[gaps < indices[1:][in_range]]
+    return np.union1d(indices, gaps)
+
+
+def _ci_traces(
+    times: np.ndarray,
+    lower: np.ndarray,
+    upper: np.ndarray,
+    color_name: str,
+    line_color: str,
+    showlegend: bool,
+    trace_type: type = go.Scatter,
+) -> list[go.Scatter | go.Scattergl]:
+    """Traces of a confidence interval band, filled between its lower and upper bounds."""
+    # pylint: disable=too-many-arguments
+    rgb = ",".join([str(n) for n in hex_to_rgb(line_color)])
+    common = {
+        "x": times,
+        "line_color": f"rgba({rgb}, 0)",
+        "fillcolor": f"rgba({rgb}, 0.2)",
+        "mode": "lines",
+        "name": f"CI {color_name}",
+        "legendgroup": f"CI {color_name}",
+        "hoverlabel": {"bgcolor": f"rgba({rgb}, 0.2)"},
+    }
+    return [
+        trace_type(
+            y=lower,
             fill=None,
-            fillcolor=f"rgba({line_color}, 0.2)",
             showlegend=False,
-            mode="lines",
-            name=f"CI {trace.legendgroup}",
-            legendgroup=f"CI {trace.legendgroup}",
             hovertemplate="Lower: %{y}<extra></extra>",
-            hoverlabel={"bgcolor": f"rgba({line_color}, 0.2)"},
+            **common,
         ),
-        row=label_row,
-        col=label_col,
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=times,
-            y=df_label["upper"].to_list(),
-            line_color=f"rgba({line_color}, 0)",
+        trace_type(
+            y=upper,
             fill="tonexty",
-            fillcolor=f"rgba({line_color}, 0.2)",
-            showlegend=False,
-            mode="lines",
-            name=f"CI {trace.legendgroup}",
-            legendgroup=f"CI {trace.legendgroup}",
-            hoverinfo="name+text+y",
+            showlegend=showlegend,
             hovertemplate="Upper: %{y}<extra></extra>",
-            hoverlabel={"bgcolor": f"rgba({line_color}, 0.2)"},
+            **common,
         ),
-        row=label_row,
-        col=label_col,
-    )
+    ]
 
 
 def line_with_ci_subplots(
-    dataset: pd.DataFrame,
+    dataset: xr.DataArray,
     unit: str,
     title: str,
     add_ci: bool = False,
     color: str | None = None,
+    max_points: int | None = 1000,
+    x_range: tuple | None = None,
 ) -> go.Figure:
     """Facet line plot on countries/administrative entinties.
 
     This function plots the yearly mean of a quantity along with its CI.
+    Traces are built directly from the data array, one line for each label and color.
+    Traces longer than max_points are downsampled with LTTB (see lttb_indices), their CI with the same points,
+    and figures with more than WEBGL_THRESHOLD points are drawn with WebGL. Downsampled traces keep a missing
+    value inside each data gap, so that lines break at gaps as with all points.
 
     Arguments:
-        dataset (pd.DataFrame): pandas dataframe with (at least) columns
-                                    'label','color','mean','lower','upper'
+        dataset (xr.DataArray): data array with dimensions 'label', the x axis dimension (e.g. 'Year'),
+                                    color if not None and, if add_ci is True, 'ci' with
+                                    coordinates 'lower', 'mean' and 'upper'
         unit (str): unit of measure
         title (str): plot title
         add_ci (bool): whether to add confidence interval to plot.
             Defaults to false
-        color (str): the dataset label to assign different colors to
+        color (str): the dataset dimension to assign different colors to
+        max_points (int | None): maximum number of points of each trace, None to plot all points
+        x_range (tuple | None): if not None, only plot data in this (start, end) range of the x axis,
+            so that a zoomed range is downsampled from full resolution data (see line_with_ci_resampler)
     """
-    labels = sorted(dataset["label"].unique())
-    colors = sorted(dataset[color].unique())
-    total_rows = ceil(len(labels) / 2)
-    if len(labels) > 1:
-        fig = px.line(
-            data_frame=dataset,
-            y="value",
-            color=color,
-            facet_col="label",
-            facet_col_wrap=(2 if len(labels) >= 2 else 1),
-            facet_col_spacing=0.04,
-            facet_row_spacing=_row_spacing(total_rows),
-            color_discrete_sequence=px.colors.qualitative.D3,
-            category_orders={f"{color}": colors, "label": labels},
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-locals
+    if color is None:
+        dataset = dataset.expand_dims(color=[""])
+        color = "color"
+    dataset = dataset.sortby(["label", color])
+    labels = [str(label) for label in dataset["label"].values]
+    colors = [str(c) for c in dataset[color].values]
+    (x_dim,) = set(dataset.dims) - {"label", color, "ci"}
+    if x_range is not None:
+        dataset = dataset.sel({x_dim: slice(*x_range)})
+    times = dataset[x_dim].values
+    if add_ci:
+        ci_index = list(dataset["ci"].values)
+        values = dataset.transpose("label", color, "ci", x_dim).values
+        means, lower, upper = (
+            values[:, :, ci_index.index(bound)] for bound in ("mean", "lower", "upper")
         )
     else:
-        fig = px.line(
-            data_frame=dataset,
-            y="value",
-            color=color,
-            color_discrete_sequence=px.colors.qualitative.D3,
-            category_orders={f"{color}": colors},
-        )
+        means = dataset.transpose("label", color, x_dim).values
+    # Points actually drawn, after downsampling
+    trace_points = len(times) if max_points is None else min(len(times), max_points)
+    n_points = means.shape[0] * means.shape[1] * trace_points
+    trace_type = go.Scattergl if n_points > WEBGL_THRESHOLD else go.Scatter
+    total_rows = ceil(len(labels) / 2)
+    total_cols = 2 if len(labels) > 1 else 1
+    fig = make_subplots(
+        rows=total_rows,
+        cols=total_cols,
+        subplot_titles=labels if len(labels) > 1 else None,
+        horizontal_spacing=0.04,
+        vertical_spacing=_row_spacing(total_rows),
+    )
+    line_colors = px.colors.qualitative.D3
+    for i, label in enumerate(labels):
+        position = {"row": i // 2 + 1, "col": i % 2 + 1}
+        for j, color_name in enumerate(colors):
+            line_color = line_colors[j % len(line_colors)]
+            points = slice(None)
+            if max_points is not None and len(times) > max_points:
+                points = _keep_gaps(
+                    lttb_indices(times, means[i, j], max_points), means[i, j]
+                )
+            fig.add_trace(
+                trace_type(
+                    x=times[points],
+                    y=means[i, j][points],
+                    mode="lines+markers",
+                    line_color=line_color,
+                    name=color_name,
+                    legendgroup=color_name,
+                    showlegend=i == 0,
+                    hovertemplate=(
+                        f"{color}={color_name}<br>label={label}<br>"
+                        f"{x_dim}=%{{x}}<br>value=%{{y}}<extra></extra>"
+                    ),
+                ),
+                **position,
+            )
+            if add_ci:
+                for trace in _ci_traces(
+                    times[points],
+                    lower[i, j][points],
+                    upper[i, j][points],
+                    color_name,
+                    line_color,
+                    i == 0,
+                    trace_type,
+                ):
+                    fig.add_trace(trace, **position)
     if len(colors) <= 1:
         fig.update_layout(showlegend=False)
-    fig.for_each_annotation(
-        lambda a: a.update(text=a.text.split("label=")[-1], font={"size": 14})
-    )
+    fig.update_annotations(font={"size": 14})
     fig.update_yaxes(title=unit, col=1)
-    fig.update_yaxes(showticklabels=True, matches=None)
-    fig.update_xaxes(showticklabels=True, matches=None)
-    if len(labels) % 2 != 0:
-        x_title = fig.layout["xaxis"]["title"]
-        fig.update_xaxes(title=x_title, col=2, row=2)
+    fig.update_yaxes(showticklabels=True)
+    fig.update_xaxes(showticklabels=True)
+    fig.update_xaxes(title=x_dim, row=total_rows, col=1)
+    if total_cols == 2:
+        fig.update_xaxes(title=x_dim, row=total_rows - len(labels) % 2, col=2)
     fig.update_layout(
         title={
             "text": title,
@@ -167,30 +254,29 @@ def line_with_ci_subplots(
         width=_base_width(),
         hovermode="closest",
     )
-    fig.update_traces(mode="lines+markers")
-    if add_ci:
-        fig.for_each_trace(
-            lambda tr: _add_ci(
-                fig,
-                tr,
-                dataset[dataset[color] == tr.legendgroup],
-                labels,
-            )
-        )
-        fig.update_traces(
-            selector=-2 * len(labels) - 1, showlegend=True
-        )  # legend for ci
-        fig.update_traces(selector=-1, showlegend=True)  # legend for ci
     return fig
 
 
+def line_with_ci_resampler(
+    dataset: xr.DataArray, **kwargs
+) -> Callable[[tuple | None], go.Figure]:
+    """Returns a callback that builds line_with_ci_subplots for an x axis range, e.g. after a zoom.
+
+    The callback keeps the full resolution dataset, so that each zoomed range is downsampled again
+    from all its points. kwargs are passed to line_with_ci_subplots.
+    """
+    return lambda x_range: line_with_ci_subplots(dataset, x_range=x_range, **kwargs)
+
+
 def sequential_colorscale_bar(
-    values: list[float] | list[int], colors: list[str]
+    values: list[float] | list[int] | np.ndarray, colors: list[str]
 ) -> tuple[list, dict]:
-    """Computes a sequential colorscale and colorbar form a list of values and a list of colors."""
-    vals = np.array(list(filter(lambda v: not (np.isnan(v)), values)))
-    vals.sort()
-    separators = np.linspace(vals.min(), vals.max(), len(colors) + 1)
+    """Computes a sequential colorscale and colorbar form a list or array of values and a list of colors.
+
+    Missing values are ignored.
+    """
+    values = np.asarray(values, dtype=float)
+    separators = np.linspace(np.nanmin(values), np.nanmax(values), len(colors) + 1)
     separators_scaled = np.linspace(0, 1, len(colors) + 1)
     color_scale_custom = []
     for i, color in enumerate(colors):
@@ -232,27 +318,118 @@ def sequential_colorscale_bar(
     return color_scale_custom, colorbar_custom
 
 
+def _hovmoeller_x_dim(dataset: xr.DataArray) -> str:
+    """Time dimension of a Hovmoeller dataset, i.e. the one that is not label, latitude or level."""
+    return next(d for d in dataset.dims if d not in ("label", "latitude", "level"))
+
+
+def hovmoeller_pyramid(
+    dataset: xr.DataArray, min_columns: int = 64
+) -> list[xr.DataArray]:
+    """Coarsened versions of a Hovmoeller dataset along its time dimension.
+
+    The first level is dataset itself, each following level averages pairs of columns of the previous one,
+    until levels have no more than min_columns columns. Missing values are not counted.
+    """
+    x_dim = _hovmoeller_x_dim(dataset)
+    levels = [dataset]
+    while levels[-1].sizes[x_dim] > min_columns:
+        levels.append(
+            levels[-1].coarsen({x_dim: 2}, boundary="pad").mean(keep_attrs=True)
+        )
+    return levels
+
+
+def _facet_columns(dataset: xr.DataArray) -> int:
+    """Width in pixels of each facet of the Hovmoeller plot of dataset, i.e. the number of columns it can show."""
+    return _base_width() // 2 if dataset.sizes["label"] > 1 else _base_width()
+
+
+def _pyramid_level(
+    levels: list[xr.DataArray], max_columns: int | str, x_range: tuple | None = None
+) -> xr.DataArray:
+    """Finest pyramid level with no more than max_columns columns inside x_range.
+
+    If max_columns is 'auto', it is the width of each facet, see _facet_columns.
+    """
+    x_dim = _hovmoeller_x_dim(levels[0])
+    if max_columns == "auto":
+        max_columns = _facet_columns(levels[0])
+    if x_range is not None:
+        levels = [level.sel({x_dim: slice(*x_range)}) for level in levels]
+    level = next(
+        (level for level in levels if level.sizes[x_dim] <= max_columns), levels[-1]
+    )
+    logger.debug("Hovmoeller plot with %i columns", level.sizes[x_dim])
+    return level
+
+
 def hovmoeller_plot(
-    dataset: xr.Dataset,
+    dataset: xr.DataArray,
     title: str,
     pressure_level: list[str] | None = None,
     model_level: list[str] | None = None,
     base_colorscale: list[str] | None = None,
+    max_columns: int | str | None = "auto",
+    x_range: tuple | None = None,
 ):
     """Hovmoeller plot on countries/administrative entinties.
 
     Arguments:
-        dataset (xr.Dataset): xarray dataset with (at least) dimension 'label'
+        dataset (xr.DataArray): xarray data array with (at least) dimension 'label'
         title (str): plot title
         pressure_level (list[str] | None): pressure levels, cannot be specified together with model_level
         model_level (list[str] | None): model levels, cannot be specified together with pressure_level
         base_colorscale (list[str] | None): color scale to be used for the z axis
+        max_columns (int | str | None): if not None, data is averaged along time (see hovmoeller_pyramid)
+            so that each facet has no more than max_columns columns. If 'auto', the default, the number
+            of columns fits the facets width in pixels
+        x_range (tuple | None): if not None, only plot data in this (start, end) time range,
+            e.g. after a zoom (see hovmoeller_resampler)
     """
-    labels = set(dataset.coords["label"].values)
+    # pylint: disable=too-many-arguments
+    if x_range is not None:
+        dataset = dataset.sel({_hovmoeller_x_dim(dataset): slice(*x_range)})
+    if max_columns == "auto":
+        max_columns = _facet_columns(dataset)
+    if max_columns is not None:
+        # The last pyramid level is the first one with no more than max_columns columns
+        dataset = hovmoeller_pyramid(dataset, min_columns=max_columns)[-1]
+    return _hovmoeller_figure(
+        dataset, title, pressure_level, model_level, base_colorscale
+    )
+
+
+def hovmoeller_resampler(
+    dataset: xr.DataArray, max_columns: int | str = "auto", **kwargs
+) -> Callable[[tuple | None], go.Figure]:
+    """Returns a callback that builds hovmoeller_plot for a time range, e.g. after a zoom.
+
+    The pyramid of coarsened data is computed once, then each call renders the finest level
+    with no more than max_columns columns inside the range, so that zooming in shows finer data.
+    max_columns is an integer or 'auto', as in hovmoeller_plot. kwargs are passed to hovmoeller_plot.
+    """
+    levels = hovmoeller_pyramid(dataset)
+    return lambda x_range: hovmoeller_plot(
+        _pyramid_level(levels, max_columns, x_range), max_columns=None, **kwargs
+    )
+
+
+def _hovmoeller_figure(
+    dataset: xr.DataArray,
+    title: str,
+    pressure_level: list[str] | None = None,
+    model_level: list[str] | None = None,
+    base_colorscale: list[str] | None = None,
+) -> go.Figure:
+    """Builds the Hovmoeller figure of hovmoeller_plot."""
+    labels = list(dict.fromkeys(dataset.coords["label"].values))
     mapping = {c: i for i, c in enumerate(labels)}
     mapping_inv = dict(enumerate(labels))
     # imshow need a int label for the facet plot
-    dataset = dataset.assign_coords(label=[mapping[c] for c in labels])
+    dataset = dataset.assign_coords(
+        label=[mapping[c] for c in dataset.coords["label"].values]
+    )
     total_rows = ceil(len(labels) / 2)
     if len(labels) > 1:
         fig = px.imshow(
@@ -265,7 +442,8 @@ def hovmoeller_plot(
         )
         fig.for_each_annotation(
             lambda a: a.update(
-                text=mapping_inv[int(a.text.split("label=")[-1])], font={"size": 14}
+                text=str(mapping_inv[int(a.text.split("label=")[-1])]),
+                font={"size": 14},
             )
         )
         fig.update_yaxes(showticklabels=True, matches=None)
@@ -287,9 +465,7 @@ def hovmoeller_plot(
         fig.update_yaxes(title="Latitude [degrees]", col=1)
         if base_colorscale is None:
             base_colorscale = px.colors.sequential.Turbo
-    colorscale, colorbar = sequential_colorscale_bar(
-        dataset.values.flatten(), base_colorscale
-    )
+    colorscale, colorbar = sequential_colorscale_bar(dataset.values, base_colorscale)
     if len(labels) % 2 != 0:
         fig.update_xaxes(title=fig.layout["xaxis"]["title"], col=2, row=2)
     fig.update_layout(
@@ -306,9 +482,7 @@ def hovmoeller_plot(
     )
     # Remove NANs from data inside the plot so that y axes are different
     for data in fig.data:
-        z_coord = data["z"]
-        mask = ~np.apply_along_axis(
-            lambda z: np.array([np.isnan(a) for a in z]).all(), 1, z_coord
-        )
+        z_coord = np.asarray(data["z"], dtype=float)
+        mask = ~np.isnan(z_coord).all(axis=1)
         data.update(**{"z": z_coord[mask], "y": data["y"][mask]})
     return fig
@@ -7,8 +7,8 @@ import plotly.graph_objects as go
 import xarray as xr
 
 from atmospheric_explorer.api.data_interface.data_transformations import (
-    clip_and_concat_shapes,
-    confidence_interval,
+    aggregate_selection,
+    resample_reduce,
 )
 from atmospheric_explorer.api.data_interface.ghg import (
     GHGConfig,
@@ -21,12 +21,12 @@ from atmospheric_explorer.api.shape_selection.shape_selection import Selection
 logger = get_logger("atmexp")
 
 
-def _ghg_flux_over_full_area(dataset: xr.Dataset, var_name: str):
-    dataset[var_name] = dataset[var_name] * dataset["area"]
-    dataset[var_name].attrs["units"] = (
-        dataset[var_name].attrs["units"].replace(" m-2", "")
+def _ghg_cells_area(dataset: xr.Dataset) -> xr.DataArray:
+    # Cells area is the same for all times and input observations
+    area = dataset["area"]
+    return area.isel(
+        {dim: 0 for dim in area.dims if dim not in ("latitude", "longitude")}
     )
-    return dataset
 
 
 def _ghg_surface_satellite_yearly_data(
@@ -36,8 +36,10 @@ def _ghg_surface_satellite_yearly_data(
     var_name: str,
     shapes: Selection = Selection(),
     add_satellite_observations: bool = False,
+    chunks: dict[str, int] | None = None,
 ) -> xr.DataArray | xr.Dataset:
     # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-locals
     # pylint: disable=invalid-name
     # Download surface data file
     logger.debug(
@@ -50,6 +52,7 @@ def _ghg_surface_satellite_yearly_data(
             var_name: %s
             shapes: %s
             add_satellite_observations: %s
+            chunks: %s
             """
         ),
         data_variable,
@@ -58,6 +61,7 @@ def _ghg_surface_satellite_yearly_data(
         var_name,
         shapes,
         add_satellite_observations,
+        chunks,
     )
     surface_data = InversionOptimisedGreenhouseGas(
         data_variables=data_variable,
@@ -68,8 +72,10 @@ def _ghg_surface_satellite_yearly_data(
         month=months,
     )
     surface_data.download()
+    # Only read the flux, and the cells area needed to compute the flux over the full area
+    variables = var_name if data_variable == "nitrous_oxide" else [var_name, "area"]
     # Read data as dataset
-    df_surface = surface_data.read_dataset()
+    df_surface = surface_data.read_dataset(chunks=chunks, variables=variables)
     df_surface = df_surface.squeeze(dim="time_aggregation")
     if add_satellite_observations:
         satellite_data = InversionOptimisedGreenhouseGas(
@@ -82,7 +88,7 @@ def _ghg_surface_satellite_yearly_data(
         )
         satellite_data.download()
         # Read data as dataset
-        df_satellite = satellite_data.read_dataset()
+        df_satellite = satellite_data.read_dataset(chunks=chunks, variables=variables)
         df_satellite = df_satellite.squeeze(dim="time_aggregation")
         df_total = xr.concat([df_surface, df_satellite], dim="input_observations")
     else:
@@ -95,38 +101,27 @@ def _ghg_surface_satellite_yearly_data(
     df_total = df_total.where(
         df_total["time.year"].isin([int(y) for y in years]), drop=True
     ).where(df_total["time.month"].isin([int(m) for m in months]), drop=True)
-    # Clip countries
-    if not shapes.empty():
-        df_total = clip_and_concat_shapes(df_total, shapes)
-    else:
-        df_total = df_total.expand_dims({"label": [""]})
     with xr.set_options(keep_attrs=True):
         if data_variable != "nitrous_oxide":
-            # Multiply fluxes over full area
-            df_total = _ghg_flux_over_full_area(df_total, var_name)
-            # Drop all values that are null over all coords, compute the mean of the remaining values over long and lat
-            df_total = df_total.sortby("time").sum(dim=["longitude", "latitude"])
-            da_converted_agg = (
-                df_total[var_name]
-                .resample(time="YS")
-                .map(confidence_interval, dim="time")
-                .rename({"time": "Year"})
+            # Sum fluxes over the full area of each region, all regions at once
+            da_total = aggregate_selection(
+                df_total[var_name],
+                shapes,
+                how="sum",
+                weights=_ghg_cells_area(df_total),
             )
-            da_converted_agg.name = var_name
-            da_converted_agg.attrs = df_total[var_name].attrs
-            da_converted_agg.attrs["units"] = "kg year-1"
+            units = "kg year-1"
         else:
-            df_total = df_total.sortby("time").mean(dim=["longitude", "latitude"])
-            da_converted_agg = (
-                df_total[var_name]
-                .resample(time="YS")
-                .map(confidence_interval, dim="time")
-                .rename({"time": "Year"})
-            )
-            da_converted_agg.name = var_name
-            da_converted_agg.attrs = df_total[var_name].attrs
-            da_converted_agg.attrs["units"] = "kg m-2 year-1"
-    # Pandas is easier to use for plotting
+            da_total = aggregate_selection(df_total[var_name], shapes, how="mean")
+            units = "kg m-2 year-1"
+        # Aggregated data is small, compute it once before computing confidence intervals
+        da_total = da_total.sortby("time").compute()
+        da_converted_agg = resample_reduce(da_total, "time", "YS", how="ci").rename(
+            {"time": "Year"}
+        )
+        da_converted_agg.name = var_name
+        da_converted_agg.attrs = da_total.attrs
+        da_converted_agg.attrs["units"] = units
     return da_converted_agg
 
 
@@ -138,10 +133,13 @@ def ghg_surface_satellite_yearly_plot(
     title: str,
     shapes: Selection = Selection(),
     add_satellite_observations: bool = True,
+    chunks: dict[str, int] | None = None,
 ) -> go.Figure:
     """Generates a yearly mean plot with CI for a quantity from the CAMS Global Greenhouse Gas Inversion dataset.
 
     Note that we are only considering **surface_flux** quantities in this function.
+    Values of each entity of an EntitySelection are computed over the cells assigned to it by
+    aggregate_selection, while GenericShapeSelection values are computed over all cells touched by the shapes.
 
     Arguments:
         data_variable (str): data variable (greenhouse gas) to be plotted.
@@ -158,6 +156,8 @@ def ghg_surface_satellite_yearly_plot(
         add_satellite_observations (bool): show 'satellite' input_observations
             data along with 'surface' (only available for carbon_dioxide data
             variable).
+        chunks (dict[str, int] | None): if not None, data is processed lazily in chunks,
+            e.g. {"time": 12}, to limit memory usage.
     """
     # pylint: disable=too-many-arguments
     # pylint: disable=too-many-locals
@@ -173,22 +173,21 @@ def ghg_surface_satellite_yearly_plot(
     var_name: {var_name}
     shapes: {shapes}
     add_satellite_observations: {add_satellite_observations}
+    chunks: {chunks}
     """
         )
     )
     da_converted_agg = _ghg_surface_satellite_yearly_data(
-        data_variable, years, months, var_name, shapes, add_satellite_observations
-    )
-    # Pandas is easier to use for plotting
-    df_pandas = (
-        da_converted_agg.to_dataframe()
-        .unstack("ci")
-        .droplevel(axis=1, level=0)
-        .reset_index(["label", "input_observations"])
-        .rename({"mean": "value"}, axis=1)
+        data_variable,
+        years,
+        months,
+        var_name,
+        shapes,
+        add_satellite_observations,
+        chunks,
     )
     return line_with_ci_subplots(
-        df_pandas,
+        da_converted_agg,
         da_converted_agg.attrs["units"],
         title,
         add_ci=True,
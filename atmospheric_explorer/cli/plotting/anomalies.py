@@ -10,7 +10,7 @@ from atmospheric_explorer.api.loggers import get_logger
 from atmospheric_explorer.api.plotting.anomalies import eac4_anomalies_plot
 from atmospheric_explorer.api.shape_selection.config import SelectionLevel
 from atmospheric_explorer.api.shape_selection.shape_selection import EntitySelection
-from atmospheric_explorer.cli.plotting.utils import comma_separated_list
+from atmospheric_explorer.cli.plotting.utils import comma_separated_list, save_images
 
 logger = get_logger("atmexp")
 
@@ -37,9 +37,14 @@ logger = get_logger("atmexp")
 @click.option("--title", required=True, type=str, help="Plot title")
 @click.option(
     "--output-file",
+    "output_files",
     required=True,
+    multiple=True,
     type=str,
-    help="Absolute path of the resulting image",
+    help="""\
+    Absolute path of the resulting image, the format is given by the extension (png, jpeg, webp, svg or pdf).
+    Multiple images can be saved calling this option multiple times, e.g. --output-file plot.png --output-file plot.svg.
+    """,
 )
 @click.option(
     "--reference-range",
@@ -93,7 +98,7 @@ def anomalies(
     dates_range,
     time_values,
     title,
-    output_file,
+    output_files,
     reference_range,
     entities,
     selection_level,
@@ -119,7 +124,7 @@ def anomalies(
             dates_range: %s
             time_values: %s
             title: %s
-            output_file: %s
+            output_files: %s
             reference_range: %s
             entities: %s
             selection_level: %s
@@ -133,7 +138,7 @@ def anomalies(
         dates_range,
         time_values,
         title,
-        output_file,
+        output_files,
         reference_range,
         entities,
         selection_level,
@@ -153,8 +158,4 @@ def anomalies(
         resampling=resampling,
         shapes=entities,
     )
-    if width is None:
-        width = fig.layout["width"]
-    if height is None:
-        height = fig.layout["height"]
-    fig.write_image(output_file, format="png", width=width, height=height, scale=scale)
+    save_images(fig, output_files, width, height, scale)
@@ -0,0 +1,40 @@
+"""\
+Batch plotting CLI.
+"""
+import shlex
+
+import click
+
+from atmospheric_explorer.api.loggers import get_logger
+
+logger = get_logger("atmexp")
+
+
+@click.command()
+@click.argument("commands_file", type=click.File("r"))
+@click.pass_context
+def batch(ctx, commands_file):
+    """CLI command to generate many plots in a single run.
+
+    Each line of COMMANDS_FILE is a plot command followed by its options, e.g.
+
+    \b
+    anomalies -v total_column_ozone -r 2021-01-01/2021-06-01 -t 00:00 --title Ozone --output-file ozone.png
+
+    Empty lines and lines starting with # are skipped.
+    All images are rendered by the same renderers, which are started only once.
+    """
+    group = ctx.parent.command
+    for line_number, line in enumerate(commands_file, start=1):
+        args = shlex.split(line, comments=True)
+        if not args:
+            continue
+        if args[0] == ctx.info_name:
+            raise click.UsageError(
+                f"Line {line_number}: batch commands cannot be nested"
+            )
+        logger.debug("Running batch line %d: %s", line_number, args)
+        with group.make_context(
+            ctx.parent.info_name, args, parent=ctx.parent
+        ) as line_ctx:
+            group.invoke(line_ctx)
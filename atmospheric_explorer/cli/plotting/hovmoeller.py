@@ -10,7 +10,7 @@ from atmospheric_explorer.api.loggers import get_logger
 from atmospheric_explorer.api.plotting.hovmoeller import eac4_hovmoeller_plot
 from atmospheric_explorer.api.shape_selection.config import SelectionLevel
 from atmospheric_explorer.api.shape_selection.shape_selection import EntitySelection
-from atmospheric_explorer.cli.plotting.utils import comma_separated_list
+from atmospheric_explorer.cli.plotting.utils import comma_separated_list, save_images
 
 logger = get_logger("atmexp")
 
@@ -34,9 +34,14 @@ logger = get_logger("atmexp")
 @click.option("--title", required=True, type=str, help="Plot title")
 @click.option(
     "--output-file",
+    "output_files",
     required=True,
+    multiple=True,
     type=str,
-    help="Absolute path of the resulting image",
+    help="""\
+    Absolute path of the resulting image, the format is given by the extension (png, jpeg, webp, svg or pdf).
+    Multiple images can be saved calling this option multiple times, e.g. --output-file plot.png --output-file plot.svg.
+    """,
 )
 @click.option(
     "--pressure-levels",
@@ -105,7 +110,7 @@ def hovmoeller(
     dates_range,
     time_value,
     title,
-    output_file,
+    output_files,
     pressure_levels,
     model_levels,
     entities,
@@ -134,7 +139,7 @@ def hovmoeller(
             dates_range: %s
             time_values: %s
             title: %s
-            output_file: %s
+            output_files: %s
             pressure_levels: %s
             model_levels: %s
             entities: %s
@@ -149,7 +154,7 @@ def hovmoeller(
         dates_range,
         time_value,
         title,
-        output_file,
+        output_files,
         pressure_levels,
         model_levels,
         entities,
@@ -171,8 +176,4 @@ def hovmoeller(
         shapes=entities,
         resampling=resampling,
     )
-    if width is None:
-        width = fig.layout["width"]
-    if height is None:
-        height = fig.layout["height"]
-    fig.write_image(output_file, format="png", width=width, height=height, scale=scale)
+    save_images(fig, output_files, width, height, scale)
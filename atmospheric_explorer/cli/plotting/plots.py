@@ -4,6 +4,7 @@ Plotting CLI entry point.
 import click
 
 from atmospheric_explorer.cli.plotting.anomalies import anomalies
+from atmospheric_explorer.cli.plotting.batch import batch
 from atmospheric_explorer.cli.plotting.hovmoeller import hovmoeller
 from atmospheric_explorer.cli.plotting.yearly_flux import yearly_flux
 
@@ -18,3 +19,4 @@ def plot():
 plot.add_command(anomalies)
 plot.add_command(hovmoeller)
 plot.add_command(yearly_flux)
+plot.add_command(batch)
@@ -1,9 +1,37 @@
 """\
 Utils for the CLI.
 """
+from __future__ import annotations
+
+import plotly.graph_objects as go
+
+from atmospheric_explorer.api.plotting.image_export import export_images
 
 
 def comma_separated_list(ctx, param, value: str) -> list:
     # pylint: disable=unused-argument
     """Convert a comma separated string into an actual list"""
     return value.strip().split(",") if len(value) > 1 else []
+
+
+def save_images(
+    fig: go.Figure,
+    output_files: tuple[str, ...],
+    width: int | None,
+    height: int | None,
+    scale: float | None,
+) -> None:
+    """Save a figure to each output file, with the format given by the file extension.
+
+    Images are rendered by the shared RenderPool, so that commands run by the same process reuse its renderers.
+    """
+    if width is None:
+        width = fig.layout["width"]
+    if height is None:
+        height = fig.layout["height"]
+    export_images(
+        [(fig, output_file) for output_file in output_files],
+        width=width,
+        height=height,
+        scale=scale,
+    )
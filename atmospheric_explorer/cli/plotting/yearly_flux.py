@@ -12,7 +12,7 @@ from atmospheric_explorer.api.plotting.yearly_flux import (
 )
 from atmospheric_explorer.api.shape_selection.config import SelectionLevel
 from atmospheric_explorer.api.shape_selection.shape_selection import EntitySelection
-from atmospheric_explorer.cli.plotting.utils import comma_separated_list
+from atmospheric_explorer.cli.plotting.utils import comma_separated_list, save_images
 
 logger = get_logger("atmexp")
 
@@ -71,7 +71,15 @@ def command_change_options():
 @click.option("--title", required=True, type=str, help="Plot title")
 @click.option("--var-name", required=True, type=str, help="Column name")
 @click.option(
-    "--output-file", required=True, type=str, help="Absolute path of the image file"
+    "--output-file",
+    "output_files",
+    required=True,
+    multiple=True,
+    type=str,
+    help="""\
+    Absolute path of the resulting image, the format is given by the extension (png, jpeg, webp, svg or pdf).
+    Multiple images can be saved calling this option multiple times, e.g. --output-file plot.png --output-file plot.svg.
+    """,
 )
 @click.option(
     "--entities",
@@ -113,7 +121,7 @@ def yearly_flux(
     months,
     title,
     var_name,
-    output_file,
+    output_files,
     entities,
     selection_level,
     satellite,
@@ -140,7 +148,7 @@ def yearly_flux(
             months: %s
             title: %s
             var_name: %s
-            output_file: %s
+            output_files: %s
             entities: %s
             selection_level: %s
             satellite: %s
@@ -154,7 +162,7 @@ def yearly_flux(
         months,
         title,
         var_name,
-        output_file,
+        output_files,
         entities,
         selection_level,
         satellite,
@@ -171,8 +179,4 @@ def yearly_flux(
         shapes=entities,
         add_satellite_observations=satellite,
     )
-    if width is None:
-        width = fig.layout["width"]
-    if height is None:
-        height = fig.layout["height"]
-    fig.write_image(output_file, format="png", width=width, height=height, scale=scale)
+    save_images(fig, output_files, width, height, scale)
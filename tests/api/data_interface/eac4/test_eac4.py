@@ -4,7 +4,56 @@
 # pylint: disable=protected-access
 # pylint: disable=unused-argument
 
+import os
+import threading
+
+import dask.array as da
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
 from atmospheric_explorer.api.data_interface.eac4 import EAC4Instance
+from atmospheric_explorer.api.data_interface.eac4.eac4_cache import (
+    dates_from_range,
+    request_coverage,
+)
+
+
+@pytest.fixture(name="fake_client")
+def fixture_fake_client(mocker, tmp_path):
+    """Fake cdsapi client that writes a small EAC4-like netcdf file for each request."""
+    # The netcdf library is not thread safe, while chunks are downloaded concurrently
+    lock = threading.Lock()
+
+    def _retrieve(name, body, path):
+        dates, times, _ = request_coverage(body)
+        time_index = pd.DatetimeIndex(
+            sorted(pd.Timestamp(f"{d} {t}") for d in dates for t in times)
+        )
+        timestamps = time_index.to_series()
+        values = timestamps.dt.dayofyear.values * 100 + timestamps.dt.hour.values
+        dataset = xr.Dataset(
+            {
+                "gtco3": (
+                    ["time", "latitude", "longitude"],
+                    np.broadcast_to(values[:, None, None], (len(values), 2, 2)),
+                )
+            },
+            coords={"time": time_index, "latitude": [1, 0], "longitude": [0, 1]},
+        )
+        with lock:
+            dataset.to_netcdf(path)
+
+    mocker.patch.object(EAC4Instance, "data_folder", str(tmp_path))
+    mocker.patch.object(
+        EAC4Instance, "dataset_dir", str(tmp_path / EAC4Instance.dataset_name)
+    )
+    mocked_client = mocker.patch(
+        "atmospheric_explorer.api.data_interface.cams_interface.cdsapi.Client"
+    )
+    mocked_client.return_value.retrieve.side_effect = _retrieve
+    return mocked_client.return_value
 
 
 def test__init():
@@ -84,3 +133,208 @@ def test__build_call_body():
         "pressure_level": sorted(["1", "2"]),
         "model_level": sorted(["1", "2"]),
     }
+
+
+def test_files_dir_cache():
+    obj1 = EAC4Instance(["a", "b"], "2021-01-01/2022-01-01", ["00:00", "03:00"])
+    obj2 = EAC4Instance(["b", "a"], "2021-01-01/2022-01-01", ["03:00", "00:00"])
+    obj3 = EAC4Instance(["a", "b"], "2021-01-01/2022-01-01", "00:00")
+    assert obj1.files_dir_path == obj2.files_dir_path
+    assert obj1.files_dir_path != obj3.files_dir_path
+    assert os.path.exists(obj1.files_dir_path)
+    assert os.path.exists(obj3.files_dir_path)
+
+
+def test_download_changed_request(fake_client):
+    obj = EAC4Instance("total_column_ozone", "2020-01-01/2020-01-31", "00:00")
+    obj.download()
+    assert fake_client.retrieve.call_count == 1
+    first_dir = obj.files_dir_path
+    obj.time_values = "03:00"
+    assert obj.files_dir_path != first_dir
+    obj.download()
+    # Data cached for 00:00 cannot serve 03:00, hence it is downloaded
+    assert fake_client.retrieve.call_count == 2
+    assert fake_client.retrieve.call_args[0][1]["time"] == "03:00"
+    assert (obj.read_dataset()["time"].dt.hour == 3).all()
+
+
+def test_download_superset(fake_client):
+    EAC4Instance(
+        "total_column_ozone", "2020-01-01/2020-12-31", ["00:00", "03:00"]
+    ).download()
+    assert fake_client.retrieve.call_count == 12
+    obj = EAC4Instance("total_column_ozone", "2020-01-01/2020-06-30", "03:00")
+    obj.download()
+    assert fake_client.retrieve.call_count == 12
+    dataset = obj.read_dataset()
+    assert len(dataset["time"]) == len(dates_from_range("2020-01-01/2020-06-30"))
+    assert (dataset["time"].dt.hour == 3).all()
+
+
+def test_download_superset_area(fake_client):
+    EAC4Instance("total_column_ozone", "2020-01-01/2020-01-31", "00:00").download()
+    obj = EAC4Instance(
+        "total_column_ozone", "2020-01-01/2020-01-31", "00:00", area=[1, 0, 0, 0]
+    )
+    obj.download()
+    fake_client.retrieve.assert_called_once()
+    dataset = obj.read_dataset()
+    assert dataset["longitude"].values.tolist() == [0]
+    assert sorted(dataset["latitude"].values.tolist()) == [0, 1]
+
+
+@pytest.mark.parametrize(
+    "area,expected",
+    [([10, 170, -10, -170], [-175, 175]), ([10, -100, -10, 100], [-90, 0, 90])],
+)
+def test_select_request_area(fake_client, area, expected):
+    obj = EAC4Instance("total_column_ozone", "2020-01-01", "00:00", area=area)
+    dataset = xr.Dataset(
+        {"gtco3": (["time", "latitude", "longitude"], np.zeros((1, 3, 5)))},
+        coords={
+            "time": pd.DatetimeIndex(["2020-01-01"]),
+            "latitude": [20, 0, -20],
+            "longitude": [0, 90, 175, 185, 270],
+        },
+    )
+    selected = obj._select_request(dataset)
+    assert selected["longitude"].values.tolist() == expected
+    assert selected["latitude"].values.tolist() == [0]
+
+
+def test_download_gap_fill(fake_client):
+    EAC4Instance("total_column_ozone", "2020-01-01/2020-03-31", "00:00").download()
+    obj = EAC4Instance("total_column_ozone", "2020-01-01/2020-06-30", "00:00")
+    obj.download()
+    assert sorted(c[0][1]["date"] for c in fake_client.retrieve.call_args_list[3:]) == [
+        "2020-04-01/2020-04-30",
+        "2020-05-01/2020-05-31",
+        "2020-06-01/2020-06-30",
+    ]
+    dataset = obj.read_dataset()
+    time_index = pd.DatetimeIndex(dataset["time"].values)
+    assert time_index.is_monotonic_increasing
+    assert len(time_index) == len(dates_from_range("2020-01-01/2020-06-30"))
+    assert (
+        dataset["gtco3"].isel(latitude=0, longitude=0).values
+        == dataset["time"].dt.dayofyear.values * 100
+    ).all()
+
+
+def test_gap_fill_subclass(fake_client, mocker):
+    class _EAC4Subclass(EAC4Instance):
+        pass
+
+    EAC4Instance("total_column_ozone", "2020-01-01/2020-03-31", "00:00").download()
+    init = mocker.spy(_EAC4Subclass, "__init__")
+    _EAC4Subclass("total_column_ozone", "2020-01-01/2020-04-30", "00:00").download()
+    # Missing data is downloaded by instances of the same class
+    assert init.call_count == 2
+    assert fake_client.retrieve.call_count == 4
+
+
+@pytest.mark.parametrize(
+    "chunks_by,expected_calls", [("month", 3), ("time", 2), (None, 1)]
+)
+def test_download_chunks(fake_client, chunks_by, expected_calls):
+    obj = EAC4Instance(
+        "total_column_ozone", "2020-01-15/2020-03-15", ["00:00", "03:00"]
+    )
+    obj.chunks_by = chunks_by
+    obj.download()
+    assert fake_client.retrieve.call_count == expected_calls
+    assert sorted(os.listdir(obj.files_dir_path)) == sorted(
+        [os.path.basename(obj.file_full_path), "request.json"]
+    )
+    time_index = pd.DatetimeIndex(obj.read_dataset()["time"].values)
+    assert time_index.is_monotonic_increasing
+    assert len(time_index) == 2 * len(dates_from_range("2020-01-15/2020-03-15"))
+
+
+def test_download_chunks_retry(fake_client):
+    retrieve = fake_client.retrieve.side_effect
+
+    def _failing_retrieve(name, body, path):
+        if body["date"].startswith("2020-02"):
+            raise RuntimeError("Request failed")
+        retrieve(name, body, path)
+
+    fake_client.retrieve.side_effect = _failing_retrieve
+    obj = EAC4Instance("total_column_ozone", "2020-01-01/2020-03-31", "00:00")
+    with pytest.raises(RuntimeError):
+        obj.download()
+    assert not os.path.exists(obj.file_full_path)
+    fake_client.retrieve.reset_mock()
+    fake_client.retrieve.side_effect = retrieve
+    obj.download()
+    fake_client.retrieve.assert_called_once()
+    assert fake_client.retrieve.call_args[0][1]["date"] == "2020-02-01/2020-02-29"
+    assert os.path.exists(obj.file_full_path)
+
+
+def test_download_zarr(fake_client):
+    obj = EAC4Instance("total_column_ozone", "2020-01-01/2020-02-29", "00:00")
+    obj.use_zarr = True
+    obj.download()
+    assert sorted(os.listdir(obj.files_dir_path)) == sorted(
+        [os.path.basename(obj.zarr_full_path), "request.json"]
+    )
+    assert obj.stored_file_path == obj.zarr_full_path
+    dataset = obj.read_dataset()
+    assert dataset["gtco3"].chunks is not None
+    assert dataset["gtco3"].encoding["chunks"] == (60, 2, 2)
+    time_index = pd.DatetimeIndex(dataset["time"].values)
+    assert len(time_index) == len(dates_from_range("2020-01-01/2020-02-29"))
+    assert (
+        dataset["gtco3"].isel(latitude=0, longitude=0).values
+        == dataset["time"].dt.dayofyear.values * 100
+    ).all()
+    obj.download()
+    assert fake_client.retrieve.call_count == 2
+
+
+def test_download_zarr_reuse(fake_client):
+    first = EAC4Instance("total_column_ozone", "2020-01-01/2020-01-31", "00:00")
+    first.use_zarr = True
+    first.download()
+    obj = EAC4Instance("total_column_ozone", "2020-01-01/2020-02-29", "00:00")
+    obj.use_zarr = True
+    obj.download()
+    assert fake_client.retrieve.call_count == 2
+    assert first.zarr_full_path in obj._source_files
+    time_index = pd.DatetimeIndex(obj.read_dataset()["time"].values)
+    assert time_index.is_monotonic_increasing
+    assert len(time_index) == len(dates_from_range("2020-01-01/2020-02-29"))
+
+
+@pytest.mark.parametrize("use_zarr", [False, True])
+def test_read_dataset_chunks(fake_client, use_zarr):
+    obj = EAC4Instance("total_column_ozone", "2020-01-01/2020-01-31", "00:00")
+    obj.use_zarr = use_zarr
+    obj.download()
+    dataset = obj.read_dataset(chunks={"time": 10})
+    assert isinstance(dataset["gtco3"].data, da.Array)
+    assert dataset["gtco3"].chunks[0] == (10, 10, 10, 1)
+    assert (dataset["gtco3"] == obj.read_dataset()["gtco3"]).all()
+
+
+def test_read_dataset_preprocess(fake_client, mocker):
+    EAC4Instance("total_column_ozone", "2020-01-01/2020-01-31", "00:00").download()
+    obj = EAC4Instance("total_column_ozone", "2020-01-01/2020-02-29", "00:00")
+    obj.download()
+    preprocess = mocker.Mock(side_effect=lambda dataset: dataset.assign(x=1))
+    dataset = obj.read_dataset(preprocess=preprocess)
+    assert preprocess.call_count == 2
+    assert (dataset["x"] == 1).all()
+
+
+def test_read_dataset_projection(fake_client):
+    EAC4Instance("total_column_ozone", "2020-01-01/2020-01-31", "00:00").download()
+    obj = EAC4Instance("total_column_ozone", "2020-01-01/2020-02-29", "00:00")
+    obj.download()
+    dataset = obj.read_dataset(
+        variables="gtco3", time_slice=slice("2020-01-20", "2020-02-10")
+    )
+    assert list(dataset.data_vars) == ["gtco3"]
+    assert len(dataset["time"]) == len(dates_from_range("2020-01-20/2020-02-10"))
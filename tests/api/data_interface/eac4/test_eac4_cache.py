@@ -0,0 +1,88 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+# pylint: disable=unused-argument
+from datetime import date
+
+from atmospheric_explorer.api.data_interface.eac4.eac4_cache import (
+    area_contains,
+    dates_from_range,
+    dates_to_ranges,
+    is_compatible,
+    plan_requests,
+)
+
+BODY = {
+    "format": "netcdf",
+    "variable": ["total_column_ozone"],
+    "date": "2020-01-01/2020-06-30",
+    "time": ["00:00", "03:00"],
+}
+
+
+def test_dates_from_range():
+    assert dates_from_range("2020-02-28/2020-03-01") == {
+        date(2020, 2, 28),
+        date(2020, 2, 29),
+        date(2020, 3, 1),
+    }
+    assert dates_from_range("2020-01-01") == {date(2020, 1, 1)}
+
+
+def test_dates_to_ranges():
+    dates = dates_from_range("2020-01-01/2020-01-10") - {date(2020, 1, 5)}
+    assert dates_to_ranges(dates) == ["2020-01-01/2020-01-04", "2020-01-06/2020-01-10"]
+
+
+def test_area_contains():
+    assert area_contains(None, None)
+    assert area_contains(None, [10, 0, 0, 10])
+    assert not area_contains([10, 0, 0, 10], None)
+    assert area_contains([10, 0, 0, 10], [5, 0, 0, 10])
+    assert not area_contains([10, 0, 0, 10], [5, -1, 0, 10])
+    assert area_contains([10, 170, -10, -170], [5, 175, -5, -175])
+    assert area_contains([10, 170, -10, -170], [5, -175, -5, -172])
+    assert area_contains([10, -180, -10, 180], [5, 175, -5, -175])
+    assert not area_contains([10, 100, -10, 175], [5, 170, -5, -170])
+    assert not area_contains([10, 170, -10, -170], [5, 0, -5, 10])
+
+
+def test_is_compatible():
+    assert is_compatible(BODY, {**BODY, "variable": ["total_column_ozone", "a"]})
+    assert not is_compatible(BODY, {**BODY, "variable": ["a"]})
+    assert not is_compatible(BODY, {**BODY, "area": [10, 0, 0, 10]})
+    assert is_compatible({**BODY, "area": [10, 0, 0, 10]}, BODY)
+    assert not is_compatible(BODY, {**BODY, "pressure_level": ["1000"]})
+
+
+def test_plan_requests_no_cache():
+    sources, missing = plan_requests(BODY, [])
+    assert not sources
+    assert missing == [BODY]
+
+
+def test_plan_requests_superset():
+    cached = [("superset.nc", {**BODY, "date": "2020-01-01/2020-12-31"})]
+    assert plan_requests(BODY, cached) == (["superset.nc"], [])
+
+
+def test_plan_requests_gap_fill():
+    cached = [
+        ("first.nc", {**BODY, "date": "2019-01-01/2020-03-31", "time": "00:00"}),
+        ("unrelated.nc", {**BODY, "date": "2021-01-01/2021-03-31"}),
+    ]
+    sources, missing = plan_requests(BODY, cached)
+    assert sources == ["first.nc"]
+    assert sorted(missing, key=lambda b: b["date"]) == [
+        {**BODY, "date": "2020-01-01/2020-06-30", "time": ["03:00"]},
+        {**BODY, "date": "2020-04-01/2020-06-30", "time": ["00:00"]},
+    ]
+
+
+def test_plan_requests_levels():
+    body = {**BODY, "pressure_level": ["1", "2"]}
+    cached = [("levels.nc", {**body, "pressure_level": ["1", "3"]})]
+    sources, missing = plan_requests(body, cached)
+    assert sources == ["levels.nc"]
+    assert missing == [{**body, "time": ["00:00", "03:00"], "pressure_level": ["2"]}]
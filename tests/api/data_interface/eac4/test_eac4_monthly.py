@@ -0,0 +1,73 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+# pylint: disable=unused-argument
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from atmospheric_explorer.api.data_interface.eac4 import EAC4MonthlyInstance
+
+
+@pytest.mark.parametrize(
+    "dates_range,resampling,expected",
+    [
+        ("2020-01-01/2020-12-31", "1MS", True),
+        ("2020-01-01/2020-02-29", "YS", True),
+        ("2020-01-02/2020-12-31", "1MS", False),
+        ("2020-01-01/2020-02-28", "1MS", False),
+        ("2020-01-01/2020-12-31", "1D", False),
+    ],
+)
+def test_supports_resampling(dates_range, resampling, expected):
+    assert EAC4MonthlyInstance.supports_resampling(dates_range, resampling) is expected
+
+
+def test__build_call_body():
+    obj = EAC4MonthlyInstance(
+        "total_column_ozone",
+        "2020-11-01/2021-02-28",
+        ["00:00", "03:00"],
+        pressure_level=["1000"],
+    )
+    assert obj._build_call_body() == {
+        "format": "netcdf",
+        "variable": "total_column_ozone",
+        "product_type": "monthly_mean_by_hour_of_day",
+        "year": ["2020", "2021"],
+        "month": ["01", "02", "11", "12"],
+        "time": ["00:00", "03:00"],
+        "pressure_level": ["1000"],
+    }
+
+
+def test__split_call_body():
+    obj = EAC4MonthlyInstance("total_column_ozone", "2020-11-01/2021-02-28", "00:00")
+    chunks = obj._split_call_body(obj._build_call_body())
+    assert [(c["year"], c["month"]) for c in chunks] == [
+        ("2020", ["11", "12"]),
+        ("2021", ["01", "02"]),
+    ]
+
+
+def test_read_dataset(mocker, tmp_path):
+    obj = EAC4MonthlyInstance("total_column_ozone", "2020-11-01/2021-02-28", "00:00")
+    file_full_path = str(tmp_path / "test.nc")
+    mocker.patch.object(
+        EAC4MonthlyInstance,
+        "file_full_path",
+        new_callable=mocker.PropertyMock,
+        return_value=file_full_path,
+    )
+    time_index = pd.date_range("2020-01-01", "2021-12-01", freq="MS")
+    xr.Dataset(
+        {"gtco3": (["time"], np.arange(len(time_index), dtype=float))},
+        coords={"time": time_index},
+    ).to_netcdf(file_full_path)
+    dataset = obj.read_dataset()
+    assert (
+        pd.DatetimeIndex(dataset["time"].values)
+        == pd.date_range("2020-11-01", "2021-02-01", freq="MS")
+    ).all()
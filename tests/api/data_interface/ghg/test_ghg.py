@@ -4,6 +4,17 @@
 # pylint: disable=protected-access
 # pylint: disable=unused-argument
 
+import io
+import os
+import tarfile
+import zipfile
+
+import dask.array as da
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
 from atmospheric_explorer.api.data_interface.ghg import InversionOptimisedGreenhouseGas
 
 
@@ -78,3 +89,237 @@ def test__build_call_body():
         "month": sorted(["01", "02"]),
         "version": "latest",
     }
+
+
+def test_download_cache(mocker, tmp_path):
+    def _create_zip(name, body, path):
+        with zipfile.ZipFile(path, "w") as zip_ref:
+            zip_ref.writestr("test_202101.nc", "")
+
+    mocked_client = mocker.patch(
+        "atmospheric_explorer.api.data_interface.cams_interface.cdsapi.Client"
+    )
+    mocked_client.return_value.retrieve.side_effect = _create_zip
+    mocker.patch.object(InversionOptimisedGreenhouseGas, "dataset_dir", str(tmp_path))
+    for _ in range(2):
+        obj = InversionOptimisedGreenhouseGas(
+            "a", "quantity", "input_observations", "time_aggregation", "2021", "01"
+        )
+        obj.download()
+        assert obj.file_full_path == os.path.join(obj.files_dir_path, "*.nc")
+    mocked_client.return_value.retrieve.assert_called_once()
+    assert sorted(os.listdir(obj.files_dir_path)) == ["request.json", "test_202101.nc"]
+
+
+def test_download_changed_request(mocker, tmp_path):
+    def _create_zip(name, body, path):
+        with zipfile.ZipFile(path, "w") as zip_ref:
+            zip_ref.writestr(f"test_{body['year']}01.nc", "")
+
+    mocked_client = mocker.patch(
+        "atmospheric_explorer.api.data_interface.cams_interface.cdsapi.Client"
+    )
+    mocked_client.return_value.retrieve.side_effect = _create_zip
+    mocker.patch.object(InversionOptimisedGreenhouseGas, "dataset_dir", str(tmp_path))
+    InversionOptimisedGreenhouseGas(
+        "a", "quantity", "input_observations", "time_aggregation", "2021", "01"
+    ).download()
+    obj = InversionOptimisedGreenhouseGas(
+        "a", "quantity", "input_observations", "time_aggregation", "2021", "01"
+    )
+    obj.year = "2022"
+    obj.download()
+    # The changed request is downloaded to its own folder, instead of reusing the 2021 files
+    assert mocked_client.return_value.retrieve.call_count == 2
+    assert mocked_client.return_value.retrieve.call_args[0][1]["year"] == "2022"
+    assert obj.file_full_path == os.path.join(obj.files_dir_path, "*.nc")
+    assert sorted(os.listdir(obj.files_dir_path)) == ["request.json", "test_202201.nc"]
+
+
+def test_download_chunks(mocker, tmp_path):
+    def _create_zip(name, body, path):
+        with zipfile.ZipFile(path, "w") as zip_ref:
+            zip_ref.writestr(f"test_{body['year']}01.nc", "")
+
+    mocked_client = mocker.patch(
+        "atmospheric_explorer.api.data_interface.cams_interface.cdsapi.Client"
+    )
+    mocked_client.return_value.retrieve.side_effect = _create_zip
+    mocker.patch.object(InversionOptimisedGreenhouseGas, "dataset_dir", str(tmp_path))
+    obj = InversionOptimisedGreenhouseGas(
+        "a",
+        "quantity",
+        "input_observations",
+        "time_aggregation",
+        ["2020", "2021"],
+        "01",
+    )
+    obj.download()
+    assert mocked_client.return_value.retrieve.call_count == 2
+    assert sorted(os.listdir(obj.files_dir_path)) == [
+        "request.json",
+        "test_202001.nc",
+        "test_202101.nc",
+    ]
+
+
+def _monthly_dataset(date):
+    return xr.Dataset(
+        {
+            "flux_apos": (
+                ["latitude", "longitude"],
+                np.full((2, 3), date.year * 100 + date.month),
+            ),
+            "flux_apri": (["latitude", "longitude"], np.zeros((2, 3))),
+            "area": (["latitude", "longitude"], np.ones((2, 3))),
+        },
+        coords={"latitude": [0, 1], "longitude": [0, 1, 2]},
+    )
+
+
+def _monthly_filename(date):
+    return f"cams73_latest_co2_flux_{date.strftime('%Y%m')}.nc"
+
+
+def _check_dataset(dataset, dates):
+    assert (dataset["time"].values == dates.values).all()
+    assert (
+        dataset["flux_apos"].isel(latitude=0, longitude=0).squeeze().values
+        == dates.year * 100 + dates.month
+    ).all()
+
+
+@pytest.mark.parametrize("chunks,parallel", [(None, False), (None, True), ({}, True)])
+def test_read_dataset(tmp_path, chunks, parallel):
+    obj = InversionOptimisedGreenhouseGas(
+        "carbon_dioxide",
+        "surface_flux",
+        "surface",
+        "monthly_mean",
+        ["2020", "2021"],
+        ["01", "02", "03"],
+        files_dir=str(tmp_path),
+    )
+    dates = pd.date_range("2020-01-01", "2020-03-01", freq="MS").append(
+        pd.date_range("2021-01-01", "2021-03-01", freq="MS")
+    )
+    for date in reversed(dates):
+        _monthly_dataset(date).to_netcdf(tmp_path / _monthly_filename(date))
+    obj.file_format = "netcdf"
+    obj.file_ext = "nc"
+    obj.file_full_path = "*"
+    dataset = obj.read_dataset(chunks=chunks, parallel=parallel)
+    _check_dataset(dataset, dates)
+    assert isinstance(dataset["flux_apos"].data, da.Array) == (chunks is not None)
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_read_dataset_projection(mocker, tmp_path, parallel):
+    obj = InversionOptimisedGreenhouseGas(
+        "carbon_dioxide",
+        "surface_flux",
+        "surface",
+        "monthly_mean",
+        "2020",
+        ["01", "02", "03", "04"],
+        files_dir=str(tmp_path),
+    )
+    dates = pd.date_range("2020-01-01", "2020-04-01", freq="MS")
+    for date in dates:
+        _monthly_dataset(date).to_netcdf(tmp_path / _monthly_filename(date))
+    obj.file_format = "netcdf"
+    obj.file_ext = "nc"
+    obj.file_full_path = "*"
+    open_dataset = mocker.patch(
+        "atmospheric_explorer.api.data_interface.ghg.ghg.xr.open_dataset",
+        wraps=xr.open_dataset,
+    )
+    dataset = obj.read_dataset(
+        parallel=parallel,
+        variables=["flux_apos", "area"],
+        time_slice=slice("2020-02", "2020-03"),
+    )
+    assert sorted(dataset.data_vars) == ["area", "flux_apos"]
+    _check_dataset(dataset, dates[1:3])
+    if not parallel:
+        # Files outside time_slice are not opened
+        assert [os.path.basename(c[0][0]) for c in open_dataset.call_args_list] == [
+            _monthly_filename(date) for date in dates[1:3]
+        ]
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_read_dataset_unsorted(tmp_path, parallel):
+    obj = InversionOptimisedGreenhouseGas(
+        "carbon_dioxide",
+        "surface_flux",
+        "surface",
+        "monthly_mean",
+        "2020",
+        ["01", "02", "03", "04"],
+        files_dir=str(tmp_path),
+    )
+    dates = pd.date_range("2020-01-01", "2020-04-01", freq="MS")
+    # File names sort as 2020-03, 2020-04, 2020-01, 2020-02
+    for date, version in zip(dates, ["v22r2", "v22r2", "latest", "latest"]):
+        _monthly_dataset(date).to_netcdf(
+            tmp_path / _monthly_filename(date).replace("latest", version)
+        )
+    obj.file_format = "netcdf"
+    obj.file_ext = "nc"
+    obj.file_full_path = "*"
+    _check_dataset(obj.read_dataset(parallel=parallel), dates)
+    dataset = obj.read_dataset(
+        parallel=parallel, time_slice=slice("2020-02", "2020-03")
+    )
+    _check_dataset(dataset, dates[1:3])
+
+
+@pytest.mark.parametrize("file_format", ["zip", "tar.gz"])
+@pytest.mark.parametrize("extract_files", [True, False])
+def test_read_dataset_archive(mocker, tmp_path, file_format, extract_files):
+    def _create_archive(name, body, path):
+        dates = pd.date_range(f"{body['year']}-01-01", periods=2, freq="MS")
+        if file_format == "zip":
+            with zipfile.ZipFile(path, "w") as zip_ref:
+                for date in dates:
+                    zip_ref.writestr(
+                        _monthly_filename(date), _monthly_dataset(date).to_netcdf()
+                    )
+        else:
+            with tarfile.open(path, "w:gz") as tar_ref:
+                for date in dates:
+                    content = _monthly_dataset(date).to_netcdf()
+                    info = tarfile.TarInfo(_monthly_filename(date))
+                    info.size = len(content)
+                    tar_ref.addfile(info, io.BytesIO(content))
+
+    mocked_client = mocker.patch(
+        "atmospheric_explorer.api.data_interface.cams_interface.cdsapi.Client"
+    )
+    mocked_client.return_value.retrieve.side_effect = _create_archive
+    mocker.patch.object(InversionOptimisedGreenhouseGas, "dataset_dir", str(tmp_path))
+    mocker.patch.object(InversionOptimisedGreenhouseGas, "file_format", file_format)
+    mocker.patch.object(InversionOptimisedGreenhouseGas, "file_ext", file_format)
+    mocker.patch.object(InversionOptimisedGreenhouseGas, "extract_files", extract_files)
+    obj = InversionOptimisedGreenhouseGas(
+        "carbon_dioxide",
+        "surface_flux",
+        "surface",
+        "monthly_mean",
+        ["2020", "2021"],
+        ["01", "02"],
+    )
+    obj.download()
+    assert mocked_client.return_value.retrieve.call_count == 2
+    nc_files = [f for f in os.listdir(obj.files_dir_path) if f.endswith(".nc")]
+    assert len(nc_files) == (4 if extract_files else 0)
+    dates = pd.DatetimeIndex(["2020-01-01", "2020-02-01", "2021-01-01", "2021-02-01"])
+    _check_dataset(obj.read_dataset(), dates)
+    read_archive = mocker.spy(InversionOptimisedGreenhouseGas, "_read_archive")
+    _check_dataset(obj.read_dataset(time_slice=slice("2020-02", "2021-01")), dates[1:3])
+    if not extract_files:
+        # Files outside time_slice are not read from the archive
+        assert read_archive.call_args[0][1] == [
+            _monthly_filename(date) for date in dates[1:3]
+        ]
@@ -4,13 +4,20 @@
 # pylint: disable=protected-access
 # pylint: disable=unused-argument
 
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
 from atmospheric_explorer.api.data_interface.cams_interface import CAMSDataInterface
 
 
 class CAMSDataInterfaceTesting(CAMSDataInterface):
     """Mock class used to instantiate CAMSDataInterface so that it can be tested"""
 
-    def read_dataset(self: CAMSDataInterface):
+    def read_dataset(self: CAMSDataInterface, chunks=None):
         pass
 
 
@@ -34,3 +41,70 @@ def test__build_call_body():
     res = obj._build_call_body()
     res["variable"] = sorted(res["variable"])
     assert res == {"format": None, "variable": sorted(["a", "b", "c"])}
+
+
+def test_cache_key():
+    obj1 = CAMSDataInterfaceTesting(["a", "b", "c"])
+    obj2 = CAMSDataInterfaceTesting(["c", "b", "a"])
+    obj3 = CAMSDataInterfaceTesting(["a", "b"])
+    assert obj1.cache_key == obj2.cache_key
+    assert obj1.cache_key != obj3.cache_key
+
+
+def test__download(mocker, tmp_path):
+    mocked_client = mocker.patch(
+        "atmospheric_explorer.api.data_interface.cams_interface.cdsapi.Client"
+    )
+    mocked_client.return_value.retrieve.side_effect = lambda name, body, path: Path(
+        path
+    ).touch()
+    obj = CAMSDataInterfaceTesting({"a", "b", "c"})
+    file_fullpath = str(tmp_path / "test.nc")
+    obj._download(file_fullpath)
+    obj._download(file_fullpath)
+    mocked_client.return_value.retrieve.assert_called_once()
+    # Downloads to a temporary file private to the call, then renamed
+    temp_fullpath = mocked_client.return_value.retrieve.call_args[0][2]
+    assert temp_fullpath.startswith(f"{file_fullpath}.")
+    assert temp_fullpath.endswith(".part")
+    assert (tmp_path / "test.nc").exists()
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test__download_error(mocker, tmp_path):
+    mocked_client = mocker.patch(
+        "atmospheric_explorer.api.data_interface.cams_interface.cdsapi.Client"
+    )
+
+    def retrieve(name, body, path):
+        Path(path).write_text("partial", encoding="utf-8")
+        raise ConnectionError
+
+    mocked_client.return_value.retrieve.side_effect = retrieve
+    obj = CAMSDataInterfaceTesting({"a", "b", "c"})
+    with pytest.raises(ConnectionError):
+        obj._download(str(tmp_path / "test.nc"))
+    assert not list(tmp_path.iterdir())
+
+
+def test__project_dataset():
+    dataset = xr.Dataset(
+        {
+            "a": (["time", "level"], np.zeros((4, 3))),
+            "b": (["time", "level"], np.ones((4, 3))),
+            "c": (["time"], np.ones(4)),
+        },
+        coords={
+            "time": pd.date_range("2021-01-01", periods=4, freq="MS"),
+            "level": [1.0, 2.0, 3.0],
+        },
+    )
+    assert CAMSDataInterface._project_dataset(dataset).identical(dataset)
+    res = CAMSDataInterface._project_dataset(
+        dataset, "a", ["1", "3"], slice("2021-02", "2021-03")
+    )
+    assert list(res.data_vars) == ["a"]
+    assert res["level"].values.tolist() == [1.0, 3.0]
+    assert res["time"].dt.month.values.tolist() == [2, 3]
+    res = CAMSDataInterface._project_dataset(dataset[["c"]], levels="1")
+    assert "level" not in res.dims
@@ -0,0 +1,90 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+# pylint: disable=unused-argument
+
+import os
+from datetime import time
+
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+import xarray as xr
+
+from atmospheric_explorer.api.data_interface.climatology_cache import (
+    clear_climatologies,
+    climatology_key,
+    climatology_path,
+    load_climatology,
+    save_climatology,
+    selection_key,
+)
+from atmospheric_explorer.api.shape_selection.shape_selection import (
+    GenericShapeSelection,
+    Selection,
+)
+
+
+@pytest.fixture(autouse=True, name="climatologies_folder")
+def fixture_climatologies_folder(mocker, tmp_path):
+    mocker.patch(
+        "atmospheric_explorer.api.data_interface.climatology_cache.climatologies_folder",
+        str(tmp_path / "climatologies"),
+    )
+    return tmp_path / "climatologies"
+
+
+def test_climatology_key():
+    selection = GenericShapeSelection.from_shape(shapely.box(0, 0, 1, 1))
+    key = climatology_key(selection, dates_range="2010-01-01/2019-12-31", by_month=True)
+    assert key == climatology_key(
+        GenericShapeSelection.from_shape(shapely.box(0, 0, 1, 1)),
+        by_month=True,
+        dates_range="2010-01-01/2019-12-31",
+    )
+    assert key != climatology_key(
+        selection, dates_range="2010-01-01/2019-12-31", by_month=False
+    )
+    assert key != climatology_key(
+        GenericShapeSelection.from_shape(shapely.box(0, 0, 1, 2)),
+        dates_range="2010-01-01/2019-12-31",
+        by_month=True,
+    )
+    assert selection_key(Selection()) != selection_key(selection)
+    # The order of time values does not matter
+    assert climatology_key(selection, time_values=["00:00", "03:00"]) == (
+        climatology_key(selection, time_values=("03:00", "00:00"))
+    )
+    assert climatology_key(selection, time_values=["00:00", "03:00"]) != (
+        climatology_key(selection, time_values=["00:00"])
+    )
+
+
+def test_save_load_climatology(climatologies_folder):
+    assert load_climatology("key") is None
+    data = xr.DataArray(
+        np.random.rand(2, 2, 12),
+        dims=["label", "times", "month"],
+        coords={
+            "label": ["a", "b"],
+            "times": [time(0), time(12)],
+            "month": np.arange(1, 13),
+        },
+        attrs={"units": "kg m-2"},
+        name="gtco3",
+    )
+    save_climatology("key", data)
+    assert os.path.exists(climatology_path("key"))
+    xr.testing.assert_identical(load_climatology("key"), data)
+    clear_climatologies()
+    assert not climatologies_folder.exists()
+
+
+def test_save_load_no_times():
+    data = xr.DataArray(
+        [1.0, 2.0], dims=["label"], coords={"label": ["a", "b"]}, name="v"
+    ).assign_coords(Year=pd.Timestamp("2020-01-01"))
+    save_climatology("key", data)
+    xr.testing.assert_identical(load_climatology("key"), data)
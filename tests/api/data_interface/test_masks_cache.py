@@ -0,0 +1,100 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+# pylint: disable=unused-argument
+
+import os
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rioxarray  # noqa: F401 pylint: disable=unused-import
+import shapely
+import xarray as xr
+
+from atmospheric_explorer.api.config import CRS
+from atmospheric_explorer.api.data_interface import data_transformations
+from atmospheric_explorer.api.data_interface.masks_cache import (
+    clear_masks,
+    grid_key,
+    load_label_raster,
+    load_mask,
+    mask_path,
+    save_label_raster,
+    save_mask,
+)
+from atmospheric_explorer.api.shape_selection.config import SelectionLevel
+from atmospheric_explorer.api.shape_selection.shape_selection import EntitySelection
+
+
+@pytest.fixture(autouse=True, name="masks_folder")
+def fixture_masks_folder(mocker, tmp_path):
+    mocker.patch(
+        "atmospheric_explorer.api.data_interface.masks_cache.masks_folder",
+        str(tmp_path / "masks"),
+    )
+    return tmp_path / "masks"
+
+
+def _grid(latitude):
+    return xr.DataArray(
+        np.zeros((len(latitude), 4)),
+        dims=["latitude", "longitude"],
+        coords={"latitude": latitude, "longitude": [0.5, 1.5, 2.5, 3.5]},
+    ).rio.write_crs(CRS)
+
+
+def test_grid_key():
+    assert grid_key(_grid([1.5, 0.5])) == grid_key(_grid([1.5, 0.5]))
+    assert grid_key(_grid([1.5, 0.5])) != grid_key(_grid([0.5, 1.5]))
+    assert grid_key(_grid([1.5, 0.5])) != grid_key(
+        _grid([1.5, 0.5]).rio.write_crs(3857)
+    )
+
+
+def test_save_load_mask(masks_folder):
+    assert load_mask("grid", "Countries", "Italy") is None
+    mask = np.array([[True, False], [False, True]])
+    save_mask("grid", "Countries", "Italy", mask)
+    assert mask_path("grid", "Countries", "Italy").startswith(str(masks_folder))
+    assert (load_mask("grid", "Countries", "Italy") == mask).all()
+    assert load_mask("grid", "Countries", "France") is None
+    assert load_mask("other_grid", "Countries", "Italy") is None
+    clear_masks()
+    assert not os.path.exists(masks_folder)
+
+
+def test_shapes_mask_cache(mocker):
+    selection = EntitySelection(
+        gpd.GeoDataFrame(
+            {
+                "label": ["a", "b"],
+                "geometry": [shapely.box(0, 0, 1.2, 1), shapely.box(2, 1, 3, 2)],
+            },
+            crs=CRS,
+        ),
+        level=SelectionLevel.COUNTRIES,
+    )
+    rasterize = mocker.spy(data_transformations, "_rasterize")
+    grid = _grid([1.5, 0.5])
+    masks = data_transformations.shapes_mask(grid, selection)
+    assert rasterize.call_count == 2
+    cached_masks = data_transformations.shapes_mask(grid, selection)
+    assert rasterize.call_count == 2
+    assert cached_masks.identical(masks)
+    assert masks.sel(label="a").values.tolist() == [
+        [False, False, False, False],
+        [True, True, False, False],
+    ]
+    data_transformations.shapes_mask(_grid([0.5, 1.5]), selection)
+    assert rasterize.call_count == 4
+
+
+def test_save_load_label_raster():
+    assert load_label_raster("grid", "Countries") is None
+    raster = np.array([[0, 1], [-1, 1]], dtype="int32")
+    save_label_raster("grid", "Countries", ["Italy", "France"], raster)
+    labels, loaded = load_label_raster("grid", "Countries")
+    assert labels == ["Italy", "France"]
+    assert (loaded == raster).all()
@@ -0,0 +1,2 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
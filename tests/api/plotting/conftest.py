@@ -0,0 +1,89 @@
+"""\
+Config and fixtures used in plotting tests
+"""
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+# pylint: disable=unused-argument
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from atmospheric_explorer.api.data_interface.eac4 import (
+    EAC4Instance,
+    EAC4MonthlyInstance,
+)
+from atmospheric_explorer.api.data_interface.eac4.eac4_cache import request_coverage
+
+
+def monthly_value(time_index: pd.DatetimeIndex) -> np.ndarray:
+    """Value of the fake data, constant within each month so that monthly means match 3-hourly data."""
+    return (
+        (time_index.year.values - 2000) * 1000
+        + time_index.month.values * 10
+        + time_index.hour.values / 3
+    )
+
+
+def _request_times(body: dict) -> pd.DatetimeIndex:
+    """Times included in a 3-hourly or monthly mean call body."""
+    if "date" in body:
+        dates, times, _ = request_coverage(body)
+        return pd.DatetimeIndex(
+            sorted(pd.Timestamp(f"{d} {t}") for d in dates for t in times)
+        )
+    years, months, times = (
+        [body[key]] if isinstance(body[key], str) else body[key]
+        for key in ("year", "month", "time")
+    )
+    return pd.DatetimeIndex(
+        sorted(
+            pd.Timestamp(f"{y}-{m}-01 {t}")
+            for y in years
+            for m in months
+            for t in times
+        )
+    )
+
+
+@pytest.fixture
+def fake_client(mocker, tmp_path):
+    """Fake cdsapi client that writes a small EAC4-like netcdf file for each request."""
+    # The netcdf library is not thread safe, while chunks are downloaded concurrently
+    lock = threading.Lock()
+
+    def _retrieve(name, body, path):
+        time_index = _request_times(body)
+        values = monthly_value(time_index)
+        dataset = xr.Dataset(
+            {
+                "gtco3": (
+                    ["time", "latitude", "longitude"],
+                    np.broadcast_to(values[:, None, None], (len(values), 2, 2)),
+                )
+            },
+            coords={"time": time_index, "latitude": [1, 0], "longitude": [0, 1]},
+        )
+        with lock:
+            dataset.to_netcdf(path)
+
+    mocker.patch.object(EAC4Instance, "data_folder", str(tmp_path))
+    for interface in (EAC4Instance, EAC4MonthlyInstance):
+        mocker.patch.object(
+            interface, "dataset_dir", str(tmp_path / interface.dataset_name)
+        )
+    mocker.patch(
+        "atmospheric_explorer.api.data_interface.climatology_cache.climatologies_folder",
+        str(tmp_path / "climatologies"),
+    )
+    mocked_client = mocker.patch(
+        "atmospheric_explorer.api.data_interface.cams_interface.cdsapi.Client"
+    )
+    mocked_client.return_value.retrieve.side_effect = _retrieve
+    return mocked_client.return_value
@@ -0,0 +1,175 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+# pylint: disable=unused-argument
+
+from datetime import date
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from atmospheric_explorer.api.data_interface.climatology_cache import (
+    clear_climatologies,
+)
+from atmospheric_explorer.api.data_interface.eac4 import EAC4Config
+from atmospheric_explorer.api.plotting import anomalies
+from atmospheric_explorer.api.plotting.anomalies import (
+    _eac4_anomalies_datasets,
+    _shared_dates_range,
+    _whole_periods_bounds,
+    eac4_anomalies_plot,
+)
+
+CONVERSION_FACTOR = float(
+    EAC4Config.get_config()["variables"]["total_column_ozone"]["conversion"][
+        "conversion_factor"
+    ]
+)
+
+
+def test_anomalies_by_month(fake_client, mocker):
+    line_plot = mocker.patch.object(anomalies, "line_with_ci_subplots")
+    eac4_anomalies_plot(
+        data_variable="total_column_ozone",
+        var_name="gtco3",
+        dates_range="2021-01-01/2021-12-31",
+        time_values=["00:00", "03:00"],
+        title="Test",
+        reference_dates_range="2020-01-01/2020-06-30",
+        reference_by_month=True,
+    )
+    dataset = line_plot.call_args[1]["dataset"]
+    assert dataset.sizes["Month"] == 12
+    # Each month minus the same month of 2020, missing for months not in the reference period
+    first_half = dataset.isel(Month=slice(0, 6)).values
+    assert np.allclose(first_half, 1000 * CONVERSION_FACTOR)
+    assert np.isnan(dataset.isel(Month=slice(6, None)).values).all()
+
+
+@pytest.mark.parametrize(
+    "dates_range,resampling,expected",
+    [
+        ("2021-01-01/2021-03-31", "1MS", (date(2021, 1, 1), date(2021, 3, 31))),
+        ("2021-01-01/2021-12-31", "YS", (date(2021, 1, 1), date(2021, 12, 31))),
+        ("2021-01-15/2021-03-31", "1MS", None),
+        ("2021-01-01/2021-03-30", "1MS", None),
+        ("2021-01-01/2021-03-31", "YS", None),
+        ("2020-07-01/2021-06-30", "YS", None),
+        ("2021-01-01/2021-03-31", "1D", None),
+    ],
+)
+def test_whole_periods_bounds(dates_range, resampling, expected):
+    assert _whole_periods_bounds(dates_range, resampling) == expected
+
+
+@pytest.mark.parametrize(
+    "dates_range,reference_dates_range,resampling,expected",
+    [
+        # Overlapping
+        (
+            "2021-01-01/2021-12-31",
+            "2020-07-01/2021-06-30",
+            "1MS",
+            "2020-07-01/2021-12-31",
+        ),
+        # Contained
+        (
+            "2021-01-01/2021-03-31",
+            "2020-01-01/2021-12-31",
+            "1MS",
+            "2020-01-01/2021-12-31",
+        ),
+        # Adjacent
+        (
+            "2021-01-01/2021-06-30",
+            "2020-01-01/2020-12-31",
+            "1MS",
+            "2020-01-01/2021-06-30",
+        ),
+        (
+            "2021-01-01/2021-12-31",
+            "2019-01-01/2020-12-31",
+            "YS",
+            "2019-01-01/2021-12-31",
+        ),
+        # Disjoint
+        ("2021-02-01/2021-06-30", "2020-01-01/2020-12-31", "1MS", None),
+        ("2022-01-01/2022-12-31", "2020-01-01/2020-12-31", "YS", None),
+        # Partial months
+        ("2021-01-15/2021-06-30", "2020-01-01/2020-12-31", "1MS", None),
+        ("2021-01-01/2021-06-30", "2020-01-01/2020-12-30", "1MS", None),
+        # Years not aligned to calendar years
+        ("2021-01-01/2021-12-31", "2020-07-01/2021-06-30", "YS", None),
+    ],
+)
+def test_shared_dates_range(dates_range, reference_dates_range, resampling, expected):
+    assert _shared_dates_range(dates_range, reference_dates_range, resampling) == (
+        expected
+    )
+
+
+@pytest.mark.parametrize(
+    "dates_range,reference_dates_range,resampling,by_month,shared",
+    [
+        ("2021-01-01/2021-12-31", "2020-07-01/2021-06-30", "1MS", False, True),
+        ("2021-01-01/2021-06-30", "2020-01-01/2020-12-31", "1MS", True, True),
+        ("2021-01-01/2021-12-31", "2019-01-01/2020-12-31", "YS", False, True),
+        ("2021-02-01/2021-03-31", "2020-01-01/2020-01-31", "1MS", False, False),
+        ("2021-01-15/2021-02-28", "2020-01-01/2020-12-31", "1MS", False, False),
+    ],
+)
+def test_eac4_anomalies_datasets(
+    fake_client,
+    mocker,
+    dates_range,
+    reference_dates_range,
+    resampling,
+    by_month,
+    shared,
+):
+    # pylint: disable=too-many-arguments
+    params = {
+        "data_variable": "total_column_ozone",
+        "var_name": "gtco3",
+        "dates_range": dates_range,
+        "reference_dates_range": reference_dates_range,
+        "time_values": ["00:00", "03:00"],
+        "resampling": resampling,
+        "by_month": by_month,
+    }
+    anomalies_data = mocker.spy(anomalies, "_eac4_anomalies_data")
+    dataset, reference = _eac4_anomalies_datasets(**params)
+    assert anomalies_data.call_count == (1 if shared else 2)
+    # Same results processing the two dates ranges separately
+    clear_climatologies()
+    mocker.patch.object(anomalies, "_shared_dates_range", return_value=None)
+    expected_dataset, expected_reference = _eac4_anomalies_datasets(**params)
+    xr.testing.assert_allclose(dataset, expected_dataset)
+    xr.testing.assert_allclose(reference, expected_reference)
+    # The reference mean is now cached, only dates_range is processed
+    anomalies_data.reset_mock()
+    cached_dataset, cached_reference = _eac4_anomalies_datasets(**params)
+    assert anomalies_data.call_count == 1
+    assert anomalies_data.call_args[1]["dates_range"] == dates_range
+    xr.testing.assert_allclose(cached_dataset, expected_dataset)
+    xr.testing.assert_allclose(cached_reference, expected_reference)
+
+
+def test_eac4_anomalies_plot(fake_client):
+    fig = eac4_anomalies_plot(
+        data_variable="total_column_ozone",
+        var_name="gtco3",
+        dates_range="2021-01-01/2021-06-30",
+        time_values=["00:00", "03:00"],
+        title="Test",
+        reference_dates_range="2020-01-01/2020-12-31",
+    )
+    # One line for each time value, no CI
+    assert [trace.name for trace in fig.data] == ["00:00:00", "03:00:00"]
+    assert len(fig.data[0].x) == 6
+    # Anomalies of each month against the mean of 2020
+    expected = (1000 + 10 * np.arange(1, 7) - 65) * CONVERSION_FACTOR
+    assert np.allclose(fig.data[0].y, expected)
+    assert fig.layout.yaxis.title.text == "DU"
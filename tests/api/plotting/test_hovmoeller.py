@@ -0,0 +1,21 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+# pylint: disable=unused-argument
+
+from atmospheric_explorer.api.plotting.hovmoeller import eac4_hovmoeller_plot
+
+
+def test_eac4_hovmoeller_plot(fake_client):
+    params = {
+        "data_variable": "total_column_ozone",
+        "var_name": "gtco3",
+        "dates_range": "2020-01-01/2020-12-31",
+        "time_values": "00:00",
+        "title": "Test",
+    }
+    fig = eac4_hovmoeller_plot(**params)
+    assert len(fig.data[0].x) == 12
+    fig = eac4_hovmoeller_plot(**params, max_columns=4)
+    assert len(fig.data[0].x) == 3
@@ -0,0 +1,183 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+# pylint: disable=unused-argument
+import os
+
+import plotly.graph_objects as go
+import plotly.io as pio
+import pytest
+from kaleido.scopes.plotly import PlotlyScope
+
+from atmospheric_explorer.api.plotting.image_export import (
+    RenderPool,
+    export_images,
+    image_format,
+)
+from atmospheric_explorer.api.plotting.plot_utils import save_plotly_to_image
+
+
+@pytest.fixture(name="mocked_transform")
+def fixture_mocked_transform(mocker):
+    def transform(self, fig_dict, format=None, width=None, height=None, scale=None):
+        # pylint: disable=redefined-builtin, too-many-arguments
+        return f"{format}:{fig_dict['data'][0]['name']}".encode()
+
+    return mocker.patch.object(
+        PlotlyScope, "transform", autospec=True, side_effect=transform
+    )
+
+
+@pytest.fixture(name="mocked_shutdown")
+def fixture_mocked_shutdown(mocker):
+    mocked = mocker.patch.object(PlotlyScope, "_shutdown_kaleido", autospec=True)
+    yield mocked
+    # Each test starts with a new shared pool
+    RenderPool.close_shared()
+
+
+def figure(name: str) -> go.Figure:
+    return go.Figure(go.Scatter(x=[0, 1], y=[0, 1], name=name))
+
+
+@pytest.mark.parametrize(
+    "path,img_format,expected",
+    [
+        ("plot.png", None, "png"),
+        ("plot.SVG", None, "svg"),
+        ("plot", None, "png"),
+        ("plot.png", "PDF", "pdf"),
+    ],
+)
+def test_image_format(path, img_format, expected):
+    assert image_format(path, img_format) == expected
+
+
+def test_image_format_unsupported():
+    with pytest.raises(ValueError):
+        image_format("plot.txt")
+    with pytest.raises(ValueError):
+        image_format("plot.png", "gif")
+
+
+def test_render_pool_scopes(mocked_shutdown):
+    with pytest.raises(ValueError):
+        RenderPool(workers=0)
+    pool = RenderPool(workers=3)
+    assert len(pool._scopes) == 3
+    assert len({id(scope) for scope in pool._scopes}) == 3
+    assert pio.kaleido.scope not in pool._scopes
+    pool.close()
+
+
+def test_render_pool_submit(tmp_path, mocked_transform, mocked_shutdown, mocker):
+    spy_replace = mocker.spy(os, "replace")
+    path = str(tmp_path / "plot.svg")
+    with RenderPool(workers=1) as pool:
+        future = pool.submit(figure("a"), path, width=100, height=50, scale=2)
+        assert future.result() == path
+    with open(path, "rb") as file:
+        assert file.read() == b"svg:a"
+    (temp_path, target), _ = spy_replace.call_args
+    assert target == path
+    assert os.path.dirname(temp_path) == str(tmp_path)
+    assert os.path.basename(temp_path).startswith("plot.svg.")
+    assert temp_path.endswith(".part")
+    assert mocked_transform.call_args.kwargs == {
+        "format": "svg",
+        "width": 100,
+        "height": 50,
+        "scale": 2,
+    }
+
+
+def test_render_pool_export(tmp_path, mocked_transform, mocked_shutdown):
+    figures = [
+        (figure(name), str(tmp_path / f"{name}.{ext}"))
+        for name, ext in [("a", "png"), ("b", "pdf"), ("c", "jpeg"), ("d", "png")]
+    ]
+    with RenderPool(workers=2) as pool:
+        paths = pool.export(figures)
+    assert paths == [path for _, path in figures]
+    for name, ext in [("a", "png"), ("b", "pdf"), ("c", "jpeg"), ("d", "png")]:
+        with open(tmp_path / f"{name}.{ext}", "rb") as file:
+            assert file.read() == f"{ext}:{name}".encode()
+    assert not list(tmp_path.glob("*.part"))
+    # Renderers are used by a single thread at a time and always returned to the pool
+    assert mocked_transform.call_count == 4
+    assert pool._idle.qsize() == 2
+
+
+def test_render_pool_same_path(tmp_path, mocked_transform, mocked_shutdown, mocker):
+    spy_replace = mocker.spy(os, "replace")
+    path = str(tmp_path / "plot.png")
+    with RenderPool(workers=2) as pool:
+        pool.export([(figure("a"), path), (figure("b"), path)])
+    # Each export used its own temporary file
+    temp_paths = {call.args[0] for call in spy_replace.call_args_list}
+    assert len(temp_paths) == 2
+    with open(path, "rb") as file:
+        assert file.read() in (b"png:a", b"png:b")
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_render_pool_write_error(tmp_path, mocked_transform, mocked_shutdown, mocker):
+    mocker.patch(
+        "atmospheric_explorer.api.os_manager.os.replace",
+        side_effect=OSError,
+    )
+    with RenderPool(workers=1) as pool:
+        with pytest.raises(OSError):
+            pool.submit(figure("a"), str(tmp_path / "plot.png")).result()
+    assert not list(tmp_path.iterdir())
+
+
+def test_render_pool_close(mocked_transform, mocked_shutdown):
+    pool = RenderPool(workers=2)
+    mocked_shutdown.reset_mock()
+    pool.close()
+    shut_down = [call.args[0] for call in mocked_shutdown.call_args_list]
+    # Renderers of earlier pools may be shut down by their __del__ meanwhile
+    assert [scope for scope in shut_down if scope in pool._scopes] == pool._scopes
+    assert all(scope is not pio.kaleido.scope for scope in shut_down)
+
+
+def test_shared_pool(mocked_shutdown):
+    pool = RenderPool.shared()
+    assert RenderPool.shared() is pool
+    assert pool.workers == 2
+    RenderPool.close_shared()
+    assert {call.args[0] for call in mocked_shutdown.call_args_list} >= set(
+        pool._scopes
+    )
+    assert RenderPool.shared() is not pool
+
+
+def test_export_images(tmp_path, mocked_transform, mocked_shutdown, mocker):
+    spy_init = mocker.spy(RenderPool, "__init__")
+    pool = RenderPool.shared()
+    # Configuring a new renderer shuts down its process, which is not started yet
+    mocked_shutdown.reset_mock()
+    first = [(figure(name), str(tmp_path / f"{name}.png")) for name in "abc"]
+    assert export_images(first, width=10) == [path for _, path in first]
+    assert export_images([(figure("d"), str(tmp_path / "d.webp"))]) == [
+        str(tmp_path / "d.webp")
+    ]
+    with open(tmp_path / "d.webp", "rb") as file:
+        assert file.read() == b"webp:d"
+    # All exports are rendered by the renderers of a single pool, which stay alive in between
+    assert spy_init.call_count == 1
+    assert RenderPool.shared() is pool
+    used_scopes = {call.args[0] for call in mocked_transform.call_args_list}
+    assert used_scopes <= set(pool._scopes)
+    assert not mocked_shutdown.called
+
+
+def test_save_plotly_to_image(tmp_path, mocked_transform, mocked_shutdown):
+    path = str(tmp_path / "plot")
+    save_plotly_to_image(figure("a"), path, img_format="jpeg")
+    with open(path, "rb") as file:
+        assert file.read() == b"jpeg:a"
+    used_scopes = {call.args[0] for call in mocked_transform.call_args_list}
+    assert used_scopes <= set(RenderPool.shared()._scopes)
@@ -0,0 +1,242 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+# pylint: disable=unused-argument
+from datetime import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import xarray as xr
+
+from atmospheric_explorer.api.plotting.plot_utils import (
+    WEBGL_THRESHOLD,
+    _pyramid_level,
+    hovmoeller_plot,
+    hovmoeller_pyramid,
+    hovmoeller_resampler,
+    line_with_ci_subplots,
+    lttb_indices,
+)
+
+
+def _yearly_flux_data():
+    """Data shaped like the output of _ghg_surface_satellite_yearly_data."""
+    rng = np.random.default_rng(0)
+    means = rng.random((3, 2, 4))
+    return xr.DataArray(
+        np.stack([means - 1, means, means + 1], axis=-1),
+        dims=["label", "input_observations", "Year", "ci"],
+        coords={
+            "label": ["Italy", "France", "Spain"],
+            "input_observations": ["surface", "satellite"],
+            "Year": pd.date_range("2018-01-01", periods=4, freq="YS"),
+            "ci": ["lower", "mean", "upper"],
+        },
+    )
+
+
+def _anomalies_data():
+    """Data shaped like the anomalies computed by eac4_anomalies_plot."""
+    return xr.DataArray(
+        np.arange(12, dtype=float).reshape(1, 2, 6),
+        dims=["label", "times", "Month"],
+        coords={
+            "label": [""],
+            "times": [time(0), time(3)],
+            "Month": pd.date_range("2021-01-01", periods=6, freq="MS"),
+        },
+    )
+
+
+def test_line_with_ci_subplots_ci():
+    data = _yearly_flux_data()
+    fig = line_with_ci_subplots(
+        data, "unit", "Title", add_ci=True, color="input_observations"
+    )
+    # One line and two CI bounds for each label and input observations
+    assert len(fig.data) == 3 * 2 * 3
+    lines = [trace for trace in fig.data if not trace.name.startswith("CI")]
+    # Labels are sorted, each one in its own subplot on two columns
+    assert [trace.xaxis for trace in lines] == ["x", "x", "x2", "x2", "x3", "x3"]
+    assert [a.text for a in fig.layout.annotations] == ["France", "Italy", "Spain"]
+    assert [trace.legendgroup for trace in lines] == ["satellite", "surface"] * 3
+    assert [trace.showlegend for trace in lines] == [True, True] + [False] * 4
+    for trace in fig.data:
+        label = fig.layout.annotations[int(trace.xaxis[1:] or 1) - 1].text
+        obs = trace.legendgroup.removeprefix("CI ")
+        values = data.sel(label=label, input_observations=obs)
+        if trace.name.startswith("CI"):
+            bound = "lower" if trace.fill is None else "upper"
+            assert trace.fill in (None, "tonexty")
+        else:
+            bound = "mean"
+        assert np.allclose(trace.y, values.sel(ci=bound))
+        assert (trace.x == values["Year"].values).all()
+    assert fig.layout.yaxis.title.text == "unit"
+    assert fig.layout.showlegend is None
+
+
+def test_line_with_ci_subplots():
+    data = _anomalies_data()
+    fig = line_with_ci_subplots(data, "DU", "Title", color="times")
+    assert len(fig.data) == 2
+    assert [trace.name for trace in fig.data] == ["00:00:00", "03:00:00"]
+    assert [trace.legendgroup for trace in fig.data] == ["00:00:00", "03:00:00"]
+    assert all(trace.xaxis == "x" for trace in fig.data)
+    # A single label has no subplot title
+    assert not fig.layout.annotations
+    assert np.allclose(fig.data[1].y, data.sel(times=time(3)).squeeze())
+    fig = line_with_ci_subplots(data.isel(times=[0]), "DU", "Title", color="times")
+    assert fig.layout.showlegend is False
+
+
+def test_line_subplots_nocolor():
+    data = _yearly_flux_data().sel(input_observations="surface", drop=True)
+    fig = line_with_ci_subplots(data, "unit", "Title", add_ci=True)
+    # One line and two CI bounds for each label, all of the same color
+    assert len(fig.data) == 3 * 3
+    lines = [trace for trace in fig.data if not trace.name.startswith("CI")]
+    assert len({trace.line.color for trace in lines}) == 1
+    assert fig.layout.showlegend is False
+    assert np.allclose(lines[0].y, data.sel(label="France", ci="mean"))
+    assert "color" not in data.dims
+
+
+def test_lttb_indices():
+    rng = np.random.default_rng(0)
+    y_values = rng.random(1000)
+    y_values[[0, 10, 500, 501]] = np.nan
+    x_values = np.arange(1000)
+    indices = lttb_indices(x_values, y_values, 100)
+    assert len(indices) == 100
+    # First and last valid points are kept, in increasing order
+    assert indices[0] == 1 and indices[-1] == 999
+    assert (np.diff(indices) > 0).all()
+    assert not np.isnan(y_values[indices]).any()
+    # Datetime x values give the same points as their integer timestamps
+    dates = pd.date_range("2000-01-01", periods=1000, freq="3H").values
+    assert (lttb_indices(dates, y_values, 100) == indices).all()
+    # A spike is always kept
+    y_values[700] = 100
+    assert 700 in lttb_indices(x_values, y_values, 100)
+
+
+def test_lttb_indices_passthrough():
+    y_values = np.array([1.0, np.nan, 3.0, 4.0])
+    assert lttb_indices(np.arange(4), y_values, 3).tolist() == [0, 2, 3]
+    assert lttb_indices(np.arange(4), y_values, 10).tolist() == [0, 2, 3]
+
+
+def test_line_downsampling():
+    data = _anomalies_data().isel(Month=0, drop=True)
+    data = data.expand_dims(Month=pd.date_range("2000-01-01", periods=3000, freq="D"))
+    data = data.copy(data=np.sin(np.arange(3000) / 50)[:, None, None] * [1, 2])
+    data[1000:1100] = np.nan
+    fig = line_with_ci_subplots(data, "DU", "Title", color="times", max_points=500)
+    assert all(isinstance(trace, go.Scatter) for trace in fig.data)
+    y_values = fig.data[0].y
+    assert np.isnan(y_values).sum() == 1
+    # The line breaks inside the gap
+    gap = int(np.flatnonzero(np.isnan(y_values))[0])
+    assert fig.data[0].x[gap - 1] < data["Month"].values[1000]
+    assert fig.data[0].x[gap + 1] > data["Month"].values[1099]
+    assert len(y_values) == 501
+
+
+def test_line_webgl():
+    data = _anomalies_data().isel(Month=0, drop=True)
+    n_points = WEBGL_THRESHOLD // 2 + 1
+    data = data.expand_dims(
+        Month=pd.date_range("2000-01-01", periods=n_points, freq="D")
+    ).copy(data=np.ones((n_points, 1, 2)))
+    fig = line_with_ci_subplots(data, "DU", "Title", color="times", max_points=None)
+    assert all(isinstance(trace, go.Scattergl) for trace in fig.data)
+    fig = line_with_ci_subplots(
+        data.isel(Month=slice(1, None)), "DU", "Title", color="times", max_points=None
+    )
+    assert all(isinstance(trace, go.Scatter) for trace in fig.data)
+
+
+def _hovmoeller_data(n_labels, n_columns):
+    return xr.DataArray(
+        np.arange(n_labels * n_columns * 2, dtype=float).reshape(
+            n_labels, n_columns, 2
+        ),
+        dims=["label", "Month", "latitude"],
+        coords={
+            "label": [f"label{i}" for i in range(n_labels)],
+            "Month": pd.date_range("2000-01-01", periods=n_columns, freq="D"),
+            "latitude": [0, 1],
+        },
+    )
+
+
+def test_hovmoeller_pyramid():
+    data = _hovmoeller_data(1, 11)
+    data[0, 0, 0] = np.nan
+    levels = hovmoeller_pyramid(data, min_columns=2)
+    assert [level.sizes["Month"] for level in levels] == [11, 6, 3, 2]
+    assert levels[0] is data
+    values = levels[1].isel(label=0, latitude=0).values
+    # Missing values are not counted, the odd last column is averaged alone
+    assert values.tolist() == [2, 5, 9, 13, 17, 20]
+    assert levels[1].dims == data.dims
+    assert (np.diff(levels[1]["Month"].values) > np.timedelta64(0)).all()
+    data[0, 1, 0] = np.nan
+    assert np.isnan(hovmoeller_pyramid(data, min_columns=2)[1][0, 0, 0])
+    assert len(hovmoeller_pyramid(data)) == 1
+
+
+def test_pyramid_level():
+    levels = hovmoeller_pyramid(_hovmoeller_data(2, 1000))
+    assert _pyramid_level(levels, 300).sizes["Month"] == 250
+    assert _pyramid_level(levels, 10).sizes["Month"] == 63
+    # A zoomed range is shown from finer levels
+    x_range = ("2000-01-01", "2000-08-27")
+    assert _pyramid_level(levels, 300, x_range).sizes["Month"] == 240
+    assert _pyramid_level(levels, 100, x_range).sizes["Month"] == 60
+    assert _pyramid_level(levels, "auto").sizes["Month"] == 500
+
+
+def test_hovmoeller_plot_columns():
+    data = _hovmoeller_data(2, 1200)
+    # Two facets per row, 500 pixels each
+    fig = hovmoeller_plot(data, "Title")
+    assert [len(trace.x) for trace in fig.data] == [300, 300]
+    fig = hovmoeller_plot(data.isel(label=[0]), "Title")
+    assert len(fig.data[0].x) == 600
+    fig = hovmoeller_plot(data, "Title", max_columns=None)
+    assert len(fig.data[0].x) == 1200
+    fig = hovmoeller_plot(data, "Title", x_range=("2000-01-01", "2000-03-31"))
+    assert len(fig.data[0].x) == 91
+    resampler = hovmoeller_resampler(data, title="Title")
+    # Columns of 4 days in a 1096 days range, 2 days in a 1000 days range
+    assert len(resampler(("2000-01-01", "2002-12-31")).data[0].x) == 274
+    assert len(resampler(("2000-01-01", "2002-09-26")).data[0].x) == 500
+
+
+def test_hovmoeller_plot_facets():
+    # Integer labels, so that their set order differs from their order in the data
+    data = xr.DataArray(
+        np.broadcast_to(np.array([20.0, 0.0, 10.0])[:, None, None], (3, 4, 2)),
+        dims=["label", "Month", "latitude"],
+        coords={
+            "label": [2, 0, 1],
+            "Month": pd.date_range("2000-01-01", periods=4, freq="MS"),
+            "latitude": [0, 1],
+        },
+    )
+    fig = hovmoeller_plot(data, "Title")
+    assert sorted(a.text for a in fig.layout.annotations) == ["0", "1", "2"]
+    for trace in fig.data:
+        x_domain = fig.layout[trace.xaxis.replace("x", "xaxis")].domain
+        y_domain = fig.layout[trace.yaxis.replace("y", "yaxis")].domain
+        (title,) = (
+            a.text
+            for a in fig.layout.annotations
+            if x_domain[0] <= a.x <= x_domain[1] and a.y == y_domain[1]
+        )
+        # Each facet shows the data of its title
+        assert (np.asarray(trace.z) == 10 * int(title)).all()
@@ -3,12 +3,69 @@
 # pylint: disable=missing-function-docstring
 # pylint: disable=protected-access
 
+import dask.array as da
+import geopandas as gpd
 import numpy as np
+import pandas as pd
+import pytest
+import rioxarray  # noqa: F401 pylint: disable=unused-import
+import shapely
 import xarray as xr
+from shapely.geometry import mapping
 
+from atmospheric_explorer.api.data_interface import data_transformations
 from atmospheric_explorer.api.data_interface.data_transformations import (
+    aggregate_regions,
+    aggregate_selection,
+    clip_and_concat_shapes,
     confidence_interval,
+    level_coverage,
+    level_label_raster,
+    regions_coverage,
+    resample_monthly_means,
+    resample_reduce,
+    selection_area,
+    shapes_mask,
+    shifting_long,
+    split_time_dim,
+    time_groups,
 )
+from atmospheric_explorer.api.shape_selection.config import SelectionLevel
+from atmospheric_explorer.api.shape_selection.shape_selection import (
+    EntitySelection,
+    GenericShapeSelection,
+    Selection,
+)
+
+
+def _grid_dataset():
+    return xr.Dataset(
+        {
+            "v": (["time", "latitude", "longitude"], np.random.rand(3, 10, 12)),
+            "t": (["time"], np.arange(3)),
+        },
+        coords={
+            "time": pd.date_range("2020-01-01", periods=3),
+            "latitude": np.arange(4.5, -5, -1.0),
+            "longitude": np.arange(-5.5, 6, 1.0),
+        },
+    ).rio.write_crs("EPSG:4326")
+
+
+def _selection():
+    return GenericShapeSelection(
+        dataframe=gpd.GeoDataFrame(
+            {
+                "label": ["a", "b", "a"],
+                "geometry": [
+                    shapely.box(-3.2, -2.2, 0.5, 1.2),
+                    shapely.Polygon([(1, 0), (4.2, 0), (4.2, 3.7)]),
+                    shapely.box(-5, 3.5, -4.5, 4.2),
+                ],
+            },
+            crs="EPSG:4326",
+        )
+    )
 
 
 def test_conf_interval_array():
@@ -40,3 +97,413 @@ def test_conf_interval_xarray():
         coords=[[1, 2], ["lower", "mean", "upper"]],
     )
     assert (np.round(res, 3) == expected).all()
+
+
+def test_conf_interval_xarray_nan():
+    values = np.random.rand(2, 6, 3)
+    values[0, :4, 0] = np.nan
+    values[1, :, 1] = np.nan
+    array = xr.DataArray(values, dims=["x", "y", "z"])
+    array = array.assign_coords(x=[1, 2], z=[3, 4, 5])
+    res = confidence_interval(array, dim="y")
+    assert res.dims == ("x", "z", "ci")
+    for i in range(2):
+        for j in range(3):
+            assert np.allclose(
+                res[i, j], confidence_interval(values[i, :, j]), equal_nan=True
+            )
+    assert np.isnan(res[1, 1]).all()
+    assert not np.isnan(res[0, 0]).any()
+
+
+def test_resample_monthly_means():
+    time_index = pd.date_range("2020-01-01", "2021-12-31 21:00", freq="3H")
+    array = xr.DataArray(
+        np.arange(len(time_index), dtype=float), dims=["time"], coords=[time_index]
+    )
+    monthly_means = array.resample(time="1MS").mean()
+    expected = array.resample(time="YS").mean()
+    res = resample_monthly_means(monthly_means, "time", "YS")
+    assert np.allclose(res, expected)
+    monthly_means[0] = np.nan
+    res = resample_monthly_means(monthly_means, "time", "1MS")
+    assert np.isnan(res[0])
+    assert np.allclose(res[1:], monthly_means[1:])
+
+
+@pytest.mark.parametrize("missing", [False, True])
+def test_split_time_dim(missing):
+    time_index = pd.date_range("2020-01-01", periods=24, freq="3H")
+    dataset = xr.Dataset(
+        {
+            "v": (["label", "time"], np.random.rand(2, 24)),
+            "c": (["label"], [1, 2]),
+        },
+        coords={"label": ["a", "b"], "time": time_index},
+    )
+    if missing:
+        dataset = dataset.drop_isel(time=5)
+    res = split_time_dim(dataset, "time")
+    assert res["v"].dims == ("label", "times", "dates")
+    assert res["c"].dims == ("label",)
+    assert [t.hour for t in res["times"].values] == list(range(0, 24, 3))
+    assert (res["dates"] == pd.date_range("2020-01-01", periods=3)).all()
+    stacked = res["v"].stack(time=["dates", "times"]).transpose("label", "time")
+    if missing:
+        assert np.isnan(res["v"].isel(dates=0, times=5)).all()
+        stacked = stacked.dropna("time")
+    else:
+        assert np.shares_memory(res["v"].values, dataset["v"].values)
+    assert (stacked.values == dataset["v"].values).all()
+
+
+def test_time_groups():
+    times = pd.DatetimeIndex(["2020-03-02", "2020-01-05", "2020-01-01", "2020-03-01"])
+    bins, groups, positions = time_groups(times, "1MS")
+    assert list(bins) == list(pd.date_range("2020-01-01", "2020-03-01", freq="MS"))
+    assert groups.tolist() == [2, 0, 0, 2]
+    assert positions.tolist() == [0, 0, 1, 1]
+
+
+@pytest.mark.parametrize("chunks", [None, {"time": 7}])
+def test_resample_reduce(chunks):
+    time_index = pd.date_range("2020-01-01", periods=200, freq="5D")
+    values = np.random.rand(2, 200)
+    values[0, :20] = np.nan
+    array = xr.DataArray(
+        values,
+        dims=["label", "time"],
+        coords={"label": ["a", "b"], "time": time_index},
+        attrs={"units": "kg"},
+    )
+    # A missing month and unsorted times
+    array = array.isel(time=np.r_[100:200, 0:60])
+    if chunks is not None:
+        array = array.chunk(chunks)
+    expected = array.sortby("time").resample(time="1MS")
+    res = resample_reduce(array, "time", "1MS")
+    assert res.dims == ("label", "time")
+    assert res.attrs == {"units": "kg"}
+    assert np.allclose(res, expected.mean(), equal_nan=True)
+    res = resample_reduce(array.to_dataset(name="v"), "time", "1MS", how="sum")
+    assert np.allclose(res["v"], expected.sum(min_count=1), equal_nan=True)
+    res = resample_reduce(array, "time", "YS", how="ci")
+    expected = (
+        array.sortby("time").resample(time="YS").map(confidence_interval, dim="time")
+    )
+    assert res.dims == ("label", "time", "ci")
+    assert np.allclose(res, expected, equal_nan=True)
+    with pytest.raises(ValueError):
+        resample_reduce(array, "time", "YS", how="median")
+
+
+def test_selection_area():
+    assert selection_area(Selection()) is None
+    selection = GenericShapeSelection.from_shape(shapely.box(-10.5, 35.2, 20, 45))
+    assert selection_area(selection) == [46, -12, 34, 21]
+    selection = GenericShapeSelection.from_shape(shapely.box(-180, -90, 180, 90))
+    assert selection_area(selection) == [90, -180, -90, 180]
+
+
+@pytest.mark.parametrize("chunks", [None, {"longitude": 2}])
+def test_shifting_long(chunks):
+    dataset = xr.Dataset(
+        {"v": (["latitude", "longitude"], np.arange(12.0).reshape(2, 6))},
+        coords={"latitude": [1.0, 0], "longitude": [0.0, 60, 120, 180, 240, 300]},
+    )
+    if chunks is not None:
+        dataset = dataset.chunk(chunks)
+    res = shifting_long(dataset)
+    assert res["longitude"].values.tolist() == [-180, -120, -60, 0, 60, 120]
+    assert res["v"].values[0].tolist() == [3, 4, 5, 0, 1, 2]
+    if chunks is not None:
+        assert isinstance(res["v"].data, da.Array)
+    # Already shifted longitudes are not reordered
+    res = shifting_long(res.compute())
+    assert res["v"].values[0].tolist() == [3, 4, 5, 0, 1, 2]
+
+
+def test_lazy_transformations():
+    time_index = pd.date_range("2020-01-01", periods=16, freq="3H")
+    dataset = xr.Dataset(
+        {"v": (["time", "latitude", "longitude"], np.random.rand(16, 5, 6))},
+        coords={
+            "time": time_index,
+            "latitude": [2.0, 1, 0, -1, -2],
+            "longitude": [0.0, 60, 120, 180, 240, 300],
+        },
+    ).rio.write_crs("EPSG:4326")
+    selection = GenericShapeSelection.from_shape(shapely.box(-70, -1.5, 70, 1.5))
+
+    def _pipeline(data):
+        data = clip_and_concat_shapes(shifting_long(data), selection)
+        data = split_time_dim(data.mean(dim=["latitude", "longitude"]), "time")
+        return data.resample(dates="1D").mean(dim="dates")
+
+    res = _pipeline(dataset.chunk({"time": 4}))
+    assert isinstance(res["v"].data, da.Array)
+    assert np.allclose(res["v"], _pipeline(dataset)["v"], equal_nan=True)
+
+
+def test_shapes_mask():
+    dataset = _grid_dataset()
+    selection = _selection()
+    masks = shapes_mask(dataset, selection)
+    assert masks.dims == ("label", "latitude", "longitude")
+    assert masks["label"].values.tolist() == ["a", "b"]
+    for label in ["a", "b"]:
+        geometries = selection.dataframe[selection.dataframe["label"] == label]
+        expected = dataset["v"].rio.clip(
+            [mapping(g) for g in geometries.geometry], drop=False, all_touched=True
+        )
+        assert (masks.sel(label=label) == expected.isel(time=0).notnull()).all()
+
+
+def test_clip_and_concat_shapes():
+    dataset = _grid_dataset()
+    res = clip_and_concat_shapes(dataset, _selection())
+    assert res["v"].dims == ("label", "time", "latitude", "longitude")
+    assert res["t"].dims == ("label", "time")
+    for label in ["a", "b"]:
+        geometries = _selection().dataframe
+        geometries = geometries[geometries["label"] == label]
+        expected = dataset.rio.clip(
+            [mapping(g) for g in geometries.geometry], drop=True, all_touched=True
+        )
+        clipped = res["v"].sel(label=label)
+        assert np.allclose(
+            clipped.sel(latitude=expected.latitude, longitude=expected.longitude),
+            expected["v"],
+            equal_nan=True,
+        )
+        # Pixels outside the clipped box are all null
+        assert int(clipped.notnull().sum()) == int(expected["v"].notnull().sum())
+
+
+def test_regions_coverage():
+    dataset = _grid_dataset()
+    labels, coverage = regions_coverage(dataset, Selection())
+    assert labels == [""]
+    assert (coverage.toarray() == 1).all()
+    labels, coverage = regions_coverage(dataset, _selection())
+    assert labels == ["a", "b"]
+    assert coverage.shape == (2, 120)
+    masks = clip_and_concat_shapes(dataset, _selection())["v"].isel(time=0).notnull()
+    assert int(coverage.sum()) == int(masks.sum())
+    labels, fractions = regions_coverage(dataset, _selection(), fractional=True)
+    assert set(zip(*fractions.nonzero())) <= set(zip(*coverage.nonzero()))
+    assert ((fractions.data > 0) & (fractions.data <= 1)).all()
+    # Area of label 'a' in cells of 1x1 degree
+    assert np.isclose(fractions[0].sum(), 3.7 * 3.4 + 0.5 * 0.7)
+
+
+def test_level_coverage(mocker):
+    mocker.patch.object(
+        data_transformations,
+        "dissolve_shapefile_level",
+        return_value=_selection().dataframe.dissolve(by="label").reset_index(),
+    )
+    mocker.patch.object(data_transformations, "load_mask", return_value=None)
+    mocker.patch.object(data_transformations, "save_mask")
+    labels, coverage = level_coverage(_grid_dataset(), SelectionLevel.COUNTRIES)
+    expected_labels, expected = regions_coverage(
+        _grid_dataset(), _selection(), fractional=True
+    )
+    assert labels == expected_labels
+    assert np.allclose(coverage.toarray(), expected.toarray())
+
+
+@pytest.mark.parametrize("chunks", [None, {"time": 1}])
+def test_aggregate_regions(chunks):
+    dataset = _grid_dataset()
+    dataset["v"][0, 0, 0] = np.nan
+    if chunks is not None:
+        dataset = dataset.chunk(chunks)
+    coverage = regions_coverage(dataset, _selection())
+    clipped = clip_and_concat_shapes(dataset, _selection())
+    res = aggregate_regions(dataset, coverage)
+    assert list(res.data_vars) == ["v"]
+    assert res["v"].dims == ("label", "time")
+    assert np.allclose(res["v"], clipped["v"].mean(dim=["latitude", "longitude"]))
+    res = aggregate_regions(dataset["v"], coverage, how="sum")
+    assert np.allclose(res, clipped["v"].sum(dim=["latitude", "longitude"]))
+    area = xr.full_like(dataset["v"].isel(time=0), 2.0)
+    res = aggregate_regions(dataset["v"], coverage, how="sum", weights=area)
+    assert np.allclose(res, 2 * clipped["v"].sum(dim=["latitude", "longitude"]))
+    res = aggregate_regions(dataset["v"], coverage, weights="cos_lat")
+    cos_lat = np.cos(np.deg2rad(clipped["latitude"]))
+    assert np.allclose(
+        res, clipped["v"].weighted(cos_lat).mean(["latitude", "longitude"])
+    )
+    with pytest.raises(ValueError):
+        aggregate_regions(dataset["v"], coverage, weights="area")
+
+
+def _level_grid(latitude, longitude):
+    return xr.DataArray(
+        np.zeros((len(latitude), len(longitude))),
+        dims=["latitude", "longitude"],
+        coords={"latitude": latitude, "longitude": longitude},
+    ).rio.write_crs("EPSG:4326")
+
+
+def test_global_axis():
+    axis, positions = data_transformations._global_axis(
+        np.arange(-10.5, 10, 0.75), (-180, 180)
+    )
+    assert len(axis) == 481
+    assert axis[0] == -180 and axis[-1] == 180
+    assert np.allclose(axis[positions], np.arange(-10.5, 10, 0.75))
+    axis, positions = data_transformations._global_axis(
+        np.arange(9.5, -10, -1.0), (-90, 90), descending=True
+    )
+    assert axis.tolist() == np.arange(89.5, -90, -1.0).tolist()
+    assert positions.tolist() == list(range(80, 100))
+    _, positions = data_transformations._global_axis(
+        np.arange(-9.5, 10, 1.0), (-90, 90), descending=True
+    )
+    assert positions.tolist() == list(range(99, 79, -1))
+    assert data_transformations._global_axis(np.array([0, 1, 3]), (-90, 90)) is None
+    assert data_transformations._global_axis(np.array([0]), (-90, 90)) is None
+
+
+def test_level_label_raster(mocker, tmp_path):
+    mocker.patch(
+        "atmospheric_explorer.api.data_interface.masks_cache.masks_folder",
+        str(tmp_path / "masks"),
+    )
+    dissolve = mocker.patch.object(
+        data_transformations,
+        "dissolve_shapefile_level",
+        return_value=gpd.GeoDataFrame(
+            {
+                "label": ["a", "b", "c"],
+                "geometry": [
+                    shapely.box(-6, -5, 0, 5),
+                    shapely.box(0, -5, 6, 0),
+                    shapely.box(3.1, 3.1, 3.3, 3.3),
+                ],
+            },
+            crs="EPSG:4326",
+        ),
+    )
+    rasterize = mocker.spy(data_transformations, "rasterize")
+    for grid in (
+        _level_grid(np.arange(9.5, -10, -1.0), np.arange(-9.5, 10, 1.0)),
+        _level_grid(np.arange(4.5, -1, -1.0), np.arange(-2.5, 3, 1.0)),
+        _level_grid(np.arange(-4.5, 5, 1.0), np.arange(-179.5, -170, 1.0)),
+    ):
+        labels, raster = level_label_raster(SelectionLevel.COUNTRIES, grid)
+        assert labels == ["a", "b", "c"]
+        lat = grid["latitude"].values[:, np.newaxis]
+        lon = grid["longitude"].values
+        expected = np.select(
+            [
+                (lon > -6) & (lon < 0) & (np.abs(lat) < 5),
+                (lon > 0) & (lon < 6) & (lat > -5) & (lat < 0),
+                # "c" contains no cell center, it gets the cell it touches
+                (lon == 3.5) & (lat == 3.5),
+            ],
+            [0, 1, 2],
+            -1,
+        )
+        assert (raster == expected).all()
+    # Grids cropped from the same global grid share a single raster
+    dissolve.assert_called_once()
+    assert rasterize.call_args[1]["out_shape"] == (180, 360)
+    # Irregular grids are rasterized as they are
+    grid = _level_grid(np.array([-4.5, 0.5, 1.5]), np.arange(-2.5, 3, 1.0))
+    labels, raster = level_label_raster(SelectionLevel.COUNTRIES, grid)
+    assert rasterize.call_args[1]["out_shape"] == (3, 6)
+    assert raster.shape == (3, 6)
+
+
+def test_aggregate_selection(mocker):
+    dataset = _grid_dataset()
+    dataset["v"][0, 0, 0] = np.nan
+    level = gpd.GeoDataFrame(
+        {
+            "label": ["a", "b", "c"],
+            "geometry": [
+                shapely.box(-6, -5, 0, 5),
+                shapely.box(0, -5, 6, 0),
+                shapely.box(3.1, 3.1, 3.3, 3.3),
+            ],
+        },
+        crs="EPSG:4326",
+    )
+    mocked_label_raster = mocker.patch.object(
+        data_transformations,
+        "level_label_raster",
+        return_value=(
+            ["a", "b", "c"],
+            np.where(
+                dataset["longitude"].values < 0,
+                0,
+                np.where(dataset["latitude"].values[:, np.newaxis] < 0, 1, -1),
+            ),
+        ),
+    )
+    mocker.patch.object(data_transformations, "load_mask", return_value=None)
+    mocker.patch.object(data_transformations, "save_mask")
+    selection = EntitySelection(
+        dataframe=level.iloc[[2, 1, 0]], level=SelectionLevel.COUNTRIES
+    )
+    res = aggregate_selection(dataset, selection)
+    mocked_label_raster.assert_called_once()
+    assert res["v"].dims == ("label", "time")
+    assert res["label"].values.tolist() == ["c", "b", "a"]
+    west = dataset["v"].where(dataset["longitude"] < 0)
+    south_east = dataset["v"].where(
+        (dataset["longitude"] > 0) & (dataset["latitude"] < 0)
+    )
+    assert np.allclose(res["v"].sel(label="a"), west.mean(["latitude", "longitude"]))
+    assert np.allclose(
+        res["v"].sel(label="b"), south_east.mean(["latitude", "longitude"])
+    )
+    # "c" has no cell of its own
+    assert res["v"].sel(label="c").isnull().all()
+    area = xr.full_like(dataset["v"].isel(time=0), 2.0)
+    res = aggregate_selection(
+        dataset["v"].chunk({"time": 1}), selection, how="sum", weights=area
+    )
+    assert np.allclose(res.sel(label="a"), 2 * west.sum(["latitude", "longitude"]))
+    assert (res.sel(label="c") == 0).all()
+    res = aggregate_selection(dataset, _selection())
+    assert np.allclose(
+        res["v"],
+        aggregate_regions(dataset, regions_coverage(dataset, _selection()))["v"],
+    )
+
+
+@pytest.mark.parametrize("how", ["mean", "sum"])
+def test_selection_vs_polygons(mocker, tmp_path, how):
+    mocker.patch(
+        "atmospheric_explorer.api.data_interface.masks_cache.masks_folder",
+        str(tmp_path / "masks"),
+    )
+    # Each cell touched by an entity contains its center or no center at all,
+    # so the label raster assigns the same cells as the polygons
+    level = gpd.GeoDataFrame(
+        {
+            "label": ["a", "b", "c"],
+            "geometry": [
+                shapely.box(-5.9, -4.9, -0.1, 4.9),
+                shapely.Polygon([(0.1, -0.1), (5.9, -0.1), (5.9, -4.9)]),
+                shapely.box(3.1, 3.1, 3.3, 3.3),
+            ],
+        },
+        crs="EPSG:4326",
+    )
+    mocker.patch.object(
+        data_transformations, "dissolve_shapefile_level", return_value=level
+    )
+    dataset = _grid_dataset()
+    dataset["v"][0, 0, 0] = np.nan
+    selection = EntitySelection(dataframe=level, level=SelectionLevel.COUNTRIES)
+    res = aggregate_selection(dataset, selection, how=how, weights="cos_lat")
+    expected = aggregate_regions(
+        dataset, regions_coverage(dataset, selection), how=how, weights="cos_lat"
+    )
+    assert res["label"].values.tolist() == ["a", "b", "c"]
+    assert np.allclose(res["v"], expected["v"])
@@ -5,10 +5,37 @@
 # pylint: disable=unused-argument
 import os
 
-from atmospheric_explorer.api.os_manager import get_local_folder
+import pytest
+
+from atmospheric_explorer.api.os_manager import get_local_folder, temporary_path
 
 
 def test_get_local_folder():
     root_folder = os.getenv("LOCALAPPDATA") or os.getenv("HOME") or "."
     local_folder = get_local_folder()
     assert root_folder in local_folder
+
+
+def test_temporary_path(tmp_path):
+    path = str(tmp_path / "data" / "file.nc")
+    with temporary_path(path) as temp_path_1, temporary_path(path) as temp_path_2:
+        assert temp_path_1 != temp_path_2
+        assert os.path.dirname(temp_path_1) == os.path.dirname(path)
+        with open(temp_path_1, "w", encoding="utf-8") as file:
+            file.write("first")
+        with open(temp_path_2, "w", encoding="utf-8") as file:
+            file.write("second")
+    with open(path, encoding="utf-8") as file:
+        assert file.read() == "first"
+    assert os.listdir(tmp_path / "data") == ["file.nc"]
+
+
+def test_temporary_path_error(tmp_path):
+    path = str(tmp_path / "store.zarr")
+    with pytest.raises(ValueError):
+        with temporary_path(path, directory=True) as temp_path:
+            assert os.path.isdir(temp_path)
+            with open(os.path.join(temp_path, "chunk"), "w", encoding="utf-8"):
+                pass
+            raise ValueError
+    assert not os.listdir(tmp_path)
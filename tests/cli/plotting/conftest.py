@@ -0,0 +1,10 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def mocked_export(mocker):
+    """Plot commands are tested without rendering images."""
+    return mocker.patch("atmospheric_explorer.cli.plotting.utils.export_images")
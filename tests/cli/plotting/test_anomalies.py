@@ -109,3 +109,36 @@ def test_anomalies_entities_nolevel(mocker):
             ],
             catch_exceptions=False,
         )
+
+
+def test_anomalies_output_files(mocker):
+    mocked_anomalies = mocker.patch(
+        "atmospheric_explorer.cli.plotting.anomalies.eac4_anomalies_plot"
+    )
+    mocked_save = mocker.patch(
+        "atmospheric_explorer.cli.plotting.anomalies.save_images"
+    )
+    runner = CliRunner()
+    runner.invoke(
+        main,
+        [
+            "plot",
+            "anomalies",
+            "--data-variable",
+            "total_column_ozone",
+            "--dates-range",
+            "2021-01-01/2021-04-01",
+            "-t",
+            "00:00",
+            "--title",
+            "Test",
+            "--output-file",
+            "test.png",
+            "--output-file",
+            "test.svg",
+        ],
+        catch_exceptions=False,
+    )
+    mocked_save.assert_called_once_with(
+        mocked_anomalies.return_value, ("test.png", "test.svg"), None, None, 1
+    )
@@ -0,0 +1,53 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+
+from click.testing import CliRunner
+
+from atmospheric_explorer.cli.main import main
+
+COMMANDS = """\
+# Ozone plots
+anomalies -v total_column_ozone -r 2021-01-01/2021-04-01 -t 00:00 --title 'Ozone anomalies' \
+--output-file anomalies.png --output-file anomalies.svg
+
+hovmoeller -v total_column_ozone -r 2021-01-01/2021-04-01 --time-value 00:00 --title Test \
+--output-file hovmoeller.png
+"""
+
+
+def test_batch(mocker, tmp_path, mocked_export):
+    mocked_anomalies = mocker.patch(
+        "atmospheric_explorer.cli.plotting.anomalies.eac4_anomalies_plot"
+    )
+    mocked_hovm = mocker.patch(
+        "atmospheric_explorer.cli.plotting.hovmoeller.eac4_hovmoeller_plot"
+    )
+    commands_file = tmp_path / "commands.txt"
+    commands_file.write_text(COMMANDS.replace("\\\n", ""), encoding="utf-8")
+    runner = CliRunner()
+    result = runner.invoke(
+        main, ["plot", "batch", str(commands_file)], catch_exceptions=False
+    )
+    assert result.exit_code == 0
+    mocked_anomalies.assert_called_once()
+    assert mocked_anomalies.call_args.kwargs["title"] == "Ozone anomalies"
+    mocked_hovm.assert_called_once()
+    assert [call.args[0] for call in mocked_export.call_args_list] == [
+        [
+            (mocked_anomalies.return_value, "anomalies.png"),
+            (mocked_anomalies.return_value, "anomalies.svg"),
+        ],
+        [(mocked_hovm.return_value, "hovmoeller.png")],
+    ]
+
+
+def test_batch_nested(tmp_path, mocked_export):
+    commands_file = tmp_path / "commands.txt"
+    commands_file.write_text(f"batch {commands_file}\n", encoding="utf-8")
+    runner = CliRunner()
+    result = runner.invoke(main, ["plot", "batch", str(commands_file)])
+    assert result.exit_code == 2
+    assert "cannot be nested" in result.output
+    mocked_export.assert_not_called()
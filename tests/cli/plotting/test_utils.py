@@ -0,0 +1,30 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=protected-access
+
+from atmospheric_explorer.cli.plotting.utils import comma_separated_list, save_images
+
+
+def test_comma_separated_list():
+    assert comma_separated_list(None, None, "Italy,Spain") == ["Italy", "Spain"]
+    assert comma_separated_list(None, None, "") == []
+
+
+def test_save_images_single(mocker, mocked_export):
+    fig = mocker.MagicMock()
+    fig.layout = {"width": 800, "height": 600}
+    save_images(fig, ("plot.svg",), None, 400, 2)
+    mocked_export.assert_called_once_with(
+        [(fig, "plot.svg")], width=800, height=400, scale=2
+    )
+    fig.write_image.assert_not_called()
+
+
+def test_save_images_multiple(mocker, mocked_export):
+    fig = mocker.MagicMock()
+    fig.layout = {"width": 800, "height": 600}
+    save_images(fig, ("plot.png", "plot.pdf"), 1000, None, 1)
+    mocked_export.assert_called_once_with(
+        [(fig, "plot.png"), (fig, "plot.pdf")], width=1000, height=600, scale=1
+    )